@@ -1,38 +1,148 @@
 """
 1. Runs the business logic
+
+   COUNTRY=mx python main.py    # one country, in this process
+   python main.py               # every country, see run_all()
 """
 
-import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+import json, os, resource, time, traceback
 from scripts.driver_seed_generator import driver_seed
-from scripts.run_etl import PIPELINES           
+from pipelines.instrumentation import REPORT_DIR, RunReport
+from pipelines.registry import COUNTRY_CODES, get_pipeline
+from services import rate_limit
 from services.compute_distance import enrich_country
 from scripts.trip_seed_generator import generate_trip_logs
 from services.driver_matching import match_trips
 from services.distance_matrix import build_matrices
+from services.stop_tables import build_stop_tables
 
-def run_single(country: str):
-     # 1) Build / refresh the driver sample 
-    driver_seed()
+def run_single(country: str, seed_drivers: bool = True, report: RunReport | None = None):
+    report = report or RunReport(country)
 
-    # 2) Run filtering logic for truck stops (preprocessing) 
-    PIPELINES[country].run()
+    # 1) Build / refresh the driver sample (run_all does this once up front)
+    if seed_drivers:
+        with report.span("driver_seed"):
+            driver_seed()
 
-    # 3) Compute distances calling ORS wrapper 
-    if os.getenv("ORS_API_KEY"):
+    # 2) Run filtering logic for truck stops (preprocessing)
+    with report.span("etl"):
+        get_pipeline(country).run()
+
+    # 3) Compute distances: ORS, or the offline road graph without a key
+    with report.span("enrich"):
         enrich_country(country)
-    
-    # 4) Compute distance matrix
-    build_matrices(country, agg="median", fill="none")
 
-    # 5) Build trip logs sample
-    generate_trip_logs(country)
+    # 4) Offline stop × stop tables from the road graph (contraction hierarchy)
+    if os.getenv("STOP_TABLES", "1") != "0":
+        with report.span("stop_tables"):
+            build_stop_tables(country)
+
+    # 5) Compute distance matrix
+    with report.span("matrices"):
+        build_matrices(country, agg="median", fill="none")
+
+    # 6) Build trip logs sample
+    with report.span("trip_logs"):
+        generate_trip_logs(country)
+
+    # 7) Match drivers to trips
+    with report.span("matching"):
+        match_trips(country)
+    return report
+
+
+# ---------------------------------------------------------------------
+# Multi-country scheduler
+# • Every country is an independent job in its own process; they only
+#   share data/processed/sample_drivers.csv, which is built once before
+#   any job starts.
+# • Limits (env):
+#     RUN_WORKERS        – countries running at once (default: all of
+#                          them, capped at the CPU count)
+#     ETL_WORKERS        – per-country city processes; when unset each
+#                          job gets an equal share of the CPUs
+#     RUN_MEM_LIMIT_MB   – address-space cap per country job (RLIMIT_AS);
+#                          a job that hits it fails alone
+#     ORS_MAX_RPM        – ONE request budget shared by every job
+# • A failed country doesn't stop the others; the summary records it.
+# • Summary → data/processed/run_reports/run_all_<ts>.json
+# ---------------------------------------------------------------------
+def _init_job(limiter, etl_workers: int, mem_limit_mb: int):
+    rate_limit.install(limiter)
+    os.environ.setdefault("ETL_WORKERS", str(etl_workers))
+    if mem_limit_mb:
+        cap = mem_limit_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+
+
+def _run_job(country: str) -> dict:
+    report = RunReport(country)
+    t0 = time.perf_counter()
+    status, error, stage, trace = "ok", None, None, None
+    try:
+        run_single(country, seed_drivers=False, report=report)
+    except Exception as e:   # MemoryError included – report it, keep going
+        # a span is recorded as it closes, so the failed stage is the last one
+        stage = report.spans[-1]["name"] if report.spans else None
+        status, error, trace = "failed", f"{type(e).__name__}: {e}", traceback.format_exc()
+        print(f"[run_all] {country}: failed in stage {stage}\n{trace}", flush=True)
+    return {
+        "country": country,
+        "status": status,
+        "error": error,
+        "failed_stage": stage,
+        "traceback": trace,
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "stages": {s["name"]: s["wall_s"] for s in report.spans},
+        "peak_rss_mb": max((s["peak_rss_mb"] for s in report.spans
+                            if s["peak_rss_mb"] is not None), default=None),
+    }
+
+
+def run_all(countries=None):
+    countries = list(countries or COUNTRY_CODES)
+    cpus = os.cpu_count() or 1
+    n_jobs = min(int(os.getenv("RUN_WORKERS", "0")) or cpus, len(countries))
+    mem_limit_mb = int(os.getenv("RUN_MEM_LIMIT_MB", "0"))
+    limiter = rate_limit.from_env()
+
+    started = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    driver_seed()
+    seed_s = time.perf_counter() - t0
 
-    # 6) Match drivers to trips
-    match_trips(country)
+    print(f"[run_all] {len(countries)} countries on {n_jobs} workers", flush=True)
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_job,
+                             initargs=(limiter, max(1, cpus // n_jobs), mem_limit_mb)) as pool:
+        futures = {pool.submit(_run_job, cc): cc for cc in countries}
+        for fut in as_completed(futures):
+            cc = futures[fut]
+            try:
+                jobs[cc] = fut.result()
+            except BrokenProcessPool as e:   # worker killed outright (e.g. OOM killer)
+                jobs[cc] = {"country": cc, "status": "failed",
+                            "error": f"BrokenProcessPool: {e}"}
+            print(f"[run_all] {cc}: {jobs[cc]['status']}"
+                  f" ({jobs[cc].get('wall_s', '?')}s)", flush=True)
 
-def run_all():
-    for cc in PIPELINES.keys():
-        run_single(cc)
+    summary = {
+        "started_at": started.isoformat(timespec="seconds"),
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "driver_seed_s": round(seed_s, 3),
+        "workers": n_jobs,
+        "mem_limit_mb": mem_limit_mb or None,
+        "ors_max_rpm": round(60.0 / limiter.interval, 3),
+        "countries": [jobs[cc] for cc in countries],
+    }
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    out = REPORT_DIR / f"run_all_{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    out.write_text(json.dumps(summary, indent=2))
+    print(f"[run_all] summary → {out}", flush=True)
+    return summary
 
 if __name__ == "__main__":
     country = os.getenv("COUNTRY")
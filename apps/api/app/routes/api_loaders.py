@@ -2,19 +2,24 @@ from __future__ import annotations
 
 import os
 from functools import lru_cache
-from pathlib import Path
 from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import requests
 from fastapi import HTTPException
 from haversine import haversine  
-from scripts.run_etl import PIPELINES
+from pipelines.artifacts import read_bookings
+from pipelines.registry import COUNTRY_CODES   # codes only – no geo stack
+from pipelines.stop_matrix import StopMatrix, read_stop_matrix
 
-SUPPORTED: set[str] = set(PIPELINES.keys())
+from .geocode_cache import geocode_cache, geocode_key
+from .http_session import http_session, timeouts
+from .local_router import local_router
+from .openrouteservice_wrapper import OpenRouteServiceWrapper
+from .route_cache import route_cache
 
-# File locations
-DATA_DIR = Path("data/processed")
+SUPPORTED: set[str] = set(COUNTRY_CODES)
 
 # ---------------------------------------------------------------------------
 # Bookings table loaders / candidate selectors
@@ -22,20 +27,13 @@ DATA_DIR = Path("data/processed")
 @lru_cache(maxsize=8)
 def load_bookings_for_matching(cc: str) -> pd.DataFrame:
     """
-    Load data/processed/{cc}.csv once and normalize useful columns.
-    Expected (at least): pickup_lat,pickup_lon,dropoff_lat,dropoff_lon
-    Optional (nice-to-have for matrix addressing): pickup_stop_id,dropoff_stop_id
+    Load data/processed/{cc}.parquet once, projecting to the columns used
+    for stop snapping and matrix addressing (stop IDs are already strings).
     """
-    cc = cc.lower()
-    fp = DATA_DIR / f"{cc}.csv"
-    if not fp.exists():
-        raise FileNotFoundError(f"Missing bookings file: {fp}")
-    df = pd.read_csv(fp)
-    # normalize stop IDs if present 
-    for col in ("pickup_stop_id", "dropoff_stop_id"):
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-    return df
+    return read_bookings(cc.lower(), columns=[
+        "pickup_stop_id", "dropoff_stop_id",
+        "pickup_lat", "pickup_lon", "dropoff_lat", "dropoff_lon",
+    ])
 
 
 def pickup_candidates(df: pd.DataFrame, lat: float, lon: float,
@@ -69,43 +67,30 @@ def dropoff_candidates(df: pd.DataFrame, lat: float, lon: float,
 # Load distance matrix 
 # ---------------------------------------------------------------------------
 @lru_cache(maxsize=8)
-def load_matrices(cc: str) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+def load_matrices(cc: str) -> Optional[StopMatrix]:
     """
-    Load distance & duration matrices for a country (if present).
-      data/processed/{cc}_distance_matrix.csv  (meters)
-      data/processed/{cc}_duration_matrix.csv  (seconds)
-    Returns (dist_df, dur_df) or (None, None) if either missing.
+    Load the country's sparse stop × stop matrix (if present):
+      data/processed/{cc}_matrix.npz  (meters / seconds per known cell)
+    Returns None before build_matrices() has written it.
     """
-    cc = cc.lower()
-    dist_p = DATA_DIR / f"{cc}_distance_matrix.csv"
-    dur_p = DATA_DIR / f"{cc}_duration_matrix.csv"
-    if not dist_p.exists() or not dur_p.exists():
-        return None, None
-
-    dist = pd.read_csv(dist_p, index_col=0)
-    dur = pd.read_csv(dur_p, index_col=0)
-    # matrices are labeled by stop_id strings
-    dist.index = dist.index.astype(str); dist.columns = dist.columns.astype(str)
-    dur.index = dur.index.astype(str);   dur.columns = dur.columns.astype(str)
-    return dist, dur
+    return read_stop_matrix(cc.lower())
 
 
 def matrix_from_candidate_ids(
-    dist_df: Optional[pd.DataFrame],
-    dur_df: Optional[pd.DataFrame],
+    matrix: Optional[StopMatrix],
     pu_cands: pd.DataFrame,
     do_cands: pd.DataFrame
 ) -> Tuple[Optional[float], Optional[int], Optional[str], Optional[str]]:
     """
     Try all combinations of candidate pickup_stop_id × dropoff_stop_id to find a valid
-    distance/duration cell in the matrices.
+    distance/duration cell in the matrix.
 
     Returns:
       (distance_km, duration_min, chosen_pickup_stop_id, chosen_dropoff_stop_id)
     or:
       (None, None, None, None) if no valid cell exists or stop IDs are absent.
     """
-    if dist_df is None or dur_df is None:
+    if matrix is None:
         return None, None, None, None
     if "pickup_stop_id" not in pu_cands.columns or "dropoff_stop_id" not in do_cands.columns:
         return None, None, None, None
@@ -119,24 +104,48 @@ def matrix_from_candidate_ids(
         do_ids = do_cands.sort_values("_do_km")["dropoff_stop_id"].astype(str).unique().tolist()
     else:
         do_ids = do_cands["dropoff_stop_id"].astype(str).dropna().unique().tolist()
+    if not pu_ids or not do_ids:
+        return None, None, None, None
+
+    # every combination in one lookup, pickup-major like the preference order
+    pu_all = np.repeat(pu_ids, len(do_ids))
+    do_all = np.tile(do_ids, len(pu_ids))
+    d_val, t_val = matrix.lookup(pu_all, do_all)
+    valid = np.flatnonzero(~np.isnan(d_val) & ~np.isnan(t_val))
+    if not valid.size:
+        return None, None, None, None
+
+    k = valid[0]
+    d_km = round(float(d_val[k]) / 1000.0, 2)
+    t_min = int(round(float(t_val[k]) / 60.0))
+    return d_km, t_min, str(pu_all[k]), str(do_all[k])
 
-    for pu in pu_ids:
-        if pu not in dist_df.index:
-            continue
-        for do in do_ids:
-            if do not in dist_df.columns:
-                continue
-            try:
-                d_val = dist_df.at[pu, do]
-                t_val = dur_df.at[pu, do]
-            except KeyError:
-                continue
-            if pd.notna(d_val) and pd.notna(t_val):
-                d_km = round(float(d_val) / 1000.0, 2)
-                t_min = int(round(float(t_val) / 60.0))
-                return d_km, t_min, pu, do
 
-    return None, None, None, None
+def route_estimate(
+    start: Tuple[float, float], end: Tuple[float, float], cc: Optional[str] = None,
+    profile: str = "driving-hgv",
+) -> Tuple[Optional[float], Optional[int], Optional[str]]:
+    """
+    (d_km, t_min, source) for a (lon, lat) pair the matrices don't cover:
+    the persistent route cache, then – with ORS_API_KEY set – one
+    directions call (stored for next time), otherwise the country's
+    offline road graph. source is "ors_route" for an ORS answer (fresh
+    or cached) and "local_route" for the road graph; (None, None, None)
+    when none of them has a route.
+    """
+    source = "ors_route"
+    if os.getenv("ORS_API_KEY"):
+        # single attempt: a booking request shouldn't sit in retry backoff
+        res = OpenRouteServiceWrapper(profile=profile, retries=1).get_route(start, end)
+    else:
+        cache = route_cache()
+        res = cache.get(profile, start, end) if cache is not None else None
+        if res is None and cc:
+            res, source = local_router(cc).get_route(start, end), "local_route"
+
+    if not res or "error" in res or pd.isna(res["distance_m"]) or pd.isna(res["duration_s"]):
+        return None, None, None
+    return round(res["distance_m"] / 1000.0, 2), int(round(res["duration_s"] / 60.0)), source
 
 # ---------------------------------------------------------------------------
 # Geocoding (OpenRouteService)
@@ -156,13 +165,25 @@ def geocode(
       - proximity bias using a focus point
       - optional bounding box
 
+    Repeated lookups are answered from the geocode cache (see
+    geocode_cache.py); concurrent identical ones share one ORS call.
+
     Returns: (lat, lon)
     """
+    cache = geocode_cache()
+    if cache is None:
+        return _geocode_ors(country, address, focus, size, prefer_layers, bbox)
+    key = geocode_key(country, address, focus, size, prefer_layers, bbox)
+    return cache.resolve(key, lambda: _geocode_ors(country, address, focus, size, prefer_layers, bbox))
+
+
+def _geocode_ors(country, address, focus, size, prefer_layers, bbox) -> Tuple[float, float]:
     key = os.getenv("ORS_API_KEY")
     if not key:
         raise HTTPException(status_code=500, detail="ORS_API_KEY not set; cannot geocode")
 
-    url = "https://api.openrouteservice.org/geocode/search"
+    host = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org").rstrip("/")
+    url = f"{host}/geocode/search"
 
     params = {
         "api_key": key,
@@ -183,7 +204,7 @@ def geocode(
         params["boundary.rect.max_lat"] = max_lat
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_session().get(url, params=params, timeout=timeouts(10))
         resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
@@ -11,7 +11,7 @@ from haversine import haversine
 from .api_loaders import (
     SUPPORTED, geocode,
     load_bookings_for_matching, pickup_candidates, dropoff_candidates,
-    load_matrices, matrix_from_candidate_ids, build_stops, nearest_stop
+    load_matrices, matrix_from_candidate_ids, route_estimate, build_stops, nearest_stop
 )
 
 from ..services.driver_matching import match_trips
@@ -83,16 +83,18 @@ def book_and_match(body: MatchIn):
     else:
         do_cands = pd.DataFrame(columns=["dropoff_stop_id", "_do_km"])
 
-    # 3) Try matrix; else haversine fallback 
-    dist_df, dur_df = load_matrices(cc)
+    # 3) Try matrix; else a (cached) ORS or offline road-graph route; else haversine fallback
+    matrix = load_matrices(cc)
     d_km = t_min = None
     chosen_pu_stop = chosen_do_stop = None
 
-    d_res = matrix_from_candidate_ids(dist_df, dur_df, pu_cands, do_cands)
+    d_res = matrix_from_candidate_ids(matrix, pu_cands, do_cands)
     if d_res and d_res[0] is not None:
         d_km, t_min, chosen_pu_stop, chosen_do_stop = d_res
         source = "matrix"
     else:
+        d_km, t_min, source = route_estimate((pu_lon, pu_lat), (do_lon, do_lat), cc)
+    if d_km is None:
         d_km = round(haversine((pu_lat, pu_lon), (do_lat, do_lon)), 2)
         t_min = None
         source = "haversine"
@@ -0,0 +1,145 @@
+# ---------------------------------------------------------------------
+# Geocode cache for the booking API
+# • Key: normalized address text (case, accents, punctuation and spacing
+#   folded), country, size, preferred layers, and the focus point / bbox
+#   rounded to FOCUS_DECIMALS (2 dp ≈ 1 km) – "Plaza Satélite" and
+#   "plaza  satelite," from the same area are one lookup.
+# • Two tiers: an in-process LRU (GEOCODE_LRU_SIZE entries, answers in
+#   microseconds) in front of a SQLite table shared by every worker
+#   (same WAL setup as route_cache.py), rows expire after
+#   GEOCODE_CACHE_TTL_DAYS.
+# • Coalescing: concurrent misses on the same key wait for the one
+#   upstream call already in flight instead of each spending quota;
+#   its error, if any, is raised in every waiter. Errors are not cached.
+#
+#   GEOCODE_CACHE_PATH  (default data/cache/geocode.sqlite)
+#   GEOCODE_CACHE=0     disables the cache entirely
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+import os, re, sqlite3, threading, time, unicodedata
+
+from .route_cache import connect
+
+FOCUS_DECIMALS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    key     TEXT PRIMARY KEY,
+    lat     REAL NOT NULL,
+    lon     REAL NOT NULL,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_address(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^\w#]+", " ", text).split())
+
+
+def geocode_key(country: str, address: str, focus=None, size: int = 5,
+                prefer_layers=None, bbox=None) -> str:
+    rnd = lambda xs: ",".join(f"{float(v):.{FOCUS_DECIMALS}f}" for v in xs) if xs else ""
+    return "|".join([
+        country.strip().upper(), normalize_address(address), str(int(size)),
+        ",".join(sorted(prefer_layers or [])), rnd(focus), rnd(bbox),
+    ])
+
+
+class GeocodeCache:
+
+    def __init__(self, path: Path | str | None, lru_size: int = 4096, ttl_days: float = 90):
+        self.path = Path(path) if path else None      # None = memory only
+        self.lru_size = lru_size
+        self.ttl_s = ttl_days * 86_400
+        self.stats = {"hits": 0, "store_hits": 0, "misses": 0, "coalesced": 0}
+        self._lru: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn, self._pid = connect(self.path, _SCHEMA), os.getpid()
+        return self._conn
+
+    def _remember(self, key: str, latlon: tuple[float, float]) -> None:
+        self._lru[key] = latlon
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _load(self, key: str) -> tuple[float, float] | None:
+        if self.path is None:
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT lat, lon, created FROM geocodes WHERE key=?", (key,)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl_s:
+            return None
+        return row[0], row[1]
+
+    def _store(self, key: str, latlon: tuple[float, float]) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO geocodes VALUES (?,?,?,?)",
+                               (key, *latlon, time.time()))
+
+    def resolve(self, key: str, fetch) -> tuple[float, float]:
+        """Cached (lat, lon) for `key`, else fetch() – once, however many callers ask."""
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._lru[key]
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return fut.result()
+
+        try:
+            latlon = self._load(key)
+            if latlon is not None:
+                self.stats["store_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                latlon = tuple(map(float, fetch()))
+                self._store(key, latlon)
+            with self._lock:
+                self._remember(key, latlon)
+            fut.set_result(latlon)
+            return latlon
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_default: GeocodeCache | None = None
+
+
+def geocode_cache() -> GeocodeCache | None:
+    """Process-wide cache configured from env, or None when GEOCODE_CACHE=0."""
+    global _default
+    if os.getenv("GEOCODE_CACHE", "1") == "0":
+        return None
+    if _default is None:
+        _default = GeocodeCache(
+            os.getenv("GEOCODE_CACHE_PATH", "data/cache/geocode.sqlite"),
+            lru_size=int(os.getenv("GEOCODE_LRU_SIZE", "4096")),
+            ttl_days=float(os.getenv("GEOCODE_CACHE_TTL_DAYS", "90")),
+        )
+    return _default
@@ -0,0 +1,54 @@
+# ---------------------------------------------------------------------
+# Pooled keep-alive HTTP client for ORS (routing + geocoding)
+# • One requests.Session per process: connections are reused, so only
+#   the first call to a host pays the TCP + TLS handshake instead of
+#   every booking request.
+# • HTTPAdapter pools: ORS_HTTP_HOSTS hosts kept, up to ORS_HTTP_POOL
+#   open connections per host; pool_block=True makes that a hard
+#   per-host cap (extra threads wait for a free connection rather than
+#   opening throwaway ones). Keep it ≥ ORS_CONCURRENCY.
+# • Timeouts are split: ORS_CONNECT_TIMEOUT for the handshake (fail fast
+#   on an unreachable host) and a per-call read timeout for the answer.
+# • No transport-level retries – the wrapper / route_engine decide what
+#   to retry and how to pace it.
+# • The session is rebuilt after fork (pooled sockets must not be
+#   shared between processes).
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+import os, threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_HOSTS = int(os.getenv("ORS_HTTP_HOSTS", "4"))
+POOL_MAXSIZE = int(os.getenv("ORS_HTTP_POOL", "16"))
+CONNECT_TIMEOUT_S = float(os.getenv("ORS_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT_S = float(os.getenv("ORS_READ_TIMEOUT", "10"))
+
+_session: requests.Session | None = None
+_pid = None
+_lock = threading.Lock()
+
+
+def make_session(pool_hosts: int = POOL_HOSTS, pool_maxsize: int = POOL_MAXSIZE) -> requests.Session:
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize,
+                          max_retries=0, pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def http_session() -> requests.Session:
+    """The process-wide pooled session."""
+    global _session, _pid
+    with _lock:
+        if _session is None or _pid != os.getpid():
+            _session, _pid = make_session(), os.getpid()
+        return _session
+
+
+def timeouts(read_s: float | None = None) -> tuple[float, float]:
+    """(connect, read) timeout pair for requests."""
+    return CONNECT_TIMEOUT_S, READ_TIMEOUT_S if read_s is None else float(read_s)
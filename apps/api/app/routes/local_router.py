@@ -0,0 +1,92 @@
+# ---------------------------------------------------------------------
+# Offline stand-in for OpenRouteServiceWrapper
+# • Same calls – get_route / route_once / matrix_once / get_matrix, same
+#   {"distance_m", "duration_s"} | {"error"} results – answered from the
+#   city road graphs in pipelines/road_graph.py: no network, no API key,
+#   no rate limit.
+# • Only loads the tmp/<cc>/<city>_graph.npz files the ETL built, so the
+#   API needs numpy / scipy but no geospatial stack.
+# • A query goes to the first loaded city graph whose bounds hold both
+#   points; points more than ROUTER_SNAP_M from its network get an error,
+#   like ORS's "could not find routable point".
+# • Matrices are one Dijkstra per distinct source, so there is no block
+#   size limit; enrichment asks for the whole pickup × dropoff table.
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from pipelines.road_graph import RoadGraph, read_city_graph
+
+LOCAL_PROFILE = "local-hgv"
+
+
+class LocalRouter:
+
+    def __init__(self, graphs: list[RoadGraph]):
+        self.graphs = [g for g in graphs if g is not None and len(g.routable)]
+        self.profile = LOCAL_PROFILE
+        self.cache = None   # answers are cheaper than a cache lookup
+        self._bounds = [g.bounds() for g in self.graphs]
+
+    @classmethod
+    def for_cities(cls, cc: str, cities=None, root: Path = Path("tmp")) -> "LocalRouter":
+        """Graphs of the given cities of `cc` (default: every city the ETL built one for)."""
+        if cities is None:
+            cities = sorted(p.name[:-len("_graph.npz")]
+                            for p in (Path(root) / cc).glob("*_graph.npz"))
+        return cls([read_city_graph(cc, city, root) for city in cities])
+
+    def _graph_for(self, points) -> RoadGraph | None:
+        lon, lat = np.asarray(points, dtype=float).reshape(-1, 2).T
+        for g, (w, s, e, n) in zip(self.graphs, self._bounds):
+            if ((lon >= w) & (lon <= e) & (lat >= s) & (lat <= n)).all():
+                return g
+        return None
+
+    def matrix(self, sources, destinations) -> dict:
+        """{'distance_m', 'duration_s'} as S × D arrays (NaN = no route) or {'error'}."""
+        graph = self._graph_for([*sources, *destinations])
+        if graph is None:
+            return {"error": "no road graph covers these points"}
+        src = np.asarray(sources, dtype=float).reshape(-1, 2)
+        dst = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        s_node, _ = graph.snap(src[:, 0], src[:, 1])
+        d_node, _ = graph.snap(dst[:, 0], dst[:, 1])
+        length, time_s = graph.one_to_many(s_node, d_node)
+        return {"distance_m": length, "duration_s": time_s}
+
+    # -----------------------------------------------------------------
+    # OpenRouteServiceWrapper interface
+    # -----------------------------------------------------------------
+    def get_route(self, start: tuple[float, float], end: tuple[float, float]) -> dict:
+        res = self.matrix([start], [end])
+        if "error" in res:
+            return res
+        dist, dur = res["distance_m"][0, 0], res["duration_s"][0, 0]
+        if np.isnan(dist):
+            return {"error": "no routable path between these points"}
+        return {"distance_m": float(dist), "duration_s": float(dur)}
+
+    def route_once(self, start, end) -> tuple[int, dict, None]:
+        res = self.get_route(start, end)
+        return (404 if "error" in res else 200), res, None
+
+    def get_matrix(self, sources, destinations) -> dict:
+        res = self.matrix(sources, destinations)
+        if "error" in res:
+            return res
+        return {k: v.tolist() for k, v in res.items()}
+
+    def matrix_once(self, sources, destinations) -> tuple[int, dict, None]:
+        res = self.get_matrix(sources, destinations)
+        return (404 if "error" in res else 200), res, None
+
+
+@lru_cache(maxsize=8)
+def local_router(cc: str) -> LocalRouter:
+    """Every city graph of a country, loaded once per process."""
+    return LocalRouter.for_cities(cc)
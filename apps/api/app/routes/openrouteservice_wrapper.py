@@ -2,6 +2,12 @@ from __future__ import annotations
 import os, requests, time
 from dotenv import load_dotenv 
 
+from .http_session import http_session, timeouts
+from .route_cache import RouteCache, route_cache
+
+# sources × destinations cells the hosted matrix endpoint accepts per call
+MATRIX_MAX_ELEMENTS = int(os.getenv("ORS_MATRIX_MAX_ELEMENTS", "3500"))
+
 
 class OpenRouteServiceWrapper:
 
@@ -12,7 +18,9 @@ class OpenRouteServiceWrapper:
         api_key: str | None = None,
         profile: str = "driving-hgv",   # heavy‑goods; good default for trucks
         retries: int = 3,
-        timeout: int = 10,
+        timeout: float | None = None,
+        cache: RouteCache | None | bool = True,
+        session: requests.Session | None = None,
     ):
         self.api_key = api_key or os.getenv("ORS_API_KEY", "")
         if not self.api_key:
@@ -21,8 +29,141 @@ class OpenRouteServiceWrapper:
             )
         self.profile = profile
         self.retries = retries
-        self.timeout = timeout
-        self.base_url = f"https://api.openrouteservice.org/v2/directions/{self.profile}"
+        # (connect, read): read defaults to ORS_READ_TIMEOUT, see http_session.py
+        self.timeout = timeouts(timeout)
+        # pooled keep-alive connections, shared by every wrapper in the process
+        self.session = session or http_session()
+        # get_route() reads through the persistent route cache (True = the
+        # env-configured one, see route_cache.py; False/None = no cache)
+        self.cache = route_cache() if cache is True else (cache if cache is not False else None)
+        # ORS_BASE_URL points at a self-hosted ORS or scripts/mock_ors.py
+        self.host = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org").rstrip("/")
+        self.base_url = f"{self.host}/v2/directions/{self.profile}"
+        self.matrix_url = f"{self.host}/v2/matrix/{self.profile}"
+
+    @staticmethod
+    def parse_route(data) -> dict[str, float] | dict[str, str]:
+        """ORS directions payload (JSON or GeoJSON flavour) → distance/duration."""
+        summary, segments = {}, []
+        if isinstance(data, dict) and data.get("routes"):
+            route = data["routes"][0] or {}
+            summary  = route.get("summary")  or {}
+            segments = route.get("segments") or []
+        elif isinstance(data, dict) and data.get("features"):
+            props    = (data["features"][0] or {}).get("properties") or {}
+            summary  = props.get("summary")  or {}
+            segments = props.get("segments") or []
+
+        dist = summary.get("distance")
+        dur  = summary.get("duration")
+
+        # Fallback: sum segment distances/durations if summary is incomplete
+        if segments:
+            if dist is None:
+                dist = sum((s or {}).get("distance", 0.0) for s in segments)
+            if dur is None:
+                dur = sum((s or {}).get("duration", 0.0) for s in segments)
+
+        # If still missing, *don’t* raise—signal the caller to leave blanks
+        if dist is None or dur is None:
+            return {"error": "missing distance/duration in ORS payload"}
+
+        return {"distance_m": float(dist), "duration_s": float(dur)}
+
+    def _post_once(self, url: str, body: dict, parse) -> tuple[int, dict, float | None]:
+        headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
+        try:
+            r = self.session.post(url, headers=headers, json=body, timeout=self.timeout)
+        except requests.RequestException as exc:
+            return 0, {"error": f"Request failed: {exc}"}, None
+
+        if r.status_code == 200:
+            return 200, parse(r.json()), None
+
+        retry_after = r.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        return r.status_code, {"error": f"{r.status_code}: {r.text}"}, retry_after
+
+    def _with_retries(self, once, *args) -> dict:
+        for attempt in range(self.retries):
+            status, result, _ = once(*args)
+            if status == 200:
+                return result
+
+            # Retry on connection errors, 429 or transient 5xx
+            if status == 0 or status == 429 or 500 <= status < 600:
+                if attempt < self.retries - 1:
+                    time.sleep(2 if status == 0 else 2 * (attempt + 1))  # 2s, 4s, …
+                    continue
+
+            # Non-retryable or retries exhausted
+            return result
+
+    def route_once(
+        self, start: tuple[float, float], end: tuple[float, float]
+    ) -> tuple[int, dict, float | None]:
+        """
+        One directions request, no retries / sleeping – callers that pace
+        themselves (the async enrichment engine) decide what to do next.
+
+        Returns (status_code, result, retry_after_s); status_code is 0 when
+        the request itself failed, retry_after_s comes from a 429/503's
+        Retry-After header if the server sent one.
+        """
+        return self._post_once(self.base_url, {"coordinates": [start, end]}, self.parse_route)
+
+    @staticmethod
+    def parse_matrix(data) -> dict[str, list[list[float]]] | dict[str, str]:
+        """ORS matrix payload → {'distance_m': rows, 'duration_s': rows}, NaN = no route."""
+        if not isinstance(data, dict) or "distances" not in data or "durations" not in data:
+            return {"error": "missing distances/durations in ORS matrix payload"}
+        nan = float("nan")
+        as_rows = lambda m: [[nan if v is None else float(v) for v in row] for row in m]
+        return {"distance_m": as_rows(data["distances"]), "duration_s": as_rows(data["durations"])}
+
+    def matrix_once(
+        self, sources: list[tuple[float, float]], destinations: list[tuple[float, float]]
+    ) -> tuple[int, dict, float | None]:
+        """
+        One /v2/matrix call for a sources × destinations block (lon, lat),
+        same contract as route_once(). The block must fit
+        MATRIX_MAX_ELEMENTS; get_matrix() does the splitting.
+        """
+        body = {
+            "locations": [*sources, *destinations],
+            "sources": list(range(len(sources))),
+            "destinations": list(range(len(sources), len(sources) + len(destinations))),
+            "metrics": ["distance", "duration"],
+            "units": "m",
+        }
+        return self._post_once(self.matrix_url, body, self.parse_matrix)
+
+    def get_matrix(
+        self, sources: list[tuple[float, float]], destinations: list[tuple[float, float]]
+    ) -> dict[str, list[list[float]]] | dict[str, str]:
+        """
+        Distances / durations for every source × destination (lon, lat).
+
+        Returns {'distance_m': S×D rows, 'duration_s': S×D rows} with NaN
+        where ORS found no route, or {'error': str} if any block failed.
+        Large requests are cut into blocks of ≤ MATRIX_MAX_ELEMENTS cells.
+        """
+        rows, cols = matrix_block_shape(len(sources), len(destinations))
+        nan = float("nan")
+        out = {k: [[nan] * len(destinations) for _ in sources] for k in ("distance_m", "duration_s")}
+        for r0 in range(0, len(sources), rows):
+            for c0 in range(0, len(destinations), cols):
+                block = self._with_retries(self.matrix_once,
+                                           sources[r0:r0 + rows], destinations[c0:c0 + cols])
+                if "error" in block:
+                    return block
+                for key, values in block.items():
+                    for i, row in enumerate(values):
+                        out[key][r0 + i][c0:c0 + len(row)] = row
+        return out
 
     def get_route(
         self, start: tuple[float, float], end: tuple[float, float]
@@ -37,52 +178,22 @@ class OpenRouteServiceWrapper:
         {'distance_m': float, 'duration_s': float}
         or {'error': str}
         """
-        headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
-        body = {"coordinates": [start, end]}
+        if self.cache is not None:
+            hit = self.cache.get(self.profile, start, end)
+            if hit is not None:
+                return hit
+        result = self._with_retries(self.route_once, start, end)
+        if self.cache is not None:
+            self.cache.put(self.profile, start, end, result)
+        return result
 
-        for attempt in range(self.retries):
-            try:
-                r = requests.post(self.base_url, headers=headers, json=body, timeout=self.timeout)
-                if r.status_code == 200:
-                    data = r.json()
-                    summary, segments = {}, []
-                    if isinstance(data, dict) and data.get("routes"):
-                        route = data["routes"][0] or {}
-                        summary  = route.get("summary")  or {}
-                        segments = route.get("segments") or []
-                    elif isinstance(data, dict) and data.get("features"):
-                        props    = (data["features"][0] or {}).get("properties") or {}
-                        summary  = props.get("summary")  or {}
-                        segments = props.get("segments") or []
-
-                    dist = summary.get("distance")
-                    dur  = summary.get("duration")
-
-                    # Fallback: sum segment distances/durations if summary is incomplete
-                    if segments:
-                        if dist is None:
-                            dist = sum((s or {}).get("distance", 0.0) for s in segments)
-                        if dur is None:
-                            dur = sum((s or {}).get("duration", 0.0) for s in segments)
-
-                    # If still missing, *don’t* raise—signal the caller to leave blanks
-                    if dist is None or dur is None:
-                        return {"error": "missing distance/duration in ORS payload"}
-
-                    return {"distance_m": float(dist), "duration_s": float(dur)}
-
-                # Retry on 429 or transient 5xx
-                if r.status_code == 429 or 500 <= r.status_code < 600:
-                    if attempt < self.retries - 1:
-                        time.sleep(2 * (attempt + 1))  # 2s, 4s, …
-                        continue
-
-                # Non-retryable or retries exhausted
-                return {"error": f"{r.status_code}: {r.text}"}
-
-            except requests.RequestException as exc:
-                if attempt < self.retries - 1:
-                    time.sleep(2)
-                    continue
-                return {"error": f"Request failed: {exc}"}
 
+def matrix_block_shape(n_sources: int, n_destinations: int,
+                       max_elements: int = MATRIX_MAX_ELEMENTS) -> tuple[int, int]:
+    """Largest rows × cols block (≤ max_elements cells) to tile an S × D matrix."""
+    side = max(1, int(max_elements ** 0.5))
+    if n_sources <= side:
+        return max(1, n_sources), max(1, min(n_destinations, max_elements // max(1, n_sources)))
+    if n_destinations <= side:
+        return max(1, min(n_sources, max_elements // max(1, n_destinations))), max(1, n_destinations)
+    return side, side
@@ -0,0 +1,197 @@
+# ---------------------------------------------------------------------
+# Persistent ORS route cache (SQLite)
+# • One row per (profile, start, end) with coordinates quantized to
+#   QUANT_DECIMALS (5 dp ≈ 1 m), so the same stop pair always hits no
+#   matter how its floats were round-tripped through CSV / parquet.
+# • Only answers are stored: a route, or NULL distance/duration where ORS
+#   said there is none (matrix cells). Request errors are always retried.
+# • TTL: rows older than ORS_CACHE_TTL_DAYS count as misses and are
+#   overwritten by the next fetch.
+# • LRU: `used` is refreshed on every hit; once the table outgrows
+#   ORS_CACHE_MAX_ROWS the least recently used rows are deleted.
+# • Safe to share between processes: WAL journal + busy timeout, one
+#   connection per process (rebuilt after fork), and a lock around it
+#   for the enrichment engine's worker threads.
+# • hits / misses / writes are counted per process (RouteCache.stats).
+#
+#   ORS_CACHE_PATH  (default data/cache/ors_routes.sqlite)
+#   ORS_CACHE=0     disables the cache entirely
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from pathlib import Path
+import math, os, sqlite3, threading, time
+
+QUANT_DECIMALS = 5
+_SCALE = 10 ** QUANT_DECIMALS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    profile    TEXT    NOT NULL,
+    start_lon  INTEGER NOT NULL,
+    start_lat  INTEGER NOT NULL,
+    end_lon    INTEGER NOT NULL,
+    end_lat    INTEGER NOT NULL,
+    distance_m REAL,
+    duration_s REAL,
+    created    REAL    NOT NULL,
+    used       REAL    NOT NULL,
+    PRIMARY KEY (profile, start_lon, start_lat, end_lon, end_lat)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS routes_used ON routes (used);
+"""
+
+
+def _q(v: float) -> int:
+    return int(round(float(v) * _SCALE))
+
+
+def _null(v):
+    return None if v is None or math.isnan(float(v)) else float(v)
+
+
+def _nan(v):
+    return math.nan if v is None else v
+
+
+def connect(path: Path, schema: str) -> sqlite3.Connection:
+    """Shared-cache connection: WAL, busy timeout, autocommit (explicit BEGIN)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+
+def route_key(profile: str, start, end) -> tuple:
+    """(profile, start_lon, start_lat, end_lon, end_lat) as stored."""
+    return (profile, _q(start[0]), _q(start[1]), _q(end[0]), _q(end[1]))
+
+
+class RouteCache:
+
+    def __init__(self, path: Path | str, ttl_days: float = 30,
+                 max_rows: int = 2_000_000, evict_every: int = 10_000):
+        self.path = Path(path)
+        self.ttl_s = ttl_days * 86_400
+        self.max_rows = max_rows
+        self.evict_every = evict_every
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = None
+        self._since_evict = 0
+
+    # -----------------------------------------------------------------
+    # Connection (per process)
+    # -----------------------------------------------------------------
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn, self._pid = connect(self.path, _SCHEMA), os.getpid()
+        return self._conn
+
+    # -----------------------------------------------------------------
+    # Reads
+    # -----------------------------------------------------------------
+    def get_many(self, profile: str, pairs) -> list[dict | None]:
+        """Cached {'distance_m', 'duration_s'} per (start, end), None on miss."""
+        keys = [route_key(profile, s, e) for s, e in pairs]
+        if not keys:
+            return []
+        now = time.time()
+        found: dict[tuple, tuple] = {}
+        with self._lock:
+            db = self._db()
+            # point lookups on the primary key – cheaper than any batching
+            for k in dict.fromkeys(keys):
+                row = db.execute(
+                    "SELECT distance_m, duration_s, created FROM routes WHERE profile=? "
+                    "AND start_lon=? AND start_lat=? AND end_lon=? AND end_lat=?", k,
+                ).fetchone()
+                if row is not None and now - row[2] <= self.ttl_s:
+                    found[k] = row[:2]
+            if found:
+                db.executemany(
+                    "UPDATE routes SET used=? WHERE profile=? AND start_lon=? "
+                    "AND start_lat=? AND end_lon=? AND end_lat=?",
+                    [(now, *k) for k in found],
+                )
+
+        out = []
+        for k in keys:
+            hit = found.get(k)
+            out.append(None if hit is None else {"distance_m": _nan(hit[0]), "duration_s": _nan(hit[1])})
+        hits = sum(r is not None for r in out)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(out) - hits
+        return out
+
+    def get(self, profile: str, start, end) -> dict | None:
+        return self.get_many(profile, [(start, end)])[0]
+
+    # -----------------------------------------------------------------
+    # Writes
+    # -----------------------------------------------------------------
+    def put_many(self, profile: str, pairs, results) -> int:
+        """Store every non-error result; returns how many rows were written."""
+        now = time.time()
+        rows = [
+            (*route_key(profile, s, e), _null(r.get("distance_m")), _null(r.get("duration_s")), now, now)
+            for (s, e), r in zip(pairs, results)
+            if r and "error" not in r
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("INSERT OR REPLACE INTO routes VALUES (?,?,?,?,?,?,?,?,?)", rows)
+            db.execute("COMMIT")
+            self._since_evict += len(rows)
+            if self._since_evict >= self.evict_every:
+                self._evict(db)
+        self.stats["writes"] += len(rows)
+        return len(rows)
+
+    def put(self, profile: str, start, end, result: dict) -> None:
+        self.put_many(profile, [(start, end)], [result])
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        self._since_evict = 0
+        n = db.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+        if n <= self.max_rows:
+            return
+        # drop expired rows first, then the least recently used down to 90%
+        db.execute("BEGIN IMMEDIATE")
+        gone = db.execute("DELETE FROM routes WHERE created < ?",
+                          (time.time() - self.ttl_s,)).rowcount
+        excess = n - gone - int(self.max_rows * 0.9)
+        if excess > 0:
+            gone += db.execute(
+                "DELETE FROM routes WHERE (profile, start_lon, start_lat, end_lon, end_lat) IN "
+                "(SELECT profile, start_lon, start_lat, end_lon, end_lat FROM routes "
+                " ORDER BY used LIMIT ?)", (excess,)).rowcount
+        db.execute("COMMIT")
+        self.stats["evicted"] += gone
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+
+_default: RouteCache | None = None
+
+
+def route_cache() -> RouteCache | None:
+    """Process-wide cache configured from env, or None when ORS_CACHE=0."""
+    global _default
+    if os.getenv("ORS_CACHE", "1") == "0":
+        return None
+    if _default is None:
+        _default = RouteCache(
+            os.getenv("ORS_CACHE_PATH", "data/cache/ors_routes.sqlite"),
+            ttl_days=float(os.getenv("ORS_CACHE_TTL_DAYS", "30")),
+            max_rows=int(os.getenv("ORS_CACHE_MAX_ROWS", "2000000")),
+        )
+    return _default
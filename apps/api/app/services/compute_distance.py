@@ -1,52 +1,277 @@
 #!/usr/bin/env python
 """
 Enrich booking_requests.csv with ORS distance & duration.
+
+ORS_ENRICH_MODE picks how:
+  matrix     (default) – one /v2/matrix call per sources × destinations
+             block of a city's stops (≤ MATRIX_MAX_ELEMENTS cells), only
+             for blocks that hold a booked pair; every returned cell
+             also goes to <cc>_route_pairs.parquet for build_matrices
+  directions – one /v2/directions call per distinct
+             (pickup_stop_id, dropoff_stop_id) pair, shared by every
+             booking row with that pair
+Both read through the persistent route cache (routes/route_cache.py):
+pairs / whole blocks it already holds cost no request, and everything
+fetched is written back. Results are also checkpointed to
+<stem>_dist.ckpt.csv as they arrive (services/enrich_checkpoint.py),
+so a crashed or interrupted run resumes without refetching them.
+
+ROUTER=local (the default when ORS_API_KEY is unset) answers from the
+city's road graph instead (routes/local_router.py): in-process, no
+network, only the booked stop pairs – LOCAL_BATCH pickups at a time
+against just the dropoffs they were booked to – kept as with matrix mode.
 """
 
+from functools import lru_cache
 from pathlib import Path
-import time, pandas as pd
-import os, random
-from routes.openrouteservice_wrapper import OpenRouteServiceWrapper
-from scripts.run_etl import PIPELINES      # to discover valid country codes
+import os
+import numpy as np, pandas as pd
+from routes.local_router import LocalRouter
+from routes.openrouteservice_wrapper import OpenRouteServiceWrapper, matrix_block_shape
+from routes.route_cache import route_cache
+from pipelines.artifacts import BookingSink, PAIR_COLUMNS, bookings_path, write_route_pairs
+from services.enrich_checkpoint import PairCheckpoint, checkpoint_path
+from services.route_engine import matrix_many, route_many
 
-ORS = OpenRouteServiceWrapper()            # raises if ORS_API_KEY missing
-# ~35 requests/min keeps us safely under the free 40 RPM cap
-MAX_RPM     = int(os.getenv("ORS_MAX_RPM", "35"))
-BASE_DELAY  = 60.0 / MAX_RPM
-JITTER_FRAC = 0.2  # add ±20% jitter to avoid bursts
+STOP_PAIR = ["pickup_stop_id", "dropoff_stop_id"]
 
+# pickups per local-router call (its result is batch × their dropoffs)
+LOCAL_BATCH = 64
 
-def _enrich_file(csv_path: Path) -> pd.DataFrame | None:
-    df = pd.read_csv(csv_path)
 
-    req_cols = {"pickup_lat", "pickup_lon", "dropoff_lat", "dropoff_lon"}
-    if not req_cols.issubset(df.columns):
-        print(f"{csv_path.name} lacks lat/lon columns – skipped", flush=True)
-        return
+@lru_cache(maxsize=1)
+def _ors() -> OpenRouteServiceWrapper:
+    # built on first use, not at import – raises if ORS_API_KEY missing
+    return OpenRouteServiceWrapper()
+
+
+def _result(res: dict) -> tuple[float, float]:
+    if ("error" in res) or (res.get("distance_m") is None) or (res.get("duration_s") is None):
+        return float("nan"), float("nan")
+    return res["distance_m"], res["duration_s"]
+
+
+def _pair_keys(df: pd.DataFrame) -> pd.MultiIndex:
+    # (pickup_stop_id, dropoff_stop_id) per row; a row without a stop ID
+    # is keyed on its coordinates instead
+    sides = []
+    for side in ("pickup", "dropoff"):
+        xy = df[f"{side}_lon"].astype(str) + "," + df[f"{side}_lat"].astype(str)
+        ids = df[f"{side}_stop_id"] if f"{side}_stop_id" in df else pd.Series(np.nan, index=df.index)
+        sides.append(ids.fillna(xy).astype(str))
+    return pd.MultiIndex.from_arrays(sides, names=STOP_PAIR)
+
+
+def _directions(df: pd.DataFrame, name: str,
+                ckpt: PairCheckpoint) -> tuple[np.ndarray, np.ndarray, None]:
+    # one route per distinct stop pair, however many bookings share it
+    keys = _pair_keys(df)
+    first = np.flatnonzero(~keys.duplicated())
+    uniq = keys[first]
+    xy = df.iloc[first]
+    pairs = list(zip(zip(xy["pickup_lon"], xy["pickup_lat"]),
+                     zip(xy["dropoff_lon"], xy["dropoff_lat"])))
+
+    # checkpoint of an interrupted run, then the cache; only the rest go to ORS
+    done = ckpt.load()
+    results = [None] * len(pairs)
+    for k, key in enumerate(uniq):
+        if key in done:
+            d, t = done[key]
+            results[k] = {"distance_m": d, "duration_s": t}
+    resumed = sum(r is not None for r in results)
 
-    distances, durations = [], []
-    for _, row in df.iterrows():
-        start = (row["pickup_lon"], row["pickup_lat"])
-        end   = (row["dropoff_lon"], row["dropoff_lat"])
+    cache, profile = route_cache(), _ors().profile
+    rest = [k for k, r in enumerate(results) if r is None]
+    if cache is not None and rest:
+        for k, hit in zip(rest, cache.get_many(profile, [pairs[k] for k in rest])):
+            results[k] = hit
+    todo = [k for k, r in enumerate(results) if r is None]
+    print(f"{name}: {len(df)} bookings → {len(pairs)} stop pairs, {resumed} from checkpoint, "
+          f"{len(pairs) - len(todo) - resumed} from cache", flush=True)
 
-        res = ORS.get_route(start, end)
+    if todo:
+        def checkpoint(i: int, res: dict) -> None:
+            if "error" not in res:
+                ckpt.add([(*uniq[todo[i]], *_result(res))])
 
-        if ("error" in res) or (res.get("distance_m") is None) or (res.get("duration_s") is None):
-            distances.append("")
-            durations.append("")
+        # ORS_CONCURRENCY requests in flight, paced by the shared ORS budget
+        # (across countries in run_all); results come back in row order
+        fetched, stats = route_many([pairs[k] for k in todo], _ors(), on_result=checkpoint)
+        print(f"{name}: {stats['pairs']} routes, {stats['errors']} errors, "
+              f"{stats['throttled']}×429 in {stats['wall_s']}s "
+              f"({stats['routes_per_min']}/min)", flush=True)
+        for k, res in zip(todo, fetched):
+            results[k] = res
+    if cache is not None and (todo or resumed):
+        # fetched now or by the interrupted run – not in the cache yet
+        fresh = sorted(set(todo) | {k for k, key in enumerate(uniq) if key in done})
+        cache.put_many(profile, [pairs[k] for k in fresh], [results[k] for k in fresh])
+
+    dist, dur = np.array([_result(r) for r in results], dtype=float).reshape(-1, 2).T
+    row = uniq.get_indexer(keys)
+    return dist[row], dur[row], None
+
+
+def _stop_table(df: pd.DataFrame, side: str) -> tuple[np.ndarray, np.ndarray, list]:
+    # row → stop code, unique stop IDs, their (lon, lat) in code order
+    codes, ids = pd.factorize(df[f"{side}_stop_id"])
+    first = np.unique(codes, return_index=True)[1]
+    coords = list(zip(df[f"{side}_lon"].to_numpy()[first], df[f"{side}_lat"].to_numpy()[first]))
+    return codes, np.asarray(ids, dtype=object), coords
+
+
+def _cells(sources, destinations) -> list:
+    # row-major (source, destination) pairs of one block
+    return [(s, d) for s in sources for d in destinations]
+
+
+def _matrix(df: pd.DataFrame, name: str,
+            ckpt: PairCheckpoint) -> tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    pu, pu_ids, pu_xy = _stop_table(df, "pickup")
+    do, do_ids, do_xy = _stop_table(df, "dropoff")
+    rows, cols = matrix_block_shape(len(pu_ids), len(do_ids))
+
+    # only the blocks that contain at least one booked pair
+    block_of = pd.MultiIndex.from_arrays([pu // rows, do // cols])
+    needed = block_of.unique()
+    blocks = [(pu_xy[bi * rows:(bi + 1) * rows], do_xy[bj * cols:(bj + 1) * cols])
+              for bi, bj in needed]
+    block_ids = [_cells(pu_ids[bi * rows:(bi + 1) * rows], do_ids[bj * cols:(bj + 1) * cols])
+                 for bi, bj in needed]
+
+    # a block whose every cell is in the checkpoint of an interrupted run
+    # or in the cache is rebuilt from there
+    done = ckpt.load()
+    cache, profile = route_cache(), _ors().profile
+    results, todo, resumed = [None] * len(blocks), [], []
+    for k, (src, dst) in enumerate(blocks):
+        if all(c in done for c in block_ids[k]):
+            cells = [dict(zip(("distance_m", "duration_s"), done[c])) for c in block_ids[k]]
+            resumed.append(k)
         else:
-            distances.append(res["distance_m"])
-            durations.append(res["duration_s"])
+            cells = cache.get_many(profile, _cells(src, dst)) if cache is not None else [None]
+        if all(c is not None for c in cells):
+            results[k] = {key: [[c[key] for c in cells[i:i + len(dst)]]
+                                for i in range(0, len(cells), len(dst))]
+                          for key in ("distance_m", "duration_s")}
+        else:
+            todo.append(k)
+
+    n_grid = -(-len(pu_ids) // rows) * -(-len(do_ids) // cols)
+    print(f"{name}: {len(df)} bookings → {len(blocks)}/{n_grid} matrix blocks "
+          f"of ≤{rows}×{cols}, {len(resumed)} from checkpoint, "
+          f"{len(blocks) - len(todo) - len(resumed)} from cache", flush=True)
+    if todo:
+        def checkpoint(i: int, res: dict) -> None:
+            if "error" not in res:
+                ckpt.add((*c, d, t) for c, d, t in zip(
+                    block_ids[todo[i]], np.ravel(res["distance_m"]), np.ravel(res["duration_s"])))
 
-        time.sleep(BASE_DELAY + random.uniform(0, BASE_DELAY * JITTER_FRAC))
+        fetched, stats = matrix_many([blocks[k] for k in todo], _ors(), on_result=checkpoint)
+        print(f"{name}: {len(todo)} matrix calls, {stats['errors']} failed, "
+              f"{stats['throttled']}×429 in {stats['wall_s']}s", flush=True)
+        for k, res in zip(todo, fetched):
+            results[k] = res
+    if cache is not None:
+        # fetched now or by the interrupted run – not in the cache yet
+        for k in sorted(set(todo) | set(resumed)):
+            if "error" not in results[k]:
+                cache.put_many(profile, _cells(*blocks[k]), [
+                    {"distance_m": d, "duration_s": t}
+                    for d, t in zip(np.ravel(results[k]["distance_m"]),
+                                    np.ravel(results[k]["duration_s"]))
+                ])
 
-    df["distance_m"] = distances
-    df["duration_s"] = durations
+    distances = np.full(len(df), np.nan)
+    durations = np.full(len(df), np.nan)
+    row_block = needed.get_indexer(block_of)
+    pair_frames = []
+    for k, ((bi, bj), res) in enumerate(zip(needed, results)):
+        if "error" in res:
+            continue
+        dist = np.asarray(res["distance_m"], dtype=float)
+        dur = np.asarray(res["duration_s"], dtype=float)
+        hit = np.flatnonzero(row_block == k)
+        r, c = pu[hit] - bi * rows, do[hit] - bj * cols
+        distances[hit], durations[hit] = dist[r, c], dur[r, c]
+
+        # the whole block is kept as stop-pair observations
+        src = pu_ids[bi * rows:bi * rows + dist.shape[0]]
+        dst = do_ids[bj * cols:bj * cols + dist.shape[1]]
+        pair_frames.append(pd.DataFrame({
+            "pickup_stop_id": np.repeat(src, len(dst)),
+            "dropoff_stop_id": np.tile(dst, len(src)),
+            "distance_m": dist.ravel(),
+            "duration_s": dur.ravel(),
+        }))
+    pairs = pd.concat(pair_frames, ignore_index=True) if pair_frames else None
+    return distances, durations, pairs
+
+
+def _local(df: pd.DataFrame, name: str, router: LocalRouter) -> tuple[np.ndarray, np.ndarray, pd.DataFrame | None]:
+    pu, pu_ids, pu_xy = _stop_table(df, "pickup")
+    do, do_ids, do_xy = _stop_table(df, "dropoff")
+
+    # distinct booked pairs as pickup-major codes, so a pickup batch is a slice
+    key, row = np.unique(pu.astype(np.int64) * len(do_ids) + do, return_inverse=True)
+    src, dst = key // len(do_ids), key % len(do_ids)
+    dist, dur = np.full(len(key), np.nan), np.full(len(key), np.nan)
+    errors = set()
+    for p0 in range(0, len(pu_ids), LOCAL_BATCH):
+        lo, hi = np.searchsorted(src, [p0, p0 + LOCAL_BATCH])
+        if lo == hi:
+            continue
+        targets, col = np.unique(dst[lo:hi], return_inverse=True)
+        res = router.matrix(pu_xy[p0:p0 + LOCAL_BATCH], [do_xy[j] for j in targets])
+        if "error" in res:
+            errors.add(res["error"])
+            continue
+        dist[lo:hi] = res["distance_m"][src[lo:hi] - p0, col]
+        dur[lo:hi] = res["duration_s"][src[lo:hi] - p0, col]
+    for err in sorted(errors):
+        print(f"{name}: {err} – left blank", flush=True)
+
+    print(f"{name}: {len(df)} bookings → {len(key)} local routes, "
+          f"{int(np.isnan(dist).sum())} unroutable", flush=True)
+    pairs = pd.DataFrame({
+        "pickup_stop_id": pu_ids[src],
+        "dropoff_stop_id": do_ids[dst],
+        "distance_m": dist,
+        "duration_s": dur,
+    })
+    return dist[row], dur[row], pairs
+
+
+def router_backend() -> str:
+    # "ors" or "local"; without a key ORS is not an option
+    return os.getenv("ROUTER") or ("ors" if os.getenv("ORS_API_KEY") else "local")
+
+
+def _enrich_file(csv_path: Path) -> tuple[pd.DataFrame, pd.DataFrame | None] | None:
+    df = pd.read_csv(csv_path, dtype={"pickup_stop_id": str, "dropoff_stop_id": str})
+
+    req_cols = {"pickup_lat", "pickup_lon", "dropoff_lat", "dropoff_lon"}
+    if not req_cols.issubset(df.columns):
+        print(f"{csv_path.name} lacks lat/lon columns – skipped", flush=True)
+        return
+
+    if router_backend() == "local":
+        # tmp/<cc>/<city>/booking_requests.csv → that city's road graph
+        router = LocalRouter.for_cities(csv_path.parent.parent.name, [csv_path.parent.name])
+        df["distance_m"], df["duration_s"], pairs = _local(df, csv_path.name, router)
+    else:
+        mode = os.getenv("ORS_ENRICH_MODE", "matrix")
+        enrich = _matrix if mode == "matrix" else _directions
+        # whatever ORS answered is on disk even if this run dies
+        with PairCheckpoint(checkpoint_path(csv_path)) as ckpt:
+            df["distance_m"], df["duration_s"], pairs = enrich(df, csv_path.name, ckpt)
 
     out_csv = csv_path.with_name(csv_path.stem + "_dist.csv")
     df.to_csv(out_csv, index=False)
+    checkpoint_path(csv_path).unlink(missing_ok=True)
     print(f"{csv_path} → {out_csv.name}", flush=True)
-    return df
+    return df, pairs
 
 
 def enrich_country(cc: str) -> None:
@@ -55,27 +280,29 @@ def enrich_country(cc: str) -> None:
     files = list(base.rglob("booking_requests.csv"))
     print(f"[{cc}] found {len(files)} booking files under {base}", flush=True)
 
-    dfs = []
-    for csv in files:
-        enriched = _enrich_file(csv)
-        if enriched is None or enriched.empty:
-            print(f"[{cc}] skipped empty/failed: {csv}", flush=True)
-            continue
-        dfs.append(enriched)
-
-    if not dfs:
-        print(f"[{cc}] nothing to concatenate - leaving data/processed/{cc}.csv as-is", flush=True)
-        return
-
-    final = Path(f"data/processed/{cc}.csv")
+    # Each enriched city file goes straight into the sink; the old
+    # artifact stays in place unless at least one file succeeded
+    pair_tables = []
     try:
-        pd.concat(dfs, ignore_index=True).to_csv(final, index=False)
+        with BookingSink(cc) as sink:
+            for csv in files:
+                enriched, pairs = _enrich_file(csv) or (None, None)
+                if enriched is None or enriched.empty:
+                    print(f"[{cc}] skipped empty/failed: {csv}", flush=True)
+                    continue
+                sink.write(enriched)
+                if pairs is not None:
+                    pair_tables.append(pairs)
     except Exception as e:
         # print full traceback and re-raise so Docker logs show the cause
         import traceback; traceback.print_exc()
         raise
-    print(f"Saved output with distance → {final}", flush=True)
-
-
 
+    if sink.path is None:
+        print(f"[{cc}] nothing to write - leaving {bookings_path(cc)} as-is", flush=True)
+        return
+    print(f"Saved output with distance → {sink.path}", flush=True)
 
+    if pair_tables:
+        pairs = pd.concat(pair_tables, ignore_index=True)[PAIR_COLUMNS]
+        print(f"Saved {len(pairs)} stop pairs → {write_route_pairs(pairs, cc)}", flush=True)
@@ -2,43 +2,49 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
+from pipelines.artifacts import read_bookings, read_route_pairs
+from pipelines.stop_dedup import canonicalize, read_stop_aliases
+from pipelines.stop_matrix import StopMatrix, haversine_m, matrix_path
+from services.stop_tables import read_stop_tables
+
 def build_matrices(country: str,
                                 agg: str = "median",
                                 fill: str = "none") -> dict:
     """
-    Build country-wide square matrices using the UNION of stop IDs
+    Build the country-wide stop × stop matrix over the UNION of stop IDs
 
     Parameters
     ----------
     country : "mx" | "co" | "cr" | …
     agg     : aggregation for duplicates ("median", "mean", "min", "max")
-    fill    : "none" → leave NaNs; "impute" → fill using haversine-based rules
-
-    Outputs (in data/processed):
-      <cc>_distance_matrix.csv
-      <cc>_duration_matrix.csv
-      (if fill="impute"):
-      <cc>_distance_matrix_filled.csv
-      <cc>_duration_matrix_filled.csv
+    fill    : "none" → unknown cells stay NaN; "impute" → also store the
+              haversine detour factor / median speed so lookups can fill
+              them (lookup(impute=True), see pipelines/stop_matrix.py)
+
+    Cells: booked pairs and matrix-enrichment pairs only; the road-graph
+    stop tables (stop_tables.py) fill metrics those left empty but never
+    add cells of their own, so the matrix stays as sparse as the demand.
+
+    Output: data/processed/<cc>_matrix.npz – sparse, one entry per known
+    cell (StopMatrix); replaces the dense <cc>_*_matrix[_filled].csv.
     """
     cc = country.lower()
     out_dir = Path("data/processed")
-    src = out_dir / f"{cc}.csv"
 
     usecols = [
         "pickup_stop_id","dropoff_stop_id",
         "pickup_lat","pickup_lon","dropoff_lat","dropoff_lon",
         "distance_m","duration_s"
     ]
-    df = pd.read_csv(src, usecols=usecols)
+    # Typed artifact: stop IDs are strings, distance/duration float (NaN = unknown)
+    df = read_bookings(cc, columns=usecols)
+    df["pickup_stop_id"]  = df["pickup_stop_id"].str.strip()
+    df["dropoff_stop_id"] = df["dropoff_stop_id"].str.strip()
 
-    # Coerce numeric (blank cells -> NaN)
-    df["distance_m"] = pd.to_numeric(df["distance_m"], errors="coerce")
-    df["duration_s"] = pd.to_numeric(df["duration_s"], errors="coerce")
-
-    # Ensure stop IDs are strings BEFORE union/pivot to avoid dtype mismatches
-    df["pickup_stop_id"]  = df["pickup_stop_id"].astype(str).str.strip()
-    df["dropoff_stop_id"] = df["dropoff_stop_id"].astype(str).str.strip()
+    # Stops merged by the ETL dedup stage → one row/column per physical stop
+    aliases = read_stop_aliases(cc)
+    df["pickup_stop_id"]  = canonicalize(df["pickup_stop_id"], aliases)
+    df["dropoff_stop_id"] = canonicalize(df["dropoff_stop_id"], aliases)
 
     # Sanity: what does the function actually see?
     rows_total = len(df)
@@ -55,106 +61,83 @@ def build_matrices(country: str,
     do = df["dropoff_stop_id"]
     union_ids = sorted(pd.Index(pu.unique()).union(pd.Index(do.unique())))
 
-    # Rectangular pivots on observed pairs
-    dist = df.pivot_table(index="pickup_stop_id", columns="dropoff_stop_id",
-                          values="distance_m", aggfunc=agg)
-    dur  = df.pivot_table(index="pickup_stop_id", columns="dropoff_stop_id",
-                          values="duration_s", aggfunc=agg)
-    
-    # How many non-null cells did the pivot produce *before* reindex?
-    pivot_filled = int(dist.notna().to_numpy().sum())
-    print(f"[{cc}] pivot_non_null_cells_before_reindex={pivot_filled}", flush=True)
-
-    
-    # Also force pivot axes to strings (belt-and-suspenders)
-    dist.index   = dist.index.astype(str)
-    dist.columns = dist.columns.astype(str)
-    dur.index    = dur.index.astype(str)
-    dur.columns  = dur.columns.astype(str)
-
-    # Reindex to UNION × UNION (square)
-    dist = dist.reindex(index=union_ids, columns=union_ids)
-    dur  = dur.reindex(index=union_ids, columns=union_ids)
+    # Observations = booked pairs + every cell the matrix enrichment got
+    # back (pairs between booked stops that were never booked together)
+    obs_cols = ["pickup_stop_id", "dropoff_stop_id", "distance_m", "duration_s"]
+    pairs = read_route_pairs(cc)
+    if not pairs.empty:
+        pairs["pickup_stop_id"]  = canonicalize(pairs["pickup_stop_id"], aliases)
+        pairs["dropoff_stop_id"] = canonicalize(pairs["dropoff_stop_id"], aliases)
+        pairs = pairs[pairs["pickup_stop_id"].isin(union_ids) & pairs["dropoff_stop_id"].isin(union_ids)]
+        print(f"[{cc}] +{len(pairs)} stop pairs from matrix enrichment", flush=True)
+    obs = pd.concat([df[obs_cols], pairs[obs_cols]], ignore_index=True) if not pairs.empty else df
+
+    # One cell per observed (pickup, dropoff) pair – never UNION × UNION;
+    # pairs without a metric yet stay until the stop tables had a go
+    union = pd.Index(union_ids)
+    cells = (obs.groupby(["pickup_stop_id", "dropoff_stop_id"], sort=False)
+                [["distance_m", "duration_s"]].agg(agg))
+    row = union.get_indexer(cells.index.get_level_values(0).astype(str))
+    col = union.get_indexer(cells.index.get_level_values(1).astype(str))
+    dist = cells["distance_m"].to_numpy(float)
+    dur = cells["duration_s"].to_numpy(float)
+    print(f"[{cc}] observed_cells={len(cells)} cells_with_distance={int(np.isfinite(dist).sum())}",
+          flush=True)
+
+    # Metrics bookings / enrichment left empty: the road-graph stop tables
+    n = len(union)
+    from_tables = 0
+    for ids, t_dist, t_dur in read_stop_tables(cc):
+        pos = pd.Index(ids).get_indexer(union)
+        inside = (pos[row] >= 0) & (pos[col] >= 0)
+        tr, tc = pos[row[inside]], pos[col[inside]]
+        missing = np.isnan(dist[inside])
+        from_tables += int((missing & np.isfinite(t_dist[tr, tc])).sum())
+        dist[inside] = np.where(missing, t_dist[tr, tc], dist[inside])
+        dur[inside] = np.where(np.isnan(dur[inside]), t_dur[tr, tc], dur[inside])
+    if from_tables:
+        print(f"[{cc}] {from_tables} cells filled from road-graph stop tables", flush=True)
+
+    # a pair nothing could route is not worth a cell
+    known = np.isfinite(dist) | np.isfinite(dur)
+    row, col, dist, dur = row[known], col[known], dist[known], dur[known]
 
     # Diagonal = 0
-    if dist.size: np.fill_diagonal(dist.values, 0.0)
-    if dur.size:  np.fill_diagonal(dur.values,  0.0)
-
-    # Write raw (possibly sparse) matrices
-    dist_path = out_dir / f"{cc}_distance_matrix.csv"
-    dur_path  = out_dir / f"{cc}_duration_matrix.csv"
-    dist.to_csv(dist_path, float_format="%.3f")
-    dur.to_csv(dur_path,  float_format="%.3f")
-
-    filled_paths = {}
-
+    off = row != col
+    row = np.concatenate([row[off], np.arange(n)])
+    col = np.concatenate([col[off], np.arange(n)])
+    dist = np.concatenate([dist[off], np.zeros(n)])
+    dur = np.concatenate([dur[off], np.zeros(n)])
+
+    # Coordinates per stop: kept in the matrix for lookup-time imputation
+    stops = pd.concat([
+        df[["pickup_stop_id", "pickup_lat", "pickup_lon"]].set_axis(["stop_id", "lat", "lon"], axis=1),
+        df[["dropoff_stop_id", "dropoff_lat", "dropoff_lon"]].set_axis(["stop_id", "lat", "lon"], axis=1),
+    ]).drop_duplicates("stop_id").set_index("stop_id").reindex(union)
+    lat, lon = stops["lat"].to_numpy(float), stops["lon"].to_numpy(float)
+
+    detour = speed_mps = np.nan
     if fill.lower() == "impute":
-        # ---- Prepare coordinates per stop_id for haversine baseline ----
-        stops_pick = df[["pickup_stop_id","pickup_lat","pickup_lon"]].drop_duplicates().rename(
-            columns={"pickup_stop_id":"stop_id","pickup_lat":"lat","pickup_lon":"lon"}
-        )
-        stops_drop = df[["dropoff_stop_id","dropoff_lat","dropoff_lon"]].drop_duplicates().rename(
-            columns={"dropoff_stop_id":"stop_id","dropoff_lat":"lat","dropoff_lon":"lon"}
-        )
-        stops = pd.concat([stops_pick, stops_drop]).drop_duplicates("stop_id").set_index("stop_id")
-        # align to union order
-        stops = stops.reindex(union_ids)
-
-        # Vectorized haversine (meters) for all pairs we have coords for
-        coords = stops[["lat","lon"]].to_numpy(float)
-        lat = np.radians(coords[:,0])[:,None]
-        lon = np.radians(coords[:,1])[:,None]
-        latT, lonT = lat.T, lon.T
-        dlat = latT - lat
-        dlon = lonT - lon
-        a = np.sin(dlat/2)**2 + np.cos(lat)*np.cos(latT)*np.sin(dlon/2)**2
-        hav_m = 2 * 6371008.8 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))  # meters
-        np.fill_diagonal(hav_m, 0.0)
-        hav_df = pd.DataFrame(hav_m, index=union_ids, columns=union_ids)
-
-        # Some stops may lack coords; mask those out
-        valid_coord = stops[["lat","lon"]].notna().all(axis=1).values
-        valid_pair_mask = np.outer(valid_coord, valid_coord)
-
-        # ---- Distance imputation via learned detour factor ----
-        dist_obs_mask = (~dist.isna()).values & valid_pair_mask & (hav_df.values > 0)
-        ratios = (dist.where(dist_obs_mask) / hav_df.where(dist_obs_mask)).values.ravel()
+        # ---- Distance: learned detour factor over haversine ----
+        hav = haversine_m(lat[row], lon[row], lat[col], lon[col])
+        ratios = dist / np.where(hav > 0, hav, np.nan)
         ratios = ratios[np.isfinite(ratios) & (ratios > 0)]
         detour = float(np.clip(np.median(ratios) if ratios.size else 1.25, 1.0, 2.0))
 
-        dist_filled = dist.copy()
-        fill_mask = dist_filled.isna().values & valid_pair_mask
-        dist_filled.values[fill_mask] = (detour * hav_df.values)[fill_mask]
-        # Optional: enforce symmetry (helps when data is sparse)
-        sym = (dist_filled.values + dist_filled.values.T) / 2.0
-        np.fill_diagonal(sym, 0.0)
-        dist_filled = pd.DataFrame(sym, index=union_ids, columns=union_ids)
-
-        # ---- Duration imputation via median speed ----
-        speed_obs_mask = (~dur.isna()).values & (~dist.isna()).values & (dur.values > 0)
-        speeds = (dist.where(speed_obs_mask) / dur.where(speed_obs_mask)).values.ravel()
+        # ---- Duration: median observed speed ----
+        speeds = dist / np.where(dur > 0, dur, np.nan)
         speeds = speeds[np.isfinite(speeds) & (speeds > 0)]
-        median_speed_mps = float(np.median(speeds) if speeds.size else (30/3.6))
-
-        dur_filled = dur.copy()
-        dur_fill_mask = dur_filled.isna().values & np.isfinite(dist_filled.values)
-        dur_filled.values[dur_fill_mask] = (
-            dist_filled.values[dur_fill_mask] / median_speed_mps
-        )
-        np.fill_diagonal(dur_filled.values, 0.0)
-
-        dist_path_f = out_dir / f"{cc}_distance_matrix_filled.csv"
-        dur_path_f  = out_dir / f"{cc}_duration_matrix_filled.csv"
-        dist_filled.to_csv(dist_path_f, float_format="%.3f")
-        dur_filled.to_csv(dur_path_f,  float_format="%.3f")
-
-        filled_paths = {"distance_filled": dist_path_f, "duration_filled": dur_path_f}
-
-    print(f"{cc.upper()} union IDs: {len(union_ids)} ⇒ matrices {len(union_ids)}×{len(union_ids)} "
-          f"(fill={fill})")
-    return {
-        "distance": dist_path,
-        "duration": dur_path,
-        **filled_paths
-    }
-    
+        speed_mps = float(np.median(speeds) if speeds.size else (30 / 3.6))
+        print(f"[{cc}] imputation: detour={detour:.3f} speed={speed_mps * 3.6:.1f} km/h", flush=True)
+
+    matrix = StopMatrix(union_ids, row, col, dist, dur, lat, lon, detour, speed_mps)
+    path = matrix.save(matrix_path(cc))
+
+    # the dense exports this replaces (GBs for big countries, no reader left)
+    for stale in ("distance_matrix", "duration_matrix",
+                  "distance_matrix_filled", "duration_matrix_filled"):
+        (out_dir / f"{cc}_{stale}.csv").unlink(missing_ok=True)
+
+    print(f"{cc.upper()} union IDs: {n} ⇒ {matrix.nnz} of {n}×{n} cells stored, "
+          f"{path.stat().st_size / 1e6:.1f} MB (fill={fill})")
+    return {"matrix": path}
@@ -12,6 +12,8 @@ import pandas as pd, numpy as np
 from haversine import haversine                   
 from scipy.optimize import linear_sum_assignment  
 
+from pipelines.artifacts import read_bookings
+
 # Capacity ranking to compare driver vehicle size vs. trip cargo size
 # (higher number == can carry more)
 CAP_RANK = {"small": 1, "medium": 2, "large": 3}
@@ -29,7 +31,8 @@ def match_trips(country: str, booking=None):
     if booking is None:
         # If no user input is provided, read the whole simulated bookings file for this country
         bookings = (
-            pd.read_csv(data_dir / f"{cc}.csv")
+            read_bookings(cc, columns=["booking_id", "move_size",
+                                       "pickup_lat", "pickup_lon"])
             .reset_index(drop=True)
         )
     else:
@@ -0,0 +1,93 @@
+# ---------------------------------------------------------------------
+# Resumable enrichment – per-file log of stop pairs ORS already resolved
+# • <stem>_dist.ckpt.csv next to booking_requests.csv: append-only
+#   PAIR_COLUMNS rows, written as results come back and flushed (+
+#   fsync) every ENRICH_CHECKPOINT_EVERY rows and on any exit from the
+#   `with` block – a crash or Ctrl-C loses at most one unflushed batch.
+# • A rerun loads it and asks ORS only for the pairs it lacks; a torn
+#   last line (killed mid-write) is cut off before appending again.
+# • Only successful results are logged (NaN = "ORS has no route" is a
+#   result), so failed pairs are retried on the next run.
+# • Removed once <stem>_dist.csv is written – it only ever spans one
+#   interrupted run; across runs the route cache takes over.
+# ---------------------------------------------------------------------
+
+from pathlib import Path
+import csv, io, math, os
+
+import pandas as pd
+
+from pipelines.artifacts import PAIR_COLUMNS
+
+CHECKPOINT_EVERY = int(os.getenv("ENRICH_CHECKPOINT_EVERY", "500"))
+
+Pair = tuple[str, str]
+
+
+def checkpoint_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.stem + "_dist.ckpt.csv")
+
+
+class PairCheckpoint:
+    def __init__(self, path: Path, every: int = CHECKPOINT_EVERY):
+        self.path = Path(path)
+        self.every = max(1, every)
+        self._buf = io.StringIO()
+        self._rows = 0
+        self.written = 0
+
+    def __enter__(self) -> "PairCheckpoint":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+    def load(self) -> dict[Pair, tuple[float, float]]:
+        """(pickup_stop_id, dropoff_stop_id) → (distance_m, duration_s) logged so far."""
+        if not self.path.exists():
+            return {}
+        raw = self.path.read_bytes()
+        end = raw.rfind(b"\n") + 1
+        if end < len(raw):
+            # killed mid-write: drop the partial line so appends stay aligned
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        if end == 0:
+            return {}
+        df = pd.read_csv(self.path, dtype={"pickup_stop_id": str, "dropoff_stop_id": str},
+                         float_precision="round_trip")
+        df = df.drop_duplicates(["pickup_stop_id", "dropoff_stop_id"], keep="last")
+        return {(p, d): (m, s) for p, d, m, s in
+                zip(df["pickup_stop_id"], df["dropoff_stop_id"], df["distance_m"], df["duration_s"])}
+
+    def add(self, rows) -> None:
+        """Log (pickup_stop_id, dropoff_stop_id, distance_m, duration_s) rows."""
+        w = csv.writer(self._buf, lineterminator="\n")
+        for pu, do, dist, dur in rows:
+            w.writerow((pu, do, _num(dist), _num(dur)))
+            self._rows += 1
+        if self._rows >= self.every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            if new:
+                f.write(",".join(PAIR_COLUMNS) + "\n")
+            f.write(self._buf.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        self.written += self._rows
+        self._buf, self._rows = io.StringIO(), 0
+
+    def remove(self) -> None:
+        self._buf, self._rows = io.StringIO(), 0
+        self.path.unlink(missing_ok=True)
+
+
+def _num(x) -> str:
+    # NaN / None → empty field, read back as NaN
+    return "" if x is None or (isinstance(x, float) and math.isnan(x)) else repr(float(x))
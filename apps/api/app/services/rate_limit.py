@@ -0,0 +1,75 @@
+# ---------------------------------------------------------------------
+# Shared request budget for ORS-bound stages
+# • RateLimiter hands out request slots at most `rpm` per minute. Its
+#   state lives in shared memory (multiprocessing.Value + Lock), so one
+#   instance passed to every process of a pool is ONE budget for all of
+#   them, not one per country.
+# • It is a token bucket in GCRA form: one shared "theoretical arrival
+#   time" advances by 60/rpm per request, and up to `burst` requests may
+#   run ahead of it. burst=1 is strict even spacing.
+# • reserve() books a slot under the lock and returns how long to wait,
+#   so callers sleep outside it – acquire() with time.sleep, the async
+#   enrichment engine with asyncio.sleep.
+# • pause(s) pushes the whole budget back, e.g. after an HTTP 429, so
+#   every process backs off, not just the one that was refused.
+# • install() makes a limiter the process-wide default (main.run_all does
+#   this in every worker); without one, ors_limiter() builds a local
+#   limiter from ORS_MAX_RPM, which is the old per-process pacing.
+# ---------------------------------------------------------------------
+
+from multiprocessing import Lock, Value
+import os, time
+
+# ~35 requests/min keeps us safely under the free 40 RPM cap
+DEFAULT_RPM = 35
+
+
+class RateLimiter:
+
+    def __init__(self, rpm: float, burst: int = 1):
+        self.interval = 60.0 / rpm
+        self.burst = max(1, int(burst))
+        self._lock = Lock()
+        self._tat = Value("d", 0.0, lock=False)   # monotonic time the bucket is "paid up" to
+
+    def reserve(self) -> float:
+        """Book one request; returns the seconds to wait before sending it."""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(now, self._tat.value)
+            self._tat.value = tat + self.interval
+        return max(0.0, tat - now - (self.burst - 1) * self.interval)
+
+    def acquire(self) -> float:
+        """Block until this caller's slot comes up; returns seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for at least `seconds` from now."""
+        with self._lock:
+            self._tat.value = max(self._tat.value,
+                                  time.monotonic() + seconds + (self.burst - 1) * self.interval)
+
+
+_installed: RateLimiter | None = None
+
+
+def install(limiter: RateLimiter | None) -> None:
+    global _installed
+    _installed = limiter
+
+
+def from_env() -> RateLimiter:
+    # ORS_MAX_RPM requests/min, ORS_BURST of them may go back to back
+    return RateLimiter(float(os.getenv("ORS_MAX_RPM", DEFAULT_RPM)),
+                       int(os.getenv("ORS_BURST", "1")))
+
+
+def ors_limiter() -> RateLimiter:
+    global _installed
+    if _installed is None:
+        _installed = from_env()
+    return _installed
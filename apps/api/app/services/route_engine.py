@@ -0,0 +1,115 @@
+# ---------------------------------------------------------------------
+# Concurrent ORS routing for the enrichment step
+# • route_many() resolves a list of (start, end) pairs with up to
+#   ORS_CONCURRENCY requests in flight, instead of one blocking call
+#   followed by a fixed sleep.
+# • Pacing is the shared token bucket in rate_limit.py (ORS_MAX_RPM /
+#   ORS_BURST): every request books a slot and awaits it, so the same
+#   budget holds however many coroutines – or country processes – run.
+# • 429 → the whole bucket is paused for Retry-After (or an exponential
+#   backoff) and the request retried; 5xx / connection errors back off
+#   locally. After ORS_MAX_RETRIES the row keeps its {"error": …}.
+# • The HTTP calls are the wrapper's blocking route_once() run in a
+#   thread per in-flight slot, driven by asyncio workers that pull row
+#   indices from one shared iterator – results land at their input
+#   position, so ordering is preserved whatever finishes first.
+# • matrix_many() is the same engine over matrix_once() blocks (one
+#   budget slot per block).
+# • on_result(k, result) is called as each call completes (on the event
+#   loop thread, in completion order) – compute_distance uses it to
+#   checkpoint pairs before the whole batch is done.
+# ---------------------------------------------------------------------
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, os, time
+
+from services.rate_limit import RateLimiter, ors_limiter
+
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = int(os.getenv("ORS_MAX_RETRIES", "5"))
+MAX_BACKOFF_S = 60.0
+
+
+async def _call(once, args, limiter: RateLimiter, pool, stats: dict) -> dict:
+    loop = asyncio.get_running_loop()
+    tries = max(1, MAX_RETRIES)      # ORS_MAX_RETRIES=0 still sends the request once
+    for attempt in range(tries):
+        await asyncio.sleep(limiter.reserve())
+        status, result, retry_after = await loop.run_in_executor(pool, once, *args)
+        stats["requests"] += 1
+        if status == 200:
+            return result
+
+        if attempt == tries - 1:
+            break
+        backoff = min(MAX_BACKOFF_S, retry_after or 2.0 ** attempt)
+        if status == 429:
+            # everyone slows down, the retry just books the next slot
+            stats["throttled"] += 1
+            limiter.pause(backoff)
+        elif status == 0 or 500 <= status < 600:
+            await asyncio.sleep(backoff)
+        else:
+            return result           # 4xx other than 429: not worth retrying
+        stats["retries"] += 1
+    return result
+
+
+OnResult = Callable[[int, dict], None]
+
+
+async def _call_all(once, calls, limiter: RateLimiter, concurrency: int,
+                    stats: dict, on_result: OnResult | None) -> list[dict]:
+    results: list[dict | None] = [None] * len(calls)
+    todo = iter(range(len(calls)))   # shared: each worker takes the next row
+
+    async def worker():
+        for k in todo:
+            results[k] = await _call(once, calls[k], limiter, pool, stats)
+            if on_result is not None:
+                on_result(k, results[k])
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ors") as pool:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def _run(once, calls, limiter, concurrency, on_result=None) -> tuple[list[dict], dict]:
+    limiter = limiter or ors_limiter()
+    concurrency = concurrency or int(os.getenv("ORS_CONCURRENCY", DEFAULT_CONCURRENCY))
+    concurrency = max(1, min(concurrency, len(calls) or 1))
+    stats = {"calls": len(calls), "requests": 0, "retries": 0, "throttled": 0}
+
+    t0 = time.perf_counter()
+    results = asyncio.run(_call_all(once, list(calls), limiter, concurrency, stats, on_result))
+    stats["errors"] = sum("error" in r for r in results)
+    stats["wall_s"] = round(time.perf_counter() - t0, 3)
+    return results, stats
+
+
+def route_many(pairs, client, limiter: RateLimiter | None = None,
+               concurrency: int | None = None,
+               on_result: OnResult | None = None) -> tuple[list[dict], dict]:
+    """
+    Route every (start, end) pair – (lon, lat) tuples – with `client`
+    (an OpenRouteServiceWrapper or anything with route_once()).
+
+    Returns (results in input order, stats) where each result is
+    {"distance_m", "duration_s"} or {"error"}, and stats counts requests,
+    retries, 429s and errors plus the overall wall time.
+    """
+    results, stats = _run(client.route_once, pairs, limiter, concurrency, on_result)
+    stats["pairs"] = stats["calls"]
+    stats["routes_per_min"] = round(60 * len(pairs) / stats["wall_s"], 1) if stats["wall_s"] else None
+    return results, stats
+
+
+def matrix_many(blocks, client, limiter: RateLimiter | None = None,
+                concurrency: int | None = None,
+                on_result: OnResult | None = None) -> tuple[list[dict], dict]:
+    """
+    Resolve (sources, destinations) blocks with client.matrix_once();
+    results as in OpenRouteServiceWrapper.parse_matrix, in input order.
+    """
+    return _run(client.matrix_once, blocks, limiter, concurrency, on_result)
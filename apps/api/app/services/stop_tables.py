@@ -0,0 +1,77 @@
+# ---------------------------------------------------------------------
+# Stop × stop distance / duration tables from the city road graphs
+# • For every city with a stops_truck_only.csv: snap the stops onto the
+#   city's road graph and run one contraction-hierarchy many-to-many
+#   query (pipelines/contraction.py) over all of them – no ORS calls.
+# • Output per city: tmp/<cc>/<city>/stop_tables.npz with stop_id plus
+#   float32 distance_m / duration_s (S × S, NaN = stop off the network
+#   or unreachable), stage "stop_tables" of the city manifest – rebuilt
+#   when the stops or the hierarchy change.
+# • build_matrices() fills every cell bookings / matrix enrichment left
+#   empty from these tables.
+#
+#   STOP_TABLES=0 skips the stage in main.run_single.
+# ---------------------------------------------------------------------
+
+from pathlib import Path
+import os, time
+
+import numpy as np
+import pandas as pd
+
+from pipelines.contraction import load_city_ch
+from pipelines.stage_cache import StageCache, stage_key
+
+TABLES_NAME = "stop_tables.npz"
+
+
+def _city_dirs(cc: str, root: Path) -> list[Path]:
+    base = Path(root) / cc
+    return sorted(p.parent for p in base.glob("*/stops_truck_only.csv"))
+
+
+def build_stop_tables(cc: str, root: Path = Path("tmp")) -> list[Path]:
+    """Build (or keep, when fresh) every city's stop table; returns their paths."""
+    written = []
+    for city_dir in _city_dirs(cc, root):
+        city = city_dir.name
+        stops_csv = city_dir / "stops_truck_only.csv"
+        out = city_dir / TABLES_NAME
+
+        loaded = load_city_ch(cc, city, root)
+        if loaded is None:
+            print(f"[{cc}] {city}: no road graph – no stop table", flush=True)
+            continue
+        # read the manifest only now: load_city_ch() may just have recorded stages
+        cache = StageCache(Path(root) / cc / f"{city}_manifest.json")
+        key = stage_key(cache.key_of("ch"), cache.digest(stops_csv))
+        if cache.fresh("stop_tables", key, out):
+            written.append(out)
+            continue
+
+        graph, ch = loaded
+        stops = pd.read_csv(stops_csv, dtype={"stop_id": str},
+                            usecols=["stop_id", "stop_lat", "stop_lon"]).drop_duplicates("stop_id")
+        t0 = time.perf_counter()
+        nodes, _ = graph.snap(stops["stop_lon"].to_numpy(), stops["stop_lat"].to_numpy())
+        length, duration = ch.many_to_many(nodes, nodes)
+        print(f"[{cc}] {city}: {len(stops)}×{len(stops)} stop table, "
+              f"{int((nodes < 0).sum())} stops off the network, "
+              f"{time.perf_counter() - t0:.1f}s", flush=True)
+
+        tmp = out.with_suffix(".tmp.npz")
+        np.savez(tmp, stop_id=stops["stop_id"].to_numpy(dtype=str),
+                 distance_m=length, duration_s=duration)
+        os.replace(tmp, out)
+        cache.record("stop_tables", key, out)
+        written.append(out)
+    return written
+
+
+def read_stop_tables(cc: str, root: Path = Path("tmp")):
+    """Yield (stop_ids, distance_m, duration_s) per city that has a table."""
+    for city_dir in _city_dirs(cc, root):
+        path = city_dir / TABLES_NAME
+        if path.exists():
+            with np.load(path) as z:
+                yield z["stop_id"], z["distance_m"], z["duration_s"]
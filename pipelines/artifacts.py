@@ -0,0 +1,214 @@
+# ---------------------------------------------------------------------
+# Processed booking artifact – data/processed/<cc>.parquet
+# • Written by ETLPipeline.load() and rewritten (with distance_m /
+#   duration_s) by compute_distance.enrich_country().
+# • Read by the matrix builder, trip-log generator, driver matcher and
+#   the booking API, each asking only for the columns it needs.
+# • Fixed dtypes so nobody has to re-coerce after reading:
+#     stop / booking IDs → string, coordinates → float64,
+#     truck sizes → ordered category, city → category
+# • data/processed/<cc>.csv is still available as an optional export
+#   (export_csv=True or ETL_EXPORT_CSV=1) and is used as a fallback
+#   reader when no parquet file exists yet.
+# • data/processed/<cc>_route_pairs.parquet holds every stop pair ORS
+#   returned during matrix enrichment (PAIR_COLUMNS); build_matrices()
+#   uses it on top of the booked pairs.
+# • BookingSink streams batches into the artifact one parquet row group
+#   at a time and only renames it into place once every batch is in, so
+#   readers never see a half-written file and writers never hold more
+#   than one batch.
+# ---------------------------------------------------------------------
+
+from collections.abc import Iterator
+from pathlib import Path
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PROCESSED_DIR = Path("data/processed")
+
+TRUCK_SIZE = pd.CategoricalDtype(["small", "medium", "large"], ordered=True)
+
+BOOKING_DTYPES = {
+    "booking_id":          "string",
+    "pickup_stop_id":      "string",
+    "dropoff_stop_id":     "string",
+    "requested_time":      "string",
+    "move_size":           TRUCK_SIZE,
+    "pickup_truck_type":   TRUCK_SIZE,
+    "dropoff_truck_type":  TRUCK_SIZE,
+    "required_truck_type": TRUCK_SIZE,
+    "pickup_lat":          "float64",
+    "pickup_lon":          "float64",
+    "dropoff_lat":         "float64",
+    "dropoff_lon":         "float64",
+    "city":                "category",
+    # added by enrichment; NaN until a route is known
+    "distance_m":          "float64",
+    "duration_s":          "float64",
+}
+
+# Columns a reader may ask for before enrichment has produced them
+ENRICHMENT_COLUMNS = ("distance_m", "duration_s")
+
+# Long-format stop-pair table from matrix enrichment
+PAIR_DTYPES = {
+    "pickup_stop_id":  "string",
+    "dropoff_stop_id": "string",
+    "distance_m":      "float64",
+    "duration_s":      "float64",
+}
+PAIR_COLUMNS = list(PAIR_DTYPES)
+
+# Kept as text when reading CSV (IDs like "0012" must not become 12)
+_TEXT_COLUMNS = {c: "string" for c, t in BOOKING_DTYPES.items() if t == "string"}
+
+
+def bookings_path(cc: str, suffix: str = ".parquet") -> Path:
+    return PROCESSED_DIR / f"{cc.lower()}{suffix}"
+
+
+def to_booking_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce the known booking columns to BOOKING_DTYPES (others untouched)."""
+    df = df.copy()
+    for col in ENRICHMENT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df.astype({c: t for c, t in BOOKING_DTYPES.items() if c in df.columns})
+
+
+class BookingSink:
+    """
+    Append-only writer for data/processed/<cc>.parquet.
+
+        with BookingSink("mx") as sink:
+            for batch in batches:
+                sink.write(batch)
+
+    • Each write() becomes one parquet row group (and one CSV append when
+      exporting), so memory is bounded by the batch being written.
+    • Everything goes to <name>.tmp first; a clean exit renames the files
+      into place, an exception deletes them and leaves the old artifact.
+    • A sink that received no rows leaves the old artifact untouched too
+      (path is then None).
+    """
+
+    def __init__(self, cc: str, export_csv: bool | None = None):
+        if export_csv is None:
+            export_csv = os.getenv("ETL_EXPORT_CSV", "0") == "1"
+        self.path = bookings_path(cc)
+        self.csv_path = bookings_path(cc, ".csv") if export_csv else None
+        self.rows = 0
+        self._writer: pq.ParquetWriter | None = None
+        self._schema: pa.Schema | None = None
+
+    @staticmethod
+    def _tmp(fp: Path) -> Path:
+        return fp.with_name(fp.name + ".tmp")
+
+    def write(self, df: pd.DataFrame) -> None:
+        if df is None or df.empty:
+            return
+        df = to_booking_frame(df)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self._tmp(self.path), self._schema)
+        else:
+            # same column order / types as the first batch, or fail loudly
+            table = pa.Table.from_pandas(df[self._schema.names], schema=self._schema,
+                                         preserve_index=False)
+        self._writer.write_table(table)
+
+        if self.csv_path is not None:
+            df.to_csv(self._tmp(self.csv_path), index=False,
+                      mode="a" if self.rows else "w", header=not self.rows)
+        self.rows += len(df)
+
+    def close(self, ok: bool = True) -> Path | None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        outputs = [fp for fp in (self.path, self.csv_path) if fp is not None]
+        if ok and self.rows:
+            for fp in outputs:
+                os.replace(self._tmp(fp), fp)
+            return self.path
+        for fp in outputs:
+            self._tmp(fp).unlink(missing_ok=True)
+        self.path = None
+        return None
+
+    def __enter__(self) -> "BookingSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(ok=exc_type is None)
+
+
+def write_bookings(df: pd.DataFrame, cc: str, export_csv: bool | None = None) -> Path | None:
+    """Persist a country's bookings as parquet (+ CSV export if asked)."""
+    with BookingSink(cc, export_csv) as sink:
+        sink.write(df)
+    return sink.path
+
+
+def iter_booking_csv(path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Read a booking CSV (e.g. a city's booking_requests.csv) in typed batches."""
+    for chunk in pd.read_csv(path, dtype=_TEXT_COLUMNS, chunksize=chunk_rows):
+        yield to_booking_frame(chunk)
+
+
+def route_pairs_path(cc: str) -> Path:
+    return PROCESSED_DIR / f"{cc.lower()}_route_pairs.parquet"
+
+
+def write_route_pairs(df: pd.DataFrame, cc: str) -> Path:
+    """Persist a country's stop-pair table (write-then-rename)."""
+    out = route_pairs_path(cc)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    df[PAIR_COLUMNS].astype(PAIR_DTYPES).to_parquet(tmp, index=False)
+    os.replace(tmp, out)
+    return out
+
+
+def read_route_pairs(cc: str) -> pd.DataFrame:
+    """Stop-pair table, or an empty frame when no matrix enrichment ran."""
+    fp = route_pairs_path(cc)
+    if not fp.exists():
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in PAIR_DTYPES.items()})
+    return pd.read_parquet(fp, columns=PAIR_COLUMNS)
+
+
+def read_bookings(cc: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Load a country's bookings, reading only `columns` when given.
+
+    Enrichment columns that haven't been written yet come back as NaN so
+    callers don't need to special-case an un-enriched file.
+    """
+    fp = bookings_path(cc)
+    csv = bookings_path(cc, ".csv")
+    if not fp.exists() and not csv.exists():
+        raise FileNotFoundError(f"Missing bookings file: {fp}")
+
+    wanted = None if columns is None else list(columns)
+    if fp.exists():
+        present = set(pq.read_schema(fp).names)
+        read_cols = None if wanted is None else [c for c in wanted if c in present]
+        df = pd.read_parquet(fp, columns=read_cols)
+    else:
+        read_cols = None if wanted is None else (lambda c: c in wanted)
+        df = to_booking_frame(pd.read_csv(csv, usecols=read_cols, dtype=_TEXT_COLUMNS))
+
+    if wanted is not None:
+        missing = [c for c in wanted if c not in df.columns]
+        for col in missing:
+            if col not in ENRICHMENT_COLUMNS:
+                raise KeyError(f"{col!r} not in bookings for {cc}")
+            df[col] = pd.Series(float("nan"), index=df.index, dtype="float64")
+        df = df[wanted]
+    return df
@@ -0,0 +1,338 @@
+# ---------------------------------------------------------------------
+# Contraction hierarchy over a RoadGraph (pipelines/road_graph.py)
+# 1. build_ch()
+#    • Contracts nodes one at a time in order of importance (edge
+#      difference + already-contracted neighbours, lazily updated): a
+#      node's neighbours get a shortcut u–w unless a witness path no
+#      slower than u–v–w exists without it. Shortcuts carry both time and
+#      length, so a path's length is known without unpacking it.
+#    • Degree ≤ 2 nodes – most OSM shape points – skip the witness search
+#      (a shortcut unless an existing u–w edge is already as fast).
+#    • Witness searches are local (WITNESS_SETTLE nodes); a missed
+#      witness only costs an unnecessary shortcut, never a wrong answer.
+#    • Result: node ranks + the upward graph (edges to higher-ranked
+#      nodes) as CSR, which is all the queries need.
+#
+# 2. ContractionHierarchy.many_to_many()
+#    • Bucket query: every source and target runs one upward search
+#      (scipy's C Dijkstra on the upward graph – a few hundred nodes),
+#      targets leave (target, time, length) in a bucket per node they
+#      settle, and each source combines its own search space with those
+#      buckets. The graph is undirected, so the backward search of a
+#      target is the same upward search.
+#    • Upward-search entries that a higher neighbour reaches faster are
+#      dropped (stall-on-demand, applied after the search), which cuts
+#      the spaces several-fold.
+#    • The join runs over blocks of source rows: nodes in many target
+#      spaces (the top of the hierarchy) as one vectorized min per node,
+#      the rest through their (rows × bucket) cells.
+#
+# 3. load_city_ch()
+#    • Stage "ch" of the city manifest, keyed on the digest of the graph
+#      the ETL built (road_graph_build.py): tmp/<cc>/<city>_ch.npz. A
+#      cached hierarchy whose node count doesn't match the graph is
+#      rebuilt regardless.
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from pathlib import Path
+import heapq, os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from .road_graph import RoadGraph, graph_path, read_city_graph
+from .stage_cache import StageCache, stage_key
+
+# Bump when contraction or the stored layout changes
+CH_VERSION = 1
+
+WITNESS_SETTLE = 40       # nodes a witness search may settle
+SEARCH_BATCH = 64         # upward searches per scipy call
+JOIN_ROWS = 2048          # source rows per join block
+DENSE_SHARE = 0.05        # nodes in ≥ this share of target spaces join densely
+DENSE_FULL = 0.5          # …over the whole block once they cover this share of it
+
+
+def _witness(adj, source, skip, targets, limit) -> dict:
+    # bounded Dijkstra from source, avoiding `skip`, until every target is
+    # settled, the time exceeds `limit` or WITNESS_SETTLE nodes are done
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    left, settled = set(targets), 0
+    while heap and left and settled < WITNESS_SETTLE:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > limit:
+            break
+        settled += 1
+        left.discard(u)
+        for w, (t, _) in adj[u].items():
+            if w == skip:
+                continue
+            nd = d + t
+            if nd < dist.get(w, np.inf):
+                dist[w] = nd
+                heapq.heappush(heap, (nd, w))
+    return dist
+
+
+def _shortcuts(adj, v) -> list[tuple[int, int, float, float]]:
+    """(u, w, time, length) shortcuts contracting v would need."""
+    nbrs = list(adj[v].items())
+    out = []
+    if len(nbrs) <= 2:
+        if len(nbrs) == 2:
+            (u, (tu, lu)), (w, (tw, lw)) = nbrs
+            if adj[u].get(w, (np.inf,))[0] > tu + tw:
+                out.append((u, w, tu + tw, lu + lw))
+        return out
+
+    for i, (u, (tu, lu)) in enumerate(nbrs[:-1]):
+        rest = nbrs[i + 1:]
+        limit = tu + max(tw for _, (tw, _) in rest)
+        dist = _witness(adj, u, v, [w for w, _ in rest], limit)
+        for w, (tw, lw) in rest:
+            if dist.get(w, np.inf) > tu + tw:
+                out.append((u, w, tu + tw, lu + lw))
+    return out
+
+
+def build_ch(graph: RoadGraph) -> "ContractionHierarchy":
+    n = graph.n_nodes
+    adj: list[dict[int, tuple[float, float]]] = [dict() for _ in range(n)]
+    src = np.repeat(np.arange(n), np.diff(graph.indptr))
+    for u, w, t, l in zip(src.tolist(), graph.indices.tolist(),
+                          graph.time_s.tolist(), graph.length_m.tolist()):
+        adj[u][w] = (t, l)
+
+    deleted = np.zeros(n, dtype=np.int64)
+
+    def priority(v, shortcuts):
+        # edge difference + contracted neighbours (spreads contraction out)
+        return len(shortcuts) - len(adj[v]) + deleted[v]
+
+    heap = [(priority(v, _shortcuts(adj, v)), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.full(n, -1, dtype=np.int64)
+    up_u, up_w, up_t, up_l = [], [], [], []
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if rank[v] >= 0:
+            continue
+        # lazy update: re-evaluate, contract only if still the cheapest
+        shortcuts = _shortcuts(adj, v)
+        p = priority(v, shortcuts)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+
+        for w, (t, l) in adj[v].items():     # every remaining neighbour ranks higher
+            up_u.append(v); up_w.append(w); up_t.append(t); up_l.append(l)
+            del adj[w][v]
+            deleted[w] += 1
+        for u, w, t, l in shortcuts:
+            if adj[u].get(w, (np.inf,))[0] > t:
+                adj[u][w] = adj[w][u] = (t, l)
+        adj[v] = {}
+        rank[v] = order
+        order += 1
+
+    u, w = np.asarray(up_u, dtype=np.int64), np.asarray(up_w, dtype=np.int64)
+    t, l = np.asarray(up_t, dtype=float), np.asarray(up_l, dtype=float)
+    srt = np.lexsort((w, u))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=n))])
+    return ContractionHierarchy(rank, indptr, w[srt].astype(np.int32), t[srt], l[srt])
+
+
+class ContractionHierarchy:
+
+    def __init__(self, rank, indptr, indices, time_s, length_m):
+        self.rank = np.asarray(rank)
+        self.indptr, self.indices = np.asarray(indptr), np.asarray(indices)
+        self.time_s, self.length_m = np.asarray(time_s), np.asarray(length_m)
+        n = len(self.rank)
+        self.up = csr_matrix((self.time_s, self.indices, self.indptr), shape=(n, n))
+        self._keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr)) * n + self.indices
+
+    @property
+    def n_shortcuts(self) -> int:
+        return len(self.indices)
+
+    # -----------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------
+    def search_spaces(self, nodes) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Upward search of every node id (-1 = none) → flat entries
+        (query index, settled node, time, length), sorted by node.
+        """
+        nodes = np.asarray(nodes, dtype=np.intp)
+        n = len(self.rank)
+        parts = []
+        ok = np.flatnonzero(nodes >= 0)
+        for b0 in range(0, len(ok), SEARCH_BATCH):
+            q = ok[b0:b0 + SEARCH_BATCH]
+            times, preds = dijkstra(self.up, directed=True, indices=nodes[q],
+                                    return_predecessors=True)
+            j, v = np.nonzero(np.isfinite(times))
+
+            # stall-on-demand, after the fact: v is reached faster through a
+            # higher neighbour w (down the edge w–v) → its upward time is not
+            # its distance and it can never be the meeting node of a shortest
+            # path. Dropping such entries shrinks the join quadratically.
+            deg = np.diff(self.indptr)[v]
+            e = np.repeat(self.indptr[v], deg) + (np.arange(deg.sum()) - np.repeat(np.cumsum(deg) - deg, deg))
+            via = times[np.repeat(j, deg), self.indices[e]] + self.time_s[e]
+            best = np.full(len(j), np.inf)
+            np.minimum.at(best, np.repeat(np.arange(len(j)), deg), via)
+            keep = best >= times[j, v]
+            j, v = j[keep], v[keep]
+
+            # length of each upward path: walk back to its start
+            src = nodes[q][j]
+            length = np.zeros(len(j))
+            cur = v.copy()
+            live = np.flatnonzero(cur != src)
+            while len(live):
+                c = cur[live]
+                p = preds[j[live], c]
+                length[live] += self.length_m[np.searchsorted(self._keys, p.astype(np.int64) * n + c)]
+                cur[live] = p
+                live = live[p != src[live]]
+            parts.append((q[j], v, times[j, v], length))
+        if not parts:
+            return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+                    np.empty(0), np.empty(0))
+        qi, v, t, l = (np.concatenate(x) for x in zip(*parts))
+        order = np.argsort(v, kind="stable")
+        return qi[order], v[order], t[order], l[order]
+
+    def many_to_many(self, sources, targets, out=None, dtype=np.float32):
+        """
+        (length_m, time_s) tables len(sources) × len(targets) between
+        node ids, NaN where a node is -1 or unreachable. `out` may pass
+        two preallocated arrays (e.g. np.memmaps) to fill instead.
+        """
+        S, T = len(sources), len(targets)
+        length, time_s = out if out is not None else (np.empty((S, T), dtype), np.empty((S, T), dtype))
+        s_q, s_v, s_t, s_l = self.search_spaces(sources)
+        if targets is sources:      # stop × stop tables: one set of searches
+            t_q, t_v, t_t, t_l = s_q, s_v, s_t, s_l
+        else:
+            t_q, t_v, t_t, t_l = self.search_spaces(targets)
+
+        # buckets: target entries grouped by node
+        t_nodes, t_start, t_count = np.unique(t_v, return_index=True, return_counts=True)
+        t_end = t_start + t_count
+
+        # nodes high enough to sit in many targets' spaces are joined densely:
+        # one contiguous (rows × T) min per node instead of scattered cells
+        dense = t_count >= max(1, T * DENSE_SHARE)
+        d_nodes = t_nodes[dense]
+        d_of = np.full(len(self.rank), -1)
+        d_of[d_nodes] = np.arange(len(d_nodes))
+        Bt = np.full((len(d_nodes), T), np.inf, dtype=np.float32)
+        Bl = np.zeros((len(d_nodes), T), dtype=np.float32)
+        sel = d_of[t_v] >= 0
+        Bt[d_of[t_v[sel]], t_q[sel]] = t_t[sel]
+        Bl[d_of[t_v[sel]], t_q[sel]] = t_l[sel]
+        d_cols = [np.flatnonzero(np.isfinite(row)) for row in Bt]
+
+        for r0 in range(0, max(S, 1), JOIN_ROWS):
+            r1 = min(S, r0 + JOIN_ROWS)
+            best_t = np.full((r1 - r0, T), np.inf)
+            best_l = np.full((r1 - r0, T), np.nan)
+            keep = (s_q >= r0) & (s_q < r1)
+            bq, bv, bt, bl = s_q[keep] - r0, s_v[keep], s_t[keep], s_l[keep]
+
+            # sparse part: meeting nodes below the dense set
+            b_nodes, b_start = np.unique(bv, return_index=True)
+            b_end = np.append(b_start[1:], len(bv))
+            hit = np.searchsorted(t_nodes, b_nodes)
+            hit[hit == len(t_nodes)] = 0
+            meet = (t_nodes[hit] == b_nodes) & ~dense[hit]
+            for i in np.flatnonzero(meet):
+                a = slice(b_start[i], b_end[i])
+                b = slice(t_start[hit[i]], t_end[hit[i]])
+                rows, cols = bq[a, None], t_q[None, b]
+                cand = bt[a, None] + t_t[None, b]
+                cur = best_t[rows, cols]
+                better = cand < cur
+                if not better.any():
+                    continue
+                best_t[rows, cols] = np.where(better, cand, cur)
+                best_l[rows, cols] = np.where(better, bl[a, None] + t_l[None, b], best_l[rows, cols])
+
+            # dense part: remember which dense node wins, lengths at the end
+            if len(d_nodes):
+                Ft = np.full((r1 - r0, len(d_nodes)), np.inf, dtype=np.float32)
+                Fl = np.zeros((r1 - r0, len(d_nodes)), dtype=np.float32)
+                sel = d_of[bv] >= 0
+                Ft[bq[sel], d_of[bv[sel]]] = bt[sel]
+                Fl[bq[sel], d_of[bv[sel]]] = bl[sel]
+                win = np.full((r1 - r0, T), -1, dtype=np.int32)
+                best32 = best_t.astype(np.float32)
+                cand = np.empty_like(best32)
+                better = np.empty(best32.shape, dtype=bool)
+                for k in np.flatnonzero(np.isfinite(Ft).any(axis=0)):
+                    rows = np.flatnonzero(np.isfinite(Ft[:, k]))
+                    cols = d_cols[k]
+                    if len(rows) * len(cols) > DENSE_FULL * best32.size:
+                        np.add(Ft[:, k, None], Bt[k], out=cand)
+                        np.less(cand, best32, out=better)
+                        np.copyto(best32, cand, where=better)
+                        np.copyto(win, k, where=better)
+                        continue
+                    # only the rows / targets that reach k
+                    ix = np.ix_(rows, cols)
+                    sub, sub_win = best32[ix], win[ix]
+                    c = Ft[rows, k, None] + Bt[k, cols]
+                    m = c < sub
+                    best32[ix] = np.where(m, c, sub)
+                    win[ix] = np.where(m, k, sub_win)
+                r, c = np.nonzero(win >= 0)
+                k = win[r, c]
+                best_t[r, c] = best32[r, c]
+                best_l[r, c] = Fl[r, k] + Bl[k, c]
+
+            best_t[~np.isfinite(best_t)] = np.nan
+            time_s[r0:r1], length[r0:r1] = best_t, best_l
+        return length, time_s
+
+    # -----------------------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------------------
+    def save(self, path: Path) -> None:
+        tmp = Path(path).with_suffix(".tmp.npz")
+        np.savez(tmp, rank=self.rank, indptr=self.indptr, indices=self.indices,
+                 time_s=self.time_s, length_m=self.length_m)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ContractionHierarchy":
+        with np.load(path) as z:
+            return cls(z["rank"], z["indptr"], z["indices"], z["time_s"], z["length_m"])
+
+
+def load_city_ch(cc: str, city: str, root: Path = Path("tmp")) -> tuple[RoadGraph, ContractionHierarchy] | None:
+    """(graph, hierarchy) of a city, contracted once and cached; None without a graph."""
+    graph = read_city_graph(cc, city, root)
+    if graph is None:
+        return None
+    base = Path(root) / cc
+    out = base / f"{city}_ch.npz"
+    cache = StageCache(base / f"{city}_manifest.json")
+    key = stage_key(cache.digest(graph_path(cc, city, root)), CH_VERSION, WITNESS_SETTLE)
+    if cache.fresh("ch", key, out):
+        ch = ContractionHierarchy.load(out)
+        if len(ch.rank) == graph.n_nodes:
+            return graph, ch
+
+    ch = build_ch(graph)
+    ch.save(out)
+    cache.record("ch", key, out)
+    return graph, ch
@@ -5,39 +5,375 @@
 #   ColombiaPipeline, etc.) inherit this class and simply override
 #   the parts that differ
 # --------------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import os, random
+import geopandas as gpd
+import numpy as np
 import pandas as pd
 
+from .artifacts import BookingSink, iter_booking_csv
+from .instrumentation import RunReport
+from .process_helper import (
+    BOOKING_CHUNK_ROWS, NUM_BOOKINGS, clip_osm_extracts, generate_bookings, read_gtfs_stops,
+)
+from .road_network import (
+    CLASSIFIER_VERSION, ROAD_CACHE_VERSION, SNAP_DISTANCE_M,
+    assign_tiles, make_tiles, read_osm_roads, snap_stops,
+)
+from .road_graph_build import build_city_graph
+from .stage_cache import StageCache, stage_key
+from .stop_dedup import STOP_DEDUP_RADIUS_M, dedup_stops
+
+
+def _run_task(func, item, name, city):
+    # Pool-side wrapper: run one city / tile under a fresh report and ship
+    # its spans back with the result (the worker's report is a pickled copy)
+    report = func.__self__.report
+    report.spans = []
+    with report.span(name, city=city):
+        result = func(item)
+    return result, report.spans
+
 
 class ETLPipeline:
 
-    def __init__(self, country_code: str):
-        # Used only for naming the final CSV (data/processed/<cc>.csv)
+    # -----------------------------------------------------------------
+    # Set by every country subclass
+    #   CITY_META: {city code: (list_of_zip_files, BBOX (W,S,E,N), booking-tag)}
+    #   RAW_PBF:   national OSM extract; RAW_ROOT: folder holding the GTFS zips
+    #   TRUCK_CLASSES: road classes kept in the filtered stop file
+    #   HIGHWAYS: highway tags considered drivable
+    # -----------------------------------------------------------------
+    CITY_META: dict[str, tuple[list[str], tuple[float, float, float, float], str]] = {}
+    RAW_PBF: Path
+    RAW_ROOT: Path
+    TRUCK_CLASSES: set[str] = set()
+    HIGHWAYS: list[str] = []
+
+    # Cities too large to load in one piece → {city code: tile size in
+    # degrees}; their roads + snapping run tile by tile (snap_tiled)
+    TILED_CITIES: dict[str, float] = {}
+
+    def __init__(self, country_code: str, workers: int | None = None):
+        # Used only for naming the final artifact (data/processed/<cc>.parquet)
         self.country = country_code
+        # Max processes for per-city work (1 = run cities one after another)
+        self.workers = workers or int(os.getenv("ETL_WORKERS", "1"))
+        # Max processes per tiled city (multiplies with `workers` when
+        # several cities run at once)
+        self.tile_workers = int(os.getenv("TILE_WORKERS", self.workers))
+        # Stops within this many metres collapse to one ID (0 = keep all)
+        self.stop_dedup_m = float(os.getenv("STOP_DEDUP_M", STOP_DEDUP_RADIUS_M))
+        # Synthetic bookings per city and their RNG seed (None = random)
+        self.num_bookings = int(os.getenv("NUM_BOOKINGS", NUM_BOOKINGS))
+        seed = os.getenv("BOOKING_SEED")
+        self.booking_seed = int(seed) if seed else None
+        # Wall / CPU / peak-RSS spans for this run (see instrumentation.py)
+        self.report = RunReport(country_code)
+        # Working folder for every city: tmp/<cc>/<city>/, clips, caches
+        self.tmp = Path("tmp") / country_code
+        self.tmp.mkdir(parents=True, exist_ok=True)
+
+    # Open a timed span; subclasses nest their own inside transform() etc.
+    #    with self.span("snap", city=code): ...
+    def span(self, name: str, city: str | None = None):
+        return self.report.span(name, city)
 
     # 1) Extract
-    #    • Download, unzip, or otherwise collect raw data.
-    #    • Must return something that the next step can work with. 
-    def extract(self):
-        raise NotImplementedError   # forces child class to implement
+    #    • Fingerprint every city's GTFS zips (stage "gtfs"); stops are
+    #      streamed straight out of the zips in transform(), nothing is
+    #      unzipped
+    #    • Clip every stale city out of the national PBF (clip_cities)
+    def extract(self) -> None:
+        for code, (zip_list, _, _) in self.CITY_META.items():
+            cache = self.stage_cache(code)
+            (self.tmp / code).mkdir(exist_ok=True)
+
+            gtfs_key = stage_key([cache.digest(self.RAW_ROOT / z) for z in zip_list])
+            if cache.key_of("gtfs") != gtfs_key:
+                cache.record("gtfs", gtfs_key)
+
+        self.clip_cities()
 
     # 2) Transform
-    #    • Clean / filter / enrich the data produced by extract().
-    def transform(self, df):
-        return df
+    #    • Per city, stage by stage (each skipped while its inputs are
+    #      unchanged, see stage_cache.py):
+    #        GTFS stops → dedup → roads → snap → stops_truck_only.csv
+    #        → booking_requests.csv
+    #      plus the city's routing graph from its road cache(s)
+    #      (<city>_graph.npz, stage "graph") – enrichment, the stop tables
+    #      and the booking API only ever load it
+    #    • Cities are independent → fanned out over ETL_WORKERS processes;
+    #      workers hand back file paths, not frames
+    #    • Returns every city's finished booking_requests.csv (CITY_META
+    #      order) – all the work is done here, load() only streams them
+    def transform(self, _) -> list[Path]:
+        paths = self.map_cities(self._transform_city, self.CITY_META)
+        city_files = [fp for fp in paths if fp is not None]
+        if city_files:
+            return city_files
+
+        # If we reach here something went wrong upstream
+        raise RuntimeError("No cities processed")
+
+    def _transform_city(self, code: str) -> Path | None:
+        _, _, tag = self.CITY_META[code]
+        city_dir = self.tmp / code
+        cache = self.stage_cache(code)
+
+        # Stage keys chain on what extract() recorded:
+        #   clip → roads ┐
+        #   gtfs ────────┴→ stops → bookings
+        roads_key = stage_key(
+            cache.key_of("clip"), self.HIGHWAYS, CLASSIFIER_VERSION, ROAD_CACHE_VERSION,
+        )
+        stops_key = stage_key(
+            cache.key_of("gtfs"), roads_key, sorted(self.TRUCK_CLASSES), SNAP_DISTANCE_M,
+            self.TILED_CITIES.get(code), self.stop_dedup_m,
+        )
+        bookings_key = stage_key(stops_key, self.num_bookings, self.booking_seed)
+
+        out_stops = city_dir / "stops_truck_only.csv"
+        out_aliases = city_dir / "stop_aliases.csv"
+        out_bookings = city_dir / "booking_requests.csv"
+
+        # Nothing upstream changed → reuse the previous run's bookings
+        if cache.fresh("bookings", bookings_key, out_bookings, out_stops):
+            print(f"{code.upper()}: inputs unchanged – cached bookings reused", flush=True)
+            self._build_graph(code, cache)
+            return out_bookings
+
+        if cache.fresh("stops", stops_key, out_stops, out_aliases):
+            n_stops = len(pd.read_csv(out_stops, usecols=["stop_id"]))
+        else:
+            filtered = self._filter_stops(code, cache, roads_key)
+            if filtered is None:
+                return None
+
+            # Persist filtered stops for re‑runs
+            out_stops.write_bytes(filtered.to_csv(index=False).encode())
+            cache.record("stops", stops_key, out_stops, out_aliases)
+            n_stops = len(filtered)
+        self._build_graph(code, cache)
+
+        # Synthetic bookings
+        with self.span("bookings"):
+            n_bookings = generate_bookings(city_dir, tag, self.num_bookings,
+                                           seed=self.booking_seed)
+        cache.record("bookings", bookings_key, out_bookings)
+
+        print(f"{code.upper()}: {n_stops} stops, {n_bookings} bookings", flush=True)
+        return out_bookings if n_bookings else None
+
+    # Routing graph of one city, rebuilt only when its road cache changed
+    def _build_graph(self, code: str, cache: StageCache) -> None:
+        with self.span("graph"):
+            graph = build_city_graph(self.country, code, self.tmp.parent, cache)
+        if graph is not None:
+            print(f"{code.upper()}: road graph {graph.n_nodes} nodes, "
+                  f"{graph.n_edges} edges", flush=True)
+
+    # Stops of one city that a truck can reach
+    #    • GTFS stops → dedup (stop_aliases.csv) → roads → snap
+    #    • The road cache is its own stage ("roads"), keyed on the clip,
+    #      HIGHWAYS and the classifier, so a stops-only change (feeds,
+    #      dedup radius) never re-parses the PBF
+    def _filter_stops(self, code: str, cache: StageCache, roads_key: str) -> pd.DataFrame | None:
+        # 1) load GTFS stops straight from the zip archives
+        zip_list = self.CITY_META[code][0]
+        with self.span("gtfs_stops"):
+            df = read_gtfs_stops([self.RAW_ROOT / z for z in zip_list])
+        if df is None:
+            print(f"{code.upper()}: no stops.txt – skipped", flush=True)
+            return None
+
+        # Same physical stop in several feeds → one canonical ID
+        # (aliases kept for anything still holding the old IDs)
+        with self.span("dedup"):
+            df, aliases = dedup_stops(df, self.stop_dedup_m)
+        aliases.to_csv(self.tmp / code / "stop_aliases.csv", index=False)
+        if len(aliases):
+            print(f"{code.upper()}: merged {len(aliases)} co-located stops", flush=True)
+
+        # Very large bboxes: roads + snapping tile by tile (snap_tiled)
+        if code in self.TILED_CITIES:
+            with self.span("tiles"):
+                return self.snap_tiled(code, df, cache, roads_key)
+
+        # 2) road network cache: drivable, classified, projected edges
+        #    (rebuilt when the clip, HIGHWAYS or classifier change)
+        clip = self.tmp / f"{code}_clip.osm.pbf"
+        cache_fp = self.tmp / f"{code}_roads.parquet"
+
+        with self.span("roads"):
+            if cache.fresh("roads", roads_key, cache_fp):
+                # warm run: no classification, only what snapping needs
+                roads = gpd.read_parquet(cache_fp, columns=["classify_truck", "geometry"])
+            else:
+                with self.span("pyrosm"):
+                    roads = read_osm_roads(clip, self.HIGHWAYS)
+                roads.to_parquet(cache_fp)
+                cache.record("roads", roads_key, cache_fp)
+
+        # 3) snap each stop to its nearest truck-accessible edge (≤70 m)
+        with self.span("snap"):
+            return snap_stops(df, roads, self.TRUCK_CLASSES)
 
     # 3) Load
     #    • Persist the final DataFrame to output
     #    • The base class handles folder creation & logging so every
     #      pipeline gets a uniform output location.
+    #    • Typed parquet (see artifacts.py); <cc>.csv only if exported
+    #    • Accepts one DataFrame, any iterable of DataFrame batches, or
+    #      the list of per-city booking files transform() returns (read
+    #      BOOKING_CHUNK_ROWS at a time); batches are appended as they
+    #      arrive and the file is swapped in only after the last one
     def load(self, df):
-        out = Path(f"data/processed/{self.country}.csv")
-        out.parent.mkdir(parents=True, exist_ok=True)
-        df.to_csv(out, index=False)
-        print(f"Saved output → {out}")
+        if isinstance(df, pd.DataFrame):
+            batches = [df]
+        elif isinstance(df, list) and all(isinstance(fp, Path) for fp in df):
+            batches = self.iter_city_bookings(df)
+        else:
+            batches = df
+        with BookingSink(self.country) as sink:
+            for batch in batches:
+                sink.write(batch)
+        if sink.path is None:
+            raise RuntimeError(f"[{self.country}] no bookings to load")
+        print(f"Saved output → {sink.path} ({sink.rows} rows)")
+
+    # Stream per-city booking files in the given order, one batch at a
+    # time, so load() never holds more than BOOKING_CHUNK_ROWS rows
+    def iter_city_bookings(self, paths):
+        for fp in paths:
+            yield from iter_booking_csv(fp, BOOKING_CHUNK_ROWS)
+
+    # Per-city fan-out used by transform()
+    #    • Cities only touch their own tmp/<cc>/<city> folder, so they can
+    #      run in separate processes.
+    #    • Results always come back in the order of `cities`, whatever
+    #      order the workers finish in, so the combined output is stable.
+    def map_cities(self, func, cities) -> list:
+        cities = list(cities)
+        return self._fan_out(func, cities, cities, "city", self.workers)
+
+    def _fan_out(self, func, items, cities, span: str, workers: int) -> list:
+        n = min(workers, len(items))
+        if n <= 1:
+            results = []
+            for item, city in zip(items, cities):
+                with self.span(span, city=city):
+                    results.append(func(item))
+            return results
+
+        print(f"[{self.country}] running {len(items)} {span} jobs on {n} workers", flush=True)
+        # random.seed() re-seeds every forked worker from os.urandom so
+        # cities don't all inherit (and replay) the parent's RNG state
+        with ProcessPoolExecutor(max_workers=n, initializer=random.seed) as pool:
+            done = list(pool.map(_run_task, [func] * len(items), items,
+                                 [span] * len(items), cities))
+
+        for _, spans in done:
+            self.report.spans.extend(spans)
+        return [result for result, _ in done]
+
+    # OSM clipping – all stale cities in a single osmium pass
+    #    • Redone only when the PBF contents or a city's bbox change
+    #      (stage "clip", output tmp/<cc>/<city>_clip.osm.pbf)
+    def clip_cities(self) -> float:
+        stale = {}
+        for code, (_, bbox, _) in self.CITY_META.items():
+            cache = self.stage_cache(code)
+            clip = self.tmp / f"{code}_clip.osm.pbf"
+            clip_key = stage_key(cache.digest(self.RAW_PBF), bbox)
+            if not cache.fresh("clip", clip_key, clip):
+                stale[code] = (cache, clip_key, clip, bbox)
+
+        if not stale:
+            print(f"[{self.country}] all city clips up to date", flush=True)
+            return 0.0
+
+        with self.span("clip"):
+            elapsed = clip_osm_extracts(
+                self.RAW_PBF, {clip: bbox for _, _, clip, bbox in stale.values()})
+        for cache, clip_key, clip, _ in stale.values():
+            cache.record("clip", clip_key, clip)
+        return elapsed
+
+    # Tiled roads + snapping for a city in TILED_CITIES
+    #    • The bbox is cut into make_tiles() squares; only tiles that hold
+    #      stops are touched at all.
+    #    • Stale tiles are clipped out of <city>_clip.osm.pbf in one
+    #      osmium pass, parsed, classified and cached as
+    #      <city>_tiles/<i>_roads.parquet (stage "roads_tile_<i>").
+    #    • Each tile snaps only the stops in its core against the roads of
+    #      its padded bbox, so memory is one tile's roads, tiles can run
+    #      in TILE_WORKERS processes, and every stop is decided exactly
+    #      once – no cross-tile merge beyond restoring input order.
+    def snap_tiled(self, code: str, stops: pd.DataFrame, cache: StageCache,
+                   roads_key: str) -> pd.DataFrame:
+        bbox, tile_deg = self.CITY_META[code][1], self.TILED_CITIES[code]
+        tiles = make_tiles(bbox, tile_deg)
+        owner = assign_tiles(stops, bbox, tile_deg)
+        tile_dir = self.tmp / f"{code}_tiles"
+        tile_dir.mkdir(exist_ok=True)
+
+        jobs, stale = [], {}
+        for i in np.unique(owner):
+            padded = tiles[i][1]
+            key = stage_key(roads_key, padded)
+            roads_fp = tile_dir / f"{i}_roads.parquet"
+            pbf = None
+            if not cache.fresh(f"roads_tile_{i}", key, roads_fp):
+                pbf = tile_dir / f"{i}.osm.pbf"
+                stale[pbf] = padded
+            jobs.append((i, key, roads_fp, pbf, stops[owner == i]))
+
+        print(f"{code.upper()}: {len(jobs)}/{len(tiles)} tiles hold stops, "
+              f"{len(stale)} to rebuild", flush=True)
+        if stale:
+            with self.span("clip_tiles"):
+                clip_osm_extracts(self.tmp / f"{code}_clip.osm.pbf", stale)
+
+        snapped = self._fan_out(self._snap_tile, jobs, [code] * len(jobs),
+                                "tile", self.tile_workers)
+
+        for i, key, roads_fp, pbf, _ in jobs:
+            if pbf is not None:
+                cache.record(f"roads_tile_{i}", key, roads_fp)
+                pbf.unlink(missing_ok=True)
+
+        if not snapped:
+            return stops.iloc[:0].assign(classify_truck=pd.Series(dtype=object))
+        return pd.concat(snapped).sort_index(kind="stable").drop_duplicates("stop_id")
+
+    def _snap_tile(self, job) -> pd.DataFrame:
+        _, _, roads_fp, pbf, stops = job
+        if pbf is None:
+            roads = gpd.read_parquet(roads_fp, columns=["classify_truck", "geometry"])
+        else:
+            roads = read_osm_roads(pbf, self.HIGHWAYS)
+            roads.to_parquet(roads_fp)
+        return snap_stops(stops, roads, self.TRUCK_CLASSES)
+
+    # Per-city manifest of what each cached stage was built from
+    #    • tmp/<cc>/<city>_manifest.json, see stage_cache.py
+    def stage_cache(self, city: str) -> StageCache:
+        return StageCache(Path("tmp") / self.country / f"{city}_manifest.json")
 
     # Convenience wrapper: run the full ETL in order, called by run_etl.py
+    #    • Each step is timed; the report lands in data/processed/run_reports/
+    #        extract   – GTFS fingerprints + OSM clips
+    #        transform – per-city stops and booking generation (files on disk)
+    #        load      – reading those files into data/processed/<cc>.parquet
     def run(self):
-        df = self.extract()       # E
-        df = self.transform(df)   # T
-        self.load(df)             # L
+        self.report = RunReport(self.country)
+        with self.span("run"):
+            with self.span("extract"):
+                df = self.extract()       # E
+            with self.span("transform"):
+                df = self.transform(df)   # T
+            with self.span("load"):
+                self.load(df)             # L
+        print(f"Run report → {self.report.write()}", flush=True)
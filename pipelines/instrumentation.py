@@ -0,0 +1,129 @@
+# ---------------------------------------------------------------------
+# Run instrumentation for ETL pipelines
+# • RunReport.span(name, city) is a context manager that records, for
+#   the block it wraps:
+#     wall_s            – elapsed wall-clock time
+#     cpu_s             – CPU time of this process + any subprocesses it
+#                         waited on (osmium)
+#     peak_rss_mb       – highest RSS of this process while the span was
+#                         open (not the run-wide high-water mark)
+#     rss_growth_mb     – peak_rss_mb minus the RSS the span started at,
+#                         i.e. the extra memory this block needed
+#     child_peak_rss_mb – largest RSS of a subprocess waited on inside the
+#                         span, null when none beat the earlier ones
+# • Per-span peaks come from resetting the kernel's high-water mark
+#   (/proc/self/clear_refs) when a span opens; a closing span folds its
+#   peak into its parent's. Where that isn't available (macOS) the peak
+#   is only reported for spans that raised the process high-water mark.
+# • Spans nest: a span opened inside another records its parent, and
+#   inherits the parent's city when none is given.
+# • Spans recorded in process-pool workers are shipped back and merged
+#   by ETLPipeline.map_cities().
+# • write() dumps everything to data/processed/run_reports/<cc>_<ts>.json
+# ---------------------------------------------------------------------
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import json, os, resource, sys, time
+
+REPORT_DIR = Path("data/processed/run_reports")
+
+# ru_maxrss is KiB on Linux, bytes on macOS
+_RSS_UNIT = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+
+def _usage(who) -> resource.struct_rusage:
+    return resource.getrusage(who)
+
+
+def _mb(maxrss: int) -> float:
+    return round(maxrss * _RSS_UNIT / 2**20, 1)
+
+
+def _proc_rss() -> tuple[float, float] | None:
+    # (current, high-water) RSS in MiB from /proc, None off Linux
+    try:
+        with open("/proc/self/status") as f:
+            kb = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+        return (round(int(kb["VmRSS"].split()[0]) / 1024, 1),
+                round(int(kb["VmHWM"].split()[0]) / 1024, 1))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak() -> bool:
+    # drop the kernel's RSS high-water mark to the current RSS (Linux ≥ 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class RunReport:
+
+    def __init__(self, country: str):
+        self.country = country
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: list[dict] = []
+        self._stack: list[dict] = []
+
+    @contextmanager
+    def span(self, name: str, city: str | None = None):
+        parent = self._stack[-1] if self._stack else None
+        record = {
+            "name": name,
+            "city": city or (parent or {}).get("city"),
+            "parent": (parent or {}).get("name"),
+            "pid": os.getpid(),
+        }
+        me, kids = _usage(resource.RUSAGE_SELF), _usage(resource.RUSAGE_CHILDREN)
+        wall0, maxrss0, kids0 = time.perf_counter(), me.ru_maxrss, kids.ru_maxrss
+        cpu0 = me.ru_utime + me.ru_stime + kids.ru_utime + kids.ru_stime
+
+        # the enclosing span keeps the peak it reached so far before we reset
+        rss = _proc_rss()
+        if rss and parent is not None:
+            parent["_peak"] = max(parent.get("_peak", 0.0), rss[1])
+        per_span = rss is not None and _reset_peak()
+        rss0 = rss[0] if per_span else _mb(maxrss0)
+
+        self._stack.append(record)
+        try:
+            yield record
+        finally:
+            self._stack.pop()
+            me, kids = _usage(resource.RUSAGE_SELF), _usage(resource.RUSAGE_CHILDREN)
+            rss = _proc_rss() if per_span else None
+            if rss:
+                peak = max(record.pop("_peak", 0.0), rss[1])
+                if parent is not None:
+                    parent["_peak"] = max(parent.get("_peak", 0.0), peak)
+            else:   # no reset: only a span that raised the high-water mark knows its peak
+                record.pop("_peak", None)
+                peak = _mb(me.ru_maxrss) if me.ru_maxrss > maxrss0 else None
+            record.update({
+                "wall_s": round(time.perf_counter() - wall0, 3),
+                "cpu_s": round(me.ru_utime + me.ru_stime
+                               + kids.ru_utime + kids.ru_stime - cpu0, 3),
+                "peak_rss_mb": peak,
+                "rss_growth_mb": None if peak is None else round(max(peak - rss0, 0.0), 1),
+                "child_peak_rss_mb": _mb(kids.ru_maxrss) if kids.ru_maxrss > kids0 else None,
+            })
+            self.spans.append(record)
+
+    def to_dict(self) -> dict:
+        return {
+            "country": self.country,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "spans": self.spans,
+        }
+
+    def write(self, out_dir: Path = REPORT_DIR) -> Path:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%dT%H%M%SZ")
+        out = out_dir / f"{self.country}_{stamp}.json"
+        out.write_text(json.dumps(self.to_dict(), indent=2))
+        return out
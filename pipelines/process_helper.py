@@ -1,116 +1,214 @@
 # ---------------------------------------------------------------------
 # Shared utilities
-# 1. extract_gtfs_feeds()
-#    • Unzips one or more GTFS feeds into tmp/<country>/<city>/.
+# 1. read_gtfs_stops()
+#    • Streams only the stops*.txt members out of a city's GTFS zips
+#      (no extraction of stop_times.txt / shapes.txt to disk).
 #
-# 2. generate_bookings()
-#    • Creates synthetic jobs for a city.
+# 2. clip_osm_extracts()
+#    • Clips every city of a country out of the national PBF in a single
+#      osmium pass (multi-extract config) instead of one pass per city.
+#
+# 3. generate_bookings() / iter_bookings()
+#    • Creates synthetic jobs for a city, drawn as NumPy arrays in
+#      batches (deterministic for a given seed).
 #    • Uses classify_truck info (if present) to pick the smallest
 #      vehicle that can serve both stops.
 #    • Falls back to "small" when a stop has no class tag 
 # ---------------------------------------------------------------------
 
-from pathlib import Path
-import zipfile
-import os, random, pandas as pd
-from datetime import datetime, timedelta
+from collections.abc import Iterator
+from pathlib import Path, PurePosixPath
+import json, os, subprocess, tempfile, time, zipfile, zlib
+import numpy as np, pandas as pd
+
+
+# Only the stop columns the pipelines use, with explicit dtypes
+# (stop_id stays a string – feeds mix numeric and alphanumeric IDs)
+GTFS_STOP_COLUMNS = {
+    "stop_id":   "string",
+    "stop_name": "string",
+    "stop_lat":  "float64",
+    "stop_lon":  "float64",
+}
 
 
-def extract_gtfs_feeds(feeds: dict[str, str], raw_root: Path, work_root: Path) -> None:
+def _is_stops_member(name: str) -> bool:
+    # stops.txt or stops-<part>.txt, at any depth inside the archive
+    base = PurePosixPath(name).name
+    return base == "stops.txt" or (base.startswith("stops-") and base.endswith(".txt"))
 
-    work_root.mkdir(parents=True, exist_ok=True)
 
-    for city, zip_name in feeds.items():
-        zip_path = raw_root / zip_name          # full path to archive
-        city_dir = work_root / city             # where we will unzip
+def read_gtfs_stops(zip_paths: list[Path]) -> pd.DataFrame | None:
+    """
+    Read every stops member of a city's GTFS zips straight from the archives.
 
+    Returns one DataFrame with GTFS_STOP_COLUMNS, or None when no archive
+    (or no stops member) was found.
+    """
+    frames = []
+    for zip_path in zip_paths:
         if not zip_path.exists():
-            print(f"{zip_name} not found in {raw_root}", flush=True)
+            print(f"{zip_path.name} not found in {zip_path.parent}", flush=True)
             continue
 
-        city_dir.mkdir(exist_ok=True)
         with zipfile.ZipFile(zip_path) as z:
-            z.extractall(city_dir)
-
-        print(f"{city.upper()} extracted → {city_dir}")
-        print("   Files:", ", ".join(os.listdir(city_dir)))
+            members = [m for m in z.namelist() if _is_stops_member(m)]
+            for member in members:
+                with z.open(member) as fh:
+                    frames.append(pd.read_csv(
+                        fh,
+                        encoding="utf-8-sig",           # many feeds ship a BOM
+                        usecols=lambda c: c in GTFS_STOP_COLUMNS,
+                        dtype=GTFS_STOP_COLUMNS,
+                    ))
+
+        print(f"{zip_path.name}: read {', '.join(members) or 'no stops file'}", flush=True)
+
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+
+def clip_osm_extracts(raw_pbf: Path, extracts: dict[Path, tuple]) -> float:
+    """
+    Write every {output_path: (W, S, E, N)} clip of raw_pbf in one read.
+
+    osmium's --config mode decodes the source once and feeds all bboxes
+    at the same time. Returns the elapsed seconds.
+    """
+    if not extracts:
+        return 0.0
+
+    config = {"extracts": [
+        {"output": str(Path(out).resolve()), "bbox": list(bbox)}
+        for out, bbox in extracts.items()
+    ]}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+        json.dump(config, fh)
+        config_path = Path(fh.name)
+
+    t0 = time.perf_counter()
+    try:
+        subprocess.run(
+            ["osmium", "extract", "--overwrite",
+             "--config", str(config_path), str(raw_pbf)],
+            check=True,
+        )
+    finally:
+        config_path.unlink(missing_ok=True)
+    elapsed = time.perf_counter() - t0
 
+    print(f"{raw_pbf.name}: clipped {len(extracts)} extract(s) in one pass "
+          f"({elapsed:.1f}s)", flush=True)
+    return elapsed
 
 
 MOVE_SIZES = ["small", "medium", "large"]          
 TRUCK_PRIORITY = ["small", "medium", "large"]      
-NUM_BOOKINGS = 50 # Number of synthetic bookings to be created
-
+NUM_BOOKINGS = 50 # Default number of synthetic bookings per city (see ETLPipeline.num_bookings)
+BOOKING_CHUNK_ROWS = 250_000   # rows drawn / written per batch
+
+BOOKING_WINDOW_START = np.datetime64("2025-07-01T00:00", "m")
+BOOKING_WINDOW_DAYS = 30       # requested_time falls on July 1st … 31st
+
+
+def _booking_rng(city_tag: str, seed: int | None) -> np.random.Generator:
+    # Same (seed, city) → same bookings; no seed → fresh OS entropy
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([int(seed), zlib.crc32(city_tag.encode())])
+
+
+def iter_bookings(df_stops: pd.DataFrame, city_tag: str, num_bookings: int,
+                  seed: int | None = None,
+                  chunk_rows: int = BOOKING_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Yield synthetic bookings for one city in batches of ≤ chunk_rows.
+
+    Everything is drawn as arrays from one NumPy generator:
+      • pickup / dropoff: two distinct stop indices per booking
+      • requested_time:   uniform day in the window + minute of day (0‥1440)
+      • move_size:        uniform over MOVE_SIZES
+      • required_truck_type: smallest of the two stop classes, via rank
+        lookup ("small" whenever either stop has no known class)
+    """
+    n_stops = len(df_stops)
+    rng = _booking_rng(city_tag, seed)
+
+    stop_ids = df_stops["stop_id"].astype(str).to_numpy(dtype=object)
+    lat = df_stops["stop_lat"].to_numpy(dtype=float)
+    lon = df_stops["stop_lon"].to_numpy(dtype=float)
+    if "classify_truck" in df_stops.columns:
+        cls = df_stops["classify_truck"].to_numpy(dtype=object)
+    else:
+        cls = np.full(n_stops, "small", dtype=object)
+    rank = np.array([TRUCK_PRIORITY.index(c) if c in TRUCK_PRIORITY else -1 for c in cls])
+    sizes = np.array(TRUCK_PRIORITY, dtype=object)
+    prefix = f"{city_tag.upper()}_BKG_"
+
+    for start in range(0, num_bookings, chunk_rows):
+        m = min(chunk_rows, num_bookings - start)
+
+        pu = rng.integers(0, n_stops, m)
+        do = rng.integers(0, n_stops - 1, m)
+        do += do >= pu                           # never the pickup itself
+
+        minutes = (rng.integers(0, BOOKING_WINDOW_DAYS + 1, m) * 24 * 60
+                   + rng.integers(0, 24 * 60 + 1, m))
+        stamps = np.datetime_as_string(BOOKING_WINDOW_START + minutes, unit="m")
+
+        pu_rank, do_rank = rank[pu], rank[do]
+        required = np.where((pu_rank < 0) | (do_rank < 0), 0, np.minimum(pu_rank, do_rank))
+
+        seq = pd.Series(np.arange(start + 1, start + m + 1)).astype(str).str.zfill(4)
+        yield pd.DataFrame({
+            "booking_id": prefix + seq,
+            "pickup_stop_id":  stop_ids[pu],
+            "dropoff_stop_id": stop_ids[do],
+            "requested_time":  pd.Series(stamps).str.replace("T", " ", regex=False),
+            "move_size": np.array(MOVE_SIZES, dtype=object)[rng.integers(0, len(MOVE_SIZES), m)],
+            "pickup_truck_type":  cls[pu],
+            "dropoff_truck_type": cls[do],
+            "required_truck_type": sizes[required],
+            "pickup_lat":  lat[pu],
+            "pickup_lon":  lon[pu],
+            "dropoff_lat": lat[do],
+            "dropoff_lon": lon[do],
+            "city": city_tag,
+        })
 
-def _least_restrictive(pickup_cls: str, drop_cls: str) -> str:
-    # Return the smallest truck class that can serve both stops.
-    try:
-        i = TRUCK_PRIORITY.index(pickup_cls)
-        j = TRUCK_PRIORITY.index(drop_cls)
-        return TRUCK_PRIORITY[min(i, j)]
-    except ValueError:          # unknown tag → default to small
-        return "small"
-    
 
 def generate_bookings(city_dir: Path, city_tag: str,
-                      num_bookings: int = NUM_BOOKINGS) -> pd.DataFrame:
-    
+                      num_bookings: int = NUM_BOOKINGS,
+                      seed: int | None = None) -> int:
+    """
+    Write a city's bookings to <city_dir>/booking_requests.csv batch by
+    batch and return how many rows were written (0 = too few stops or
+    none asked for; an older booking_requests.csv is then removed).
+    """
     stops_path = city_dir / "stops_truck_only.csv"
     if not stops_path.exists():
         raise FileNotFoundError(f"{stops_path} not found")
 
-    df_stops = pd.read_csv(stops_path)
-    stop_ids = df_stops["stop_id"].tolist()
-
-    if "classify_truck" in df_stops.columns:
-        stop_to_cls = dict(zip(df_stops["stop_id"], df_stops["classify_truck"]))
-    else:
-        stop_to_cls = {sid: "small" for sid in stop_ids}
-    
-    stop_to_lat = dict(zip(df_stops["stop_id"], df_stops["stop_lat"]))
-    stop_to_lon = dict(zip(df_stops["stop_id"], df_stops["stop_lon"]))
-
-    if len(stop_ids) < 2:
-        print(f"{city_tag.upper()}: Not enough stops to generate bookings.", flush=True)
-        return pd.DataFrame()
-
-    # Random timestamp helper 
-    def rand_time():
-        start = datetime(2025, 7, 1)
-        end   = datetime(2025, 7, 31)
-        delta = end - start
-        return (start + timedelta(
-            days=random.randint(0, delta.days),
-            minutes=random.randint(0, 24 * 60)
-        )).strftime("%Y-%m-%d %H:%M")
-
-    # Generate rows 
-    bookings = []
-    for i in range(num_bookings):
-        pickup, dropoff = random.sample(stop_ids, 2)
-        pickup_cls  = stop_to_cls.get(pickup, "small")
-        dropoff_cls = stop_to_cls.get(dropoff, "small")
-
-        booking = {
-            "booking_id": f"{city_tag.upper()}_BKG_{i+1:04d}",
-            "pickup_stop_id":  pickup,
-            "dropoff_stop_id": dropoff,
-            "requested_time":  rand_time(),
-            "move_size": random.choice(MOVE_SIZES),
-            "pickup_truck_type":  pickup_cls,
-            "dropoff_truck_type": dropoff_cls,
-            "required_truck_type": _least_restrictive(pickup_cls, dropoff_cls),
-            "pickup_lat":  stop_to_lat[pickup],
-            "pickup_lon":  stop_to_lon[pickup],
-            "dropoff_lat": stop_to_lat[dropoff],
-            "dropoff_lon": stop_to_lon[dropoff],
-            "city": city_tag,
-        }
-        bookings.append(booking)
-
-    # Persist + return 
     out_csv = city_dir / "booking_requests.csv"
-    pd.DataFrame(bookings).to_csv(out_csv, index=False)
-
-    print(f"{city_tag.upper()}: Created {len(bookings)} bookings → {out_csv}", flush=True)
-    return pd.DataFrame(bookings)
+    if num_bookings <= 0:
+        out_csv.unlink(missing_ok=True)
+        print(f"{city_tag.upper()}: 0 bookings requested.", flush=True)
+        return 0
+    df_stops = pd.read_csv(stops_path, dtype={"stop_id": str})
+    if len(df_stops) < 2:
+        out_csv.unlink(missing_ok=True)
+        print(f"{city_tag.upper()}: Not enough stops to generate bookings.", flush=True)
+        return 0
+
+    # Persist batch by batch (header once); nothing is kept in memory
+    tmp_csv = out_csv.with_suffix(".csv.tmp")
+    rows = 0
+    for batch in iter_bookings(df_stops, city_tag, num_bookings, seed):
+        batch.to_csv(tmp_csv, index=False, mode="a" if rows else "w", header=not rows)
+        rows += len(batch)
+    os.replace(tmp_csv, out_csv)
+
+    print(f"{city_tag.upper()}: Created {rows} bookings → {out_csv}", flush=True)
+    return rows
@@ -0,0 +1,38 @@
+# ---------------------------------------------------------------------
+# Country registry
+# • The single list of supported country codes, importable without
+#   pulling in pyrosm / geopandas / shapely (the API only needs the codes).
+# • Pipeline classes are imported and instantiated on first use by
+#   get_pipeline(), so nothing creates tmp/ folders at import time.
+# • Add a new country: 1) write its <cc>_preprocess.py 2) add a line here
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .etl_base import ETLPipeline
+
+# country code → (module, class)
+COUNTRIES = {
+    "co": ("pipelines.co_preprocess", "ColombiaPipeline"),   # 🇨🇴 Colombia
+    "mx": ("pipelines.mx_preprocess", "MexicoPipeline"),     # 🇲🇽 Mexico
+    "cr": ("pipelines.cr_preprocess", "CostaRicaPipeline"),  # 🇨🇷 Costa Rica
+}
+
+COUNTRY_CODES = tuple(COUNTRIES)
+
+_PIPELINES: dict[str, ETLPipeline] = {}
+
+
+def get_pipeline(cc: str) -> ETLPipeline:
+    """Import, instantiate (once per process) and return a country's pipeline."""
+    cc = cc.lower()
+    if cc not in COUNTRIES:
+        raise KeyError(f"unknown country {cc!r}; expected one of {COUNTRY_CODES}")
+    if cc not in _PIPELINES:
+        module, cls = COUNTRIES[cc]
+        _PIPELINES[cc] = getattr(import_module(module), cls)(cc)
+    return _PIPELINES[cc]
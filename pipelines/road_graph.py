@@ -0,0 +1,174 @@
+# ---------------------------------------------------------------------
+# Offline routing graph over the cached city road networks
+# • numpy / scipy only – the booking API imports this module, so the
+#   geospatial side (building a graph from the road caches) lives in
+#   road_graph_build.py and runs in the ETL.
+#
+# 1. RoadGraph
+#    • indptr / indices / time_s / length_m (CSR, rows sorted by target)
+#      plus node coordinates (EPSG:3857); routable nodes (largest
+#      connected component) are indexed in a KD-tree for snapping.
+#    • one_to_many() runs scipy's C Dijkstra from a batch of sources and
+#      walks the predecessor tree back from the requested targets only to
+#      add up the length of each fastest path.
+#
+# 2. read_city_graph()
+#    • tmp/<cc>/<city>_graph.npz as the ETL left it; None for a city
+#      without one. Never builds.
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from pathlib import Path
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from scipy.spatial import cKDTree
+
+EARTH_R = 6_378_137.0   # web-mercator sphere
+
+# ORS-like snapping: a point further than this from the network is unroutable
+SNAP_RADIUS_M = float(os.getenv("ROUTER_SNAP_M", "350"))
+
+# Sources per Dijkstra batch (memory ≈ batch × nodes × 12 bytes)
+DIJKSTRA_BATCH = 16
+
+
+def _lat(y: np.ndarray) -> np.ndarray:
+    return np.degrees(2 * np.arctan(np.exp(y / EARTH_R)) - np.pi / 2)
+
+
+def _to_mercator(lon, lat) -> np.ndarray:
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    return np.column_stack([EARTH_R * np.radians(lon),
+                            EARTH_R * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))])
+
+
+class RoadGraph:
+
+    def __init__(self, indptr, indices, time_s, length_m, xy):
+        self.indptr, self.indices = np.asarray(indptr), np.asarray(indices)
+        self.time_s, self.length_m = np.asarray(time_s), np.asarray(length_m)
+        self.xy = np.asarray(xy)
+        n = len(self.xy)
+        self.csr = csr_matrix((self.time_s, self.indices, self.indptr), shape=(n, n))
+        # u·n + v of every edge – ascending, since rows and targets are sorted
+        self._keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr)) * n + self.indices
+
+        # snap only onto the main network, never onto an isolated fragment
+        if n:
+            _, comp = connected_components(self.csr, directed=False)
+            self.routable = np.flatnonzero(comp == np.bincount(comp).argmax())
+        else:
+            self.routable = np.empty(0, dtype=np.intp)
+        self._tree = cKDTree(self.xy[self.routable]) if len(self.routable) else None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.xy)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    def bounds(self) -> tuple[float, float, float, float]:
+        """(W, S, E, N) of the nodes in degrees."""
+        (x0, y0), (x1, y1) = self.xy.min(axis=0), self.xy.max(axis=0)
+        return (np.degrees(x0 / EARTH_R), float(_lat(y0)),
+                np.degrees(x1 / EARTH_R), float(_lat(y1)))
+
+    # -----------------------------------------------------------------
+    # Snapping
+    # -----------------------------------------------------------------
+    def snap(self, lon, lat, radius_m: float = SNAP_RADIUS_M) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest routable node per point (-1 beyond radius_m) and the distance in metres."""
+        xy = _to_mercator(np.atleast_1d(lon), np.atleast_1d(lat))
+        if self._tree is None:
+            return np.full(len(xy), -1), np.full(len(xy), np.inf)
+        scale = np.cos(np.radians(np.atleast_1d(lat).astype(float)))
+        ok = np.isfinite(xy).all(axis=1)
+        dist = np.full(len(xy), np.inf)
+        node = np.full(len(xy), -1)
+        if ok.any():
+            d, k = self._tree.query(xy[ok])
+            dist[ok], node[ok] = d * scale[ok], self.routable[k]
+        node[dist > radius_m] = -1
+        return node, dist
+
+    # -----------------------------------------------------------------
+    # Shortest paths
+    # -----------------------------------------------------------------
+    def _edge_length(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        k = np.searchsorted(self._keys, u.astype(np.int64) * self.n_nodes + v)
+        return self.length_m[k]
+
+    def _path_lengths(self, preds: np.ndarray, rows: np.ndarray, sources: np.ndarray,
+                      targets: np.ndarray) -> np.ndarray:
+        # walk every (source, target) path back from its target together,
+        # adding the length of the edge into the current node at each step
+        total = np.zeros(len(targets))
+        cur = targets.copy()
+        live = np.flatnonzero(cur != sources)
+        while len(live):
+            c = cur[live]
+            p = preds[rows[live], c]
+            total[live] += self._edge_length(p, c)
+            cur[live] = p
+            live = live[p != sources[live]]
+        return total
+
+    def one_to_many(self, sources, targets) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Fastest paths between node ids: (length_m, time_s), both
+        len(sources) × len(targets), NaN where a node is -1 or unreachable.
+        """
+        sources, targets = np.asarray(sources, dtype=np.intp), np.asarray(targets, dtype=np.intp)
+        length = np.full((len(sources), len(targets)), np.nan)
+        time_s = np.full_like(length, np.nan)
+        src_ok, tgt_ok = np.flatnonzero(sources >= 0), np.flatnonzero(targets >= 0)
+        if not len(src_ok) or not len(tgt_ok):
+            return length, time_s
+
+        uniq, inv = np.unique(sources[src_ok], return_inverse=True)
+        tgt = targets[tgt_ok]
+        for b0 in range(0, len(uniq), DIJKSTRA_BATCH):
+            batch = uniq[b0:b0 + DIJKSTRA_BATCH]
+            times, preds = dijkstra(self.csr, directed=True, indices=batch,
+                                    return_predecessors=True)
+            t = times[:, tgt]
+            j, k = np.nonzero(np.isfinite(t))
+            d = np.full(t.shape, np.nan)
+            d[j, k] = self._path_lengths(preds, j, batch[j], tgt[k])
+            t[~np.isfinite(t)] = np.nan
+
+            # scatter back to every input row that asked for these sources
+            for jj in range(len(batch)):
+                rows = src_ok[inv == b0 + jj]
+                time_s[np.ix_(rows, tgt_ok)] = t[jj]
+                length[np.ix_(rows, tgt_ok)] = d[jj]
+        return length, time_s
+
+    # -----------------------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------------------
+    def save(self, path: Path) -> None:
+        tmp = Path(path).with_suffix(".tmp.npz")
+        np.savez(tmp, indptr=self.indptr, indices=self.indices, time_s=self.time_s,
+                 length_m=self.length_m, xy=self.xy)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RoadGraph":
+        with np.load(path) as z:
+            return cls(z["indptr"], z["indices"], z["time_s"], z["length_m"], z["xy"])
+
+
+def graph_path(cc: str, city: str, root: Path = Path("tmp")) -> Path:
+    return Path(root) / cc / f"{city}_graph.npz"
+
+
+def read_city_graph(cc: str, city: str, root: Path = Path("tmp")) -> RoadGraph | None:
+    """A city's RoadGraph as built by the ETL, or None when it has none."""
+    fp = graph_path(cc, city, root)
+    return RoadGraph.load(fp) if fp.exists() else None
@@ -0,0 +1,121 @@
+# ---------------------------------------------------------------------
+# Building the offline routing graphs (pipelines/road_graph.py)
+# 1. build_road_graph()
+#    • <city>_roads.parquet edges (EPSG:3857 LineStrings) → CSR graph:
+#      every vertex is a node (vertices ≤ NODE_SNAP_M apart are one
+#      node, so ways meet where OSM joined them), every segment an edge
+#      in both directions weighted by travel time.
+#    • Only truck-accessible edges (classify_truck ≠ "forbidden"); edge
+#      length in real metres (mercator length × cos φ) and time from
+#      SPEED_KMH by highway class. Duplicated segments – e.g. the
+#      overlap between tiles – collapse to one edge.
+#    • The cache holds no oneway / turn data, so the graph is undirected.
+#
+# 2. build_city_graph()
+#    • Reads tmp/<cc>/<city>_roads.parquet – or every tile of a tiled
+#      city – and caches the arrays as tmp/<cc>/<city>_graph.npz under
+#      stage "graph" of the city manifest (rebuilt when a road cache or
+#      GRAPH_VERSION changes). Called per city by the ETL transform with
+#      its own StageCache; everything downstream only reads the .npz
+#      (read_city_graph).
+# ---------------------------------------------------------------------
+
+from __future__ import annotations
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .road_graph import RoadGraph, _lat, graph_path
+from .stage_cache import StageCache, stage_key
+
+# Bump when the graph layout or the speed model changes
+GRAPH_VERSION = 1
+
+NODE_SNAP_M = 0.01      # vertices closer than this are one node
+
+# Loaded-truck cruising speeds by highway class, km/h
+SPEED_KMH = {
+    "trunk": 70, "trunk_link": 40, "primary": 50, "primary_link": 35,
+    "secondary": 40, "secondary_link": 30, "tertiary": 35, "tertiary_link": 25,
+    "unclassified": 25, "residential": 20, "services": 15, "service": 15,
+    "track": 10, "turning_circle": 10, "turning_loop": 10, "passing_place": 10,
+    "rest_area": 10,
+}
+DEFAULT_SPEED_KMH = 20
+
+
+def build_road_graph(roads: gpd.GeoDataFrame) -> RoadGraph:
+    """Road cache edges (see road_network.prepare_road_cache) → RoadGraph."""
+    roads = roads[roads["classify_truck"].astype(str) != "forbidden"]
+    if roads.crs is not None and roads.crs != "EPSG:3857":
+        roads = roads.to_crs("EPSG:3857")
+    lines = shapely.get_parts(roads.geometry.values)
+    owner = np.repeat(np.arange(len(roads)), shapely.get_num_geometries(roads.geometry.values))
+    coords, part = shapely.get_coordinates(lines, return_index=True)
+    if len(coords) < 2:
+        return RoadGraph(np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                         np.empty(0), np.empty(0), np.empty((0, 2)))
+
+    # vertices → nodes
+    q = np.round(coords / NODE_SNAP_M).astype(np.int64)
+    keys, node = np.unique(q, axis=0, return_inverse=True)
+    node = node.ravel()
+    xy = keys * NODE_SNAP_M
+
+    # consecutive vertices of the same line → segments
+    seg = np.flatnonzero(part[1:] == part[:-1])
+    u, v = node[seg], node[seg + 1]
+    a, b = coords[seg], coords[seg + 1]
+    length = np.hypot(*(b - a).T) * np.cos(np.radians(_lat((a[:, 1] + b[:, 1]) / 2)))
+    highway = roads["highway"].astype(str).to_numpy()[owner[part[seg]]]
+    speed = pd.Series(highway).map(SPEED_KMH).fillna(DEFAULT_SPEED_KMH).to_numpy()
+    time_s = length / (speed / 3.6)
+
+    # both directions, drop loops, keep the fastest of duplicate segments
+    keep = u != v
+    u, v = np.concatenate([u[keep], v[keep]]), np.concatenate([v[keep], u[keep]])
+    length, time_s = np.tile(length[keep], 2), np.tile(time_s[keep], 2)
+    order = np.lexsort((time_s, v, u))
+    u, v, length, time_s = u[order], v[order], length[order], time_s[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    u, v, length, time_s = u[first], v[first], length[first], time_s[first]
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=len(xy)))])
+    return RoadGraph(indptr, v.astype(np.int32), time_s, length, xy)
+
+
+def city_road_caches(cc: str, city: str, root: Path = Path("tmp")) -> list[Path]:
+    """The road cache(s) of one city: the whole-city parquet or its tiles."""
+    base = Path(root) / cc
+    whole = base / f"{city}_roads.parquet"
+    if whole.exists():
+        return [whole]
+    return sorted((base / f"{city}_tiles").glob("*_roads.parquet"),
+                  key=lambda p: int(p.name.split("_")[0]))
+
+
+def build_city_graph(cc: str, city: str, root: Path = Path("tmp"),
+                     cache: StageCache | None = None) -> RoadGraph | None:
+    """
+    A city's RoadGraph, rebuilt from its road cache(s) when stale; None
+    without roads. Pass the caller's StageCache of the city, if it has one.
+    """
+    sources = city_road_caches(cc, city, root)
+    if not sources:
+        return None
+    out = graph_path(cc, city, root)
+    cache = cache or StageCache(Path(root) / cc / f"{city}_manifest.json")
+    key = stage_key(GRAPH_VERSION, SPEED_KMH, DEFAULT_SPEED_KMH, NODE_SNAP_M,
+                    [cache.digest(p) for p in sources])
+    if cache.fresh("graph", key, out):
+        return RoadGraph.load(out)
+
+    roads = pd.concat([gpd.read_parquet(p) for p in sources], ignore_index=True)
+    graph = build_road_graph(gpd.GeoDataFrame(roads, geometry="geometry"))
+    graph.save(out)
+    cache.record("graph", key, out)
+    return graph
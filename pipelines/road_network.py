@@ -0,0 +1,266 @@
+# ---------------------------------------------------------------------
+# Road-network utilities shared by every country pipeline
+# 1. classify_roads()
+#    • Labels each OSM edge with the largest truck that may use it
+#      (small / medium / large) or "forbidden".
+#    • Column-wise replacement for the per-row classify() each pipeline
+#      used to run through roads.apply(..., axis=1).
+#
+# 2. _classify_road_row()
+#    • The original row-wise rules, kept as the reference implementation
+#      for tests and scripts/bench_classify.py.
+#
+# 3. snap_stops()
+#    • Keeps the GTFS stops that lie within SNAP_DISTANCE_M of a truck
+#      accessible edge and tags them with that edge's class, using one
+#      max-distance nearest query against an STRtree of projected edges.
+#
+# 4. prepare_road_cache()
+#    • Turns raw pyrosm ways into the <city>_roads.parquet cache: only
+#      drivable edges, already classified, projected to SNAP_CRS and
+#      Hilbert-sorted so neighbouring edges sit in the same row groups.
+#    • read_osm_roads() = pyrosm parse + prepare_road_cache() in one call.
+#
+# 5. make_tiles() / assign_tiles()
+#    • Split a city bbox into a grid of tiles for the tiled mode in
+#      ETLPipeline.snap_tiled(). Every stop belongs to exactly one tile
+#      core; each tile's roads come from the core padded by
+#      TILE_OVERLAP_M, so an edge near a tile border is still seen by the
+#      stops on both sides and nothing needs merging afterwards.
+# ---------------------------------------------------------------------
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Bump whenever the labelling rules change so cached artifacts that
+# depend on classify_truck are rebuilt.
+CLASSIFIER_VERSION = 1
+
+# Snapping happens in web-mercator "metres", like the old 70 m buffers
+SNAP_CRS = "EPSG:3857"
+SNAP_DISTANCE_M = 70.0
+
+# Columns kept in <city>_roads.parquet; bump the version when the cache
+# layout changes so old caches are rebuilt
+ROAD_CACHE_COLUMNS = ["id", "highway", "classify_truck", "geometry"]
+ROAD_CACHE_VERSION = 2
+
+# Padding around each tile core, in real metres. Must exceed the snap
+# radius; the extra margin also catches long way segments whose nodes
+# all fall outside a tight bbox (osmium keeps ways by their nodes).
+TILE_OVERLAP_M = 500.0
+
+# Truck classes from most to least restrictive
+TRUCK_RANK = {"small": 1, "medium": 2, "large": 3}
+
+# Tag values that ban trucks outright
+BANNED_ACCESS = {"no", "private", "agricultural"}
+BANNED_HGV = {"no"}
+
+# Fallback: highway class → truck size
+HIGHWAY_CLASS = {
+    **dict.fromkeys(["trunk", "trunk_link", "primary", "primary_link"], "large"),
+    **dict.fromkeys(["secondary", "secondary_link", "tertiary", "tertiary_link",
+                     "services"], "medium"),
+    **dict.fromkeys(["residential", "service", "track", "turning_circle",
+                     "turning_loop", "passing_place", "rest_area"], "small"),
+}
+
+
+def _classify_road_row(r) -> str:
+    # Explicit bans
+    acc = str(r.get("access", "")).lower()
+    hgv = str(r.get("hgv", "")).lower()
+    if acc in BANNED_ACCESS or hgv in BANNED_HGV:
+        return "forbidden"
+
+    # Weight‑based rule if tag exists
+    try:
+        w = float(str(r.get("maxweight", "")).lower().replace("t", ""))
+        return "small" if w <= 3.5 else "medium" if w <= 7.5 else "large"
+    except (ValueError, TypeError):
+        pass
+
+    # Fallback: infer from highway class
+    hw = str(r.get("highway", "")).lower()
+    return HIGHWAY_CLASS.get(hw, "forbidden")
+
+
+def _tag_values(roads: pd.DataFrame, col: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Factorize str(cell).lower() for one tag column → (codes, uniques).
+
+    Tag columns have only a handful of distinct values per city, so every
+    rule below is evaluated once per unique value and broadcast back to
+    the edges through the codes. str() keeps the row-wise semantics
+    (None → "none", NaN → "nan"); a missing column behaves like r.get(col, "").
+    """
+    if col not in roads.columns:
+        return np.zeros(len(roads), dtype=np.intp), np.array([""], dtype=object)
+    codes, uniques = pd.factorize(roads[col].astype(str).to_numpy())
+    return codes, np.array([u.lower() for u in uniques], dtype=object)
+
+
+def _parse_weight(tag: str) -> float | None:
+    # float() itself, so "nan"/"inf"/" 7.5 " parse exactly as before
+    try:
+        return float(tag.replace("t", ""))
+    except (ValueError, TypeError):
+        return None
+
+
+def _weight_class(w: float) -> str:
+    return "small" if w <= 3.5 else "medium" if w <= 7.5 else "large"
+
+
+def classify_roads(roads: pd.DataFrame) -> pd.Series:
+    """
+    Vectorized truck classification of OSM road edges.
+
+    Same labels as _classify_road_row, evaluated in the same priority:
+      1. access / hgv bans         → "forbidden"
+      2. parseable maxweight       → small (≤3.5t) / medium (≤7.5t) / large
+      3. highway class fallback    → HIGHWAY_CLASS, else "forbidden"
+    """
+    acc_codes, acc = _tag_values(roads, "access")
+    hgv_codes, hgv = _tag_values(roads, "hgv")
+    banned = (np.isin(acc, list(BANNED_ACCESS))[acc_codes]
+              | np.isin(hgv, list(BANNED_HGV))[hgv_codes])
+
+    mw_codes, mw = _tag_values(roads, "maxweight")
+    weights = [_parse_weight(u) for u in mw]
+    has_weight = np.array([w is not None for w in weights], dtype=bool)[mw_codes]
+    by_weight = np.array([_weight_class(w) if w is not None else "" for w in weights],
+                         dtype=object)[mw_codes]
+
+    hw_codes, hw = _tag_values(roads, "highway")
+    by_highway = np.array([HIGHWAY_CLASS.get(u, "forbidden") for u in hw],
+                          dtype=object)[hw_codes]
+
+    labels = np.where(banned, "forbidden", np.where(has_weight, by_weight, by_highway))
+    return pd.Series(labels, index=roads.index, dtype=object, name="classify_truck")
+
+
+def snap_stops(stops: pd.DataFrame, roads: gpd.GeoDataFrame,
+               truck_classes=tuple(TRUCK_RANK),
+               max_distance: float = SNAP_DISTANCE_M) -> pd.DataFrame:
+    """
+    Attach each stop to its nearest truck-accessible road edge.
+
+    stops : needs stop_id, stop_lat, stop_lon (EPSG:4326)
+    roads : classified edges (classify_truck + geometry, any CRS)
+
+    Returns the stops that have an edge of `truck_classes` within
+    `max_distance` metres, with that edge's label in classify_truck.
+    Equidistant edges resolve to the larger truck class. Stops keep their
+    input order; duplicate stop_ids keep the first occurrence.
+    """
+    edges = roads[roads["classify_truck"].isin(truck_classes)]
+    if edges.crs is not None and edges.crs != SNAP_CRS:
+        edges = edges.to_crs(SNAP_CRS)
+    if stops.empty or edges.empty:
+        return stops.iloc[:0].assign(classify_truck=pd.Series(dtype=object))
+
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(stops["stop_lon"], stops["stop_lat"]), crs="EPSG:4326"
+    ).to_crs(SNAP_CRS).values
+
+    tree = shapely.STRtree(edges.geometry.values)
+    stop_idx, edge_idx = tree.query_nearest(
+        points, max_distance=max_distance, all_matches=True,
+    )
+
+    # Ties (all_matches) → keep the highest-ranked class per stop
+    labels = edges["classify_truck"].to_numpy(dtype=object)
+    rank = np.array([TRUCK_RANK.get(c, 0) for c in labels])[edge_idx]
+    order = np.lexsort((-rank, stop_idx))
+    hit, first = np.unique(stop_idx[order], return_index=True)
+    best = edge_idx[order][first]
+
+    out = stops.iloc[hit].copy()
+    out["classify_truck"] = labels[best]
+    return out.drop_duplicates("stop_id")
+
+
+def prepare_road_cache(roads: gpd.GeoDataFrame, highways) -> gpd.GeoDataFrame:
+    """
+    Raw pyrosm ways → compact road cache.
+
+    Keeps the `highways` classes only, labels them with classify_roads(),
+    drops every other OSM attribute, projects to SNAP_CRS and orders the
+    rows along a Hilbert curve for spatial locality.
+    """
+    roads = roads[roads["highway"].isin(highways)]
+    out = gpd.GeoDataFrame(
+        {
+            "id": roads["id"].to_numpy() if "id" in roads.columns else np.arange(len(roads)),
+            "highway": pd.Categorical(roads["highway"]),
+            "classify_truck": pd.Categorical(classify_roads(roads)),
+        },
+        geometry=roads.geometry.values,
+        crs=roads.crs,
+    ).to_crs(SNAP_CRS)
+
+    if len(out):
+        out = out.iloc[np.argsort(out.hilbert_distance().to_numpy(), kind="stable")]
+    return out.reset_index(drop=True)[ROAD_CACHE_COLUMNS]
+
+
+def read_osm_roads(pbf, highways) -> gpd.GeoDataFrame:
+    """Parse a clipped PBF with pyrosm → road cache (see prepare_road_cache)."""
+    from pyrosm import OSM   # heavy; only the cold path needs it
+
+    raw = OSM(str(pbf)).get_data_by_custom_criteria(
+        custom_filter={"highway": True},
+        filter_type="keep",
+        keep_nodes=False,
+        extra_attributes=["access", "hgv", "maxweight"],
+    )
+    if raw is None or raw.empty:   # e.g. a tile that is all water
+        return gpd.GeoDataFrame(
+            {c: pd.Series(dtype=object) for c in ROAD_CACHE_COLUMNS[:-1]},
+            geometry=gpd.GeoSeries(crs=SNAP_CRS),
+        )
+    return prepare_road_cache(raw, highways)
+
+
+def _grid(bbox, tile_deg: float) -> tuple[int, int]:
+    w, s, e, n = bbox
+    return max(1, int(np.ceil((e - w) / tile_deg))), max(1, int(np.ceil((n - s) / tile_deg)))
+
+
+def make_tiles(bbox, tile_deg: float,
+               overlap_m: float = TILE_OVERLAP_M) -> list[tuple[tuple, tuple]]:
+    """
+    Row-major grid over bbox (W,S,E,N) → [(core, padded), …].
+
+    Cores are tile_deg squares (clipped to bbox) that partition it;
+    padded adds overlap_m on every side, converted to degrees at the
+    tile's pole-ward edge so the margin is never short.
+    """
+    w, s, e, n = bbox
+    nx, ny = _grid(bbox, tile_deg)
+    tiles = []
+    for iy in range(ny):
+        for ix in range(nx):
+            core = (w + ix * tile_deg, s + iy * tile_deg,
+                    min(e, w + (ix + 1) * tile_deg), min(n, s + (iy + 1) * tile_deg))
+            dlat = overlap_m / 111_320
+            dlon = dlat / np.cos(np.radians(max(abs(core[1]), abs(core[3]))))
+            padded = (core[0] - dlon, core[1] - dlat, core[2] + dlon, core[3] + dlat)
+            tiles.append((tuple(round(v, 6) for v in core),
+                          tuple(round(v, 6) for v in padded)))
+    return tiles
+
+
+def assign_tiles(stops: pd.DataFrame, bbox, tile_deg: float) -> np.ndarray:
+    """Index into make_tiles(bbox, tile_deg) of the core holding each stop
+    (stops outside the bbox go to the nearest border tile)."""
+    w, s, _, _ = bbox
+    nx, ny = _grid(bbox, tile_deg)
+    # NaN coordinates land in tile 0, where they simply never snap
+    ix = np.clip(np.nan_to_num(np.floor((stops["stop_lon"].to_numpy() - w) / tile_deg)), 0, nx - 1)
+    iy = np.clip(np.nan_to_num(np.floor((stops["stop_lat"].to_numpy() - s) / tile_deg)), 0, ny - 1)
+    return (iy * nx + ix).astype(np.intp)
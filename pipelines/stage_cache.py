@@ -0,0 +1,115 @@
+# ---------------------------------------------------------------------
+# Content-addressed stage cache
+# • Each city keeps a small JSON manifest next to its artifacts:
+#       tmp/<cc>/<city>_manifest.json
+# • A stage (gtfs, clip, roads, stops, bookings) records the hash of
+#   everything it was built from plus the files it produced.
+# • On the next run a stage is skipped only when the hash of its current
+#   inputs matches AND its outputs are still on disk, so a new PBF / GTFS
+#   zip, bbox, HIGHWAYS list or classifier version rebuilds exactly the
+#   stages downstream of the change.
+# • Raw files are hashed once; the digest is reused while the file's
+#   size + mtime are unchanged, so warm runs don't re-read multi-GB PBFs.
+# • record() merges into the manifest as it is on disk, so two instances
+#   open on the same city never drop each other's stages.
+# ---------------------------------------------------------------------
+
+from pathlib import Path
+import hashlib, json, os
+
+
+# (path, size, mtime_ns) → sha256, shared by every manifest in this process
+_DIGESTS: dict[tuple[str, int, int], str] = {}
+
+
+def file_digest(path: Path, chunk: int = 1 << 20) -> str | None:
+    """sha256 of a file's bytes, or None if it doesn't exist."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    st = path.stat()
+    memo = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    if memo not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(chunk):
+                h.update(block)
+        _DIGESTS[memo] = h.hexdigest()
+    return _DIGESTS[memo]
+
+
+def stage_key(*parts) -> str:
+    """Stable hash of any JSON-able inputs (lists, tuples, numbers, str …)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class StageCache:
+
+    def __init__(self, manifest: Path):
+        self.manifest = Path(manifest)
+        self.data = self._read()
+
+    def _read(self) -> dict:
+        try:
+            data = json.loads(self.manifest.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        data.setdefault("files", {})
+        data.setdefault("stages", {})
+        return data
+
+    # -----------------------------------------------------------------
+    # Inputs
+    # -----------------------------------------------------------------
+    def digest(self, path: Path) -> str | None:
+        """
+        file_digest() that also remembers (size, mtime) → digest in the
+        manifest, so a fresh process can skip re-hashing unchanged files.
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        st = path.stat()
+        seen = self.data["files"].get(str(path))
+        if seen and seen["size"] == st.st_size and seen["mtime_ns"] == st.st_mtime_ns:
+            return seen["sha256"]
+        digest = file_digest(path)
+        self.data["files"][str(path)] = {
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest,
+        }
+        return digest
+
+    def key_of(self, stage: str) -> str | None:
+        """Key the stage was last built with (used to chain stages)."""
+        return self.data["stages"].get(stage, {}).get("key")
+
+    # -----------------------------------------------------------------
+    # Stage bookkeeping
+    # -----------------------------------------------------------------
+    def fresh(self, stage: str, key: str, *outputs: Path) -> bool:
+        entry = self.data["stages"].get(stage)
+        return (
+            entry is not None
+            and entry.get("key") == key
+            and all(Path(o).exists() for o in outputs)
+        )
+
+    def record(self, stage: str, key: str, *outputs: Path) -> None:
+        # start from the manifest on disk: stages another instance recorded
+        # since this one was opened are kept, only `stage` is replaced
+        data = self._read()
+        data["files"].update(self.data["files"])
+        data["stages"][stage] = {
+            "key": key,
+            "outputs": [str(o) for o in outputs],
+        }
+        self.data = data
+        self.save()
+
+    def save(self) -> None:
+        # write-then-rename so a crash never leaves a half-written manifest
+        self.manifest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.data, indent=2, sort_keys=True))
+        os.replace(tmp, self.manifest)
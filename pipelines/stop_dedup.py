@@ -0,0 +1,131 @@
+# ---------------------------------------------------------------------
+# Stop de-duplication across merged GTFS feeds
+# • Cities built from several feeds (bogota1 + bogota2, CR1 + CR2) end up
+#   with the same physical stop under different IDs. dedup_stops()
+#   collapses every group of stops within `radius_m` of each other to one
+#   canonical stop before snapping, so bookings and matrices only ever
+#   see canonical IDs.
+# • Neighbour search is a grid hash: stops are bucketed into square cells
+#   of side radius_m (local equirectangular metres), so any pair within
+#   the radius lies in the same or an adjacent cell. Each stop is
+#   compared with the 3×3 block around its cell only, never with the
+#   whole city.
+# • Close pairs are merged transitively (connected components); the
+#   canonical stop of a group is its first member in input order, i.e.
+#   feed order, and keeps its own coordinates.
+# • Every merged-away ID is kept in tmp/<cc>/<city>/stop_aliases.csv
+#   (stop_id → canonical_stop_id); canonicalize() maps any ID column
+#   through it.
+# ---------------------------------------------------------------------
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Stops closer than this (metres) are treated as one; 0 disables
+STOP_DEDUP_RADIUS_M = 10.0
+
+_EARTH_R = 6_371_008.8
+_ALIAS_COLUMNS = ["stop_id", "canonical_stop_id"]
+
+
+def _close_pairs(x: np.ndarray, y: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray]:
+    """All (i, j), i < j, with |p_i − p_j| ≤ radius, via a cell-size-radius grid."""
+    cx = np.floor(x / radius).astype(np.int64)
+    cy = np.floor(y / radius).astype(np.int64)
+    cx -= cx.min() - 1                      # ≥ 1, so cx-1 / cy-1 stay ≥ 0
+    cy -= cy.min() - 1
+    width = cy.max() + 2
+    keys = cx * width + cy
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pi, pj = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            target = (cx + dx) * width + (cy + dy)
+            lo = np.searchsorted(sorted_keys, target, "left")
+            hi = np.searchsorted(sorted_keys, target, "right")
+            counts = hi - lo
+            if not counts.any():
+                continue
+            # expand every [lo, hi) range into candidate indices
+            i = np.repeat(np.arange(len(x)), counts)
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            j = order[np.arange(counts.sum()) + starts]
+            keep = (i < j) & ((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= radius ** 2)
+            pi.append(i[keep])
+            pj.append(j[keep])
+
+    return np.concatenate(pi), np.concatenate(pj)
+
+
+def dedup_stops(stops: pd.DataFrame,
+                radius_m: float = STOP_DEDUP_RADIUS_M) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Collapse co-located stops → (canonical stops, alias table).
+
+    stops    : needs stop_id, stop_lat, stop_lon; row order = priority
+    radius_m : merge distance in metres (≤ 0 → nothing is merged)
+
+    Stops without coordinates are never merged. The alias table lists
+    only IDs that were merged away.
+    """
+    n = len(stops)
+    no_aliases = pd.DataFrame({c: pd.Series(dtype="string") for c in _ALIAS_COLUMNS})
+    if n < 2 or radius_m <= 0:
+        return stops, no_aliases
+
+    lat = stops["stop_lat"].to_numpy(dtype=float)
+    lon = stops["stop_lon"].to_numpy(dtype=float)
+    valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    if len(valid) < 2:
+        return stops, no_aliases
+
+    # Local metres; a city is small enough for one cos(lat) scale
+    lat_r, lon_r = np.radians(lat[valid]), np.radians(lon[valid])
+    x = _EARTH_R * lon_r * np.cos(lat_r.mean())
+    y = _EARTH_R * lat_r
+    i, j = _close_pairs(x, y, radius_m)
+    if not len(i):
+        return stops, no_aliases
+
+    graph = coo_matrix((np.ones(len(i), dtype=np.int8), (valid[i], valid[j])), shape=(n, n))
+    n_groups, group = connected_components(graph, directed=False)
+
+    # canonical = lowest row position in each group
+    first = np.full(n_groups, n)
+    np.minimum.at(first, group, np.arange(n))
+    canonical = first[group]
+
+    ids = stops["stop_id"].astype("string").to_numpy()
+    merged = canonical != np.arange(n)
+    aliases = pd.DataFrame({
+        "stop_id": ids[merged],
+        "canonical_stop_id": ids[canonical[merged]],
+    }, dtype="string")
+    aliases = aliases[aliases["stop_id"] != aliases["canonical_stop_id"]]
+
+    return stops.iloc[np.flatnonzero(~merged)], aliases.reset_index(drop=True)
+
+
+def read_stop_aliases(cc: str, tmp_root: Path = Path("tmp")) -> pd.DataFrame:
+    """Every city's stop_aliases.csv for a country, as one table."""
+    frames = [pd.read_csv(fp, dtype="string")
+              for fp in sorted((tmp_root / cc.lower()).glob("*/stop_aliases.csv"))]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame({c: pd.Series(dtype="string") for c in _ALIAS_COLUMNS})
+    return pd.concat(frames, ignore_index=True).drop_duplicates("stop_id")
+
+
+def canonicalize(ids: pd.Series, aliases: pd.DataFrame) -> pd.Series:
+    """Replace merged-away stop IDs by their canonical ID (others unchanged)."""
+    if aliases.empty:
+        return ids
+    lookup = pd.Series(aliases["canonical_stop_id"].to_numpy(),
+                       index=aliases["stop_id"].to_numpy())
+    return ids.map(lookup).fillna(ids).astype(ids.dtype)
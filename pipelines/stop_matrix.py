@@ -0,0 +1,128 @@
+# ---------------------------------------------------------------------
+# Sparse stop × stop matrices – data/processed/<cc>_matrix.npz
+# • Written by build_matrices(), read by the booking API
+#   (api_loaders.load_matrices) – one binary file per country:
+#     stop_id                sorted union of stop IDs (row / column index)
+#     row, col               int32 COO coordinates of every known cell
+#     distance_m, duration_s float32 per cell (NaN = that metric unknown)
+#     lat, lon               per stop, for lookup-time imputation
+#     detour, speed_mps      imputation parameters, NaN unless
+#                            build_matrices(fill="impute")
+# • Only known cells are stored (plus the zero diagonal), so memory and
+#   file size follow the observed pairs instead of stops².
+# • Cells are kept sorted by row * n + col; lookup() resolves any number
+#   of (pickup, dropoff) pairs with one searchsorted.
+# • lookup(impute=True) answers like the old *_matrix_filled.csv did:
+#   missing distance = detour × haversine, the pair then averaged with
+#   its reverse; missing duration = distance / median observed speed.
+# ---------------------------------------------------------------------
+
+from pathlib import Path
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipelines.artifacts import PROCESSED_DIR
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def matrix_path(cc: str) -> Path:
+    return PROCESSED_DIR / f"{cc.lower()}_matrix.npz"
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class StopMatrix:
+    def __init__(self, stop_id, row, col, distance_m, duration_s,
+                 lat=None, lon=None, detour: float = np.nan, speed_mps: float = np.nan):
+        self.ids = pd.Index(np.asarray(stop_id, dtype=str))
+        n = len(self.ids)
+        key = np.asarray(row, dtype=np.int64) * n + np.asarray(col, dtype=np.int64)
+        order = np.argsort(key, kind="stable")
+        self._key = key[order]
+        self.row = np.asarray(row, dtype=np.int32)[order]
+        self.col = np.asarray(col, dtype=np.int32)[order]
+        self.distance_m = np.asarray(distance_m, dtype=np.float32)[order]
+        self.duration_s = np.asarray(duration_s, dtype=np.float32)[order]
+        self.lat = np.full(n, np.nan) if lat is None else np.asarray(lat, dtype=float)
+        self.lon = np.full(n, np.nan) if lon is None else np.asarray(lon, dtype=float)
+        self.detour = float(detour)
+        self.speed_mps = float(speed_mps)
+
+    @property
+    def n(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nnz(self) -> int:
+        return len(self._key)
+
+    def positions(self, stop_ids) -> np.ndarray:
+        """Row / column of each stop ID, -1 when the matrix doesn't know it."""
+        return self.ids.get_indexer(pd.Index(np.asarray(stop_ids, dtype=str)))
+
+    def _cells(self, i: np.ndarray, j: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        d = np.full(len(i), np.nan)
+        t = np.full(len(i), np.nan)
+        if not self.nnz:
+            return d, t
+        q = i.astype(np.int64) * self.n + j
+        at = np.minimum(np.searchsorted(self._key, q), self.nnz - 1)
+        hit = (i >= 0) & (j >= 0) & (self._key[at] == q)
+        d[hit] = self.distance_m[at[hit]]
+        t[hit] = self.duration_s[at[hit]]
+        return d, t
+
+    def lookup(self, pickup_ids, dropoff_ids,
+               impute: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (distance_m, duration_s) per (pickup, dropoff) pair, NaN where
+        unknown. impute=True fills gaps when the matrix carries the
+        imputation parameters (and both stops have coordinates).
+        """
+        i, j = self.positions(pickup_ids), self.positions(dropoff_ids)
+        d, t = self._cells(i, j)
+        if not impute or np.isnan(self.detour):
+            return d, t
+
+        known = (i >= 0) & (j >= 0)
+        hav = np.full(len(i), np.nan)
+        hav[known] = haversine_m(self.lat[i[known]], self.lon[i[known]],
+                                 self.lat[j[known]], self.lon[j[known]])
+        d_rev, _ = self._cells(j, i)
+        there = np.where(np.isnan(d), self.detour * hav, d)
+        back = np.where(np.isnan(d_rev), self.detour * hav, d_rev)
+        d = (there + back) / 2
+        t = np.where(np.isnan(t) & np.isfinite(d), d / self.speed_mps, t)
+        same = known & (i == j)
+        d[same] = t[same] = 0.0
+        return d, t
+
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, stop_id=self.ids.to_numpy(dtype=str), row=self.row, col=self.col,
+                 distance_m=self.distance_m, duration_s=self.duration_s,
+                 lat=self.lat, lon=self.lon, detour=self.detour, speed_mps=self.speed_mps)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "StopMatrix":
+        with np.load(path) as z:
+            return cls(z["stop_id"], z["row"], z["col"], z["distance_m"], z["duration_s"],
+                       z["lat"], z["lon"], float(z["detour"]), float(z["speed_mps"]))
+
+
+def read_stop_matrix(cc: str) -> StopMatrix | None:
+    """A country's matrix, or None before build_matrices() has run."""
+    fp = matrix_path(cc)
+    return StopMatrix.load(fp) if fp.exists() else None
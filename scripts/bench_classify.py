@@ -0,0 +1,62 @@
+# ---------------------------------------------------------------------
+# Benchmark: row-wise vs column-wise road classification
+# • Builds a synthetic OSM edge table with the tag mix we see in the
+#   CDMX / Costa Rica extracts (mostly untagged, some bans & maxweights)
+# • Times roads.apply(_classify_road_row, axis=1) against classify_roads()
+#   and checks both produce identical labels
+#
+#   PYTHONPATH=. python scripts/bench_classify.py --edges 300000
+# ---------------------------------------------------------------------
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from pipelines.road_network import HIGHWAY_CLASS, _classify_road_row, classify_roads
+
+
+def synthetic_edges(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    highways = list(HIGHWAY_CLASS) + ["unclassified", "footway", "motorway"]
+    access = np.array([None, None, None, None, "yes", "no", "private",
+                       "agricultural", "destination"], dtype=object)
+    hgv = np.array([None, None, None, None, None, "no", "yes", "designated"], dtype=object)
+    maxweight = np.array([None] * 12 + ["3.5", "7.5", "10", "12 t", "5t", "none",
+                                        np.nan, "2.5 st"], dtype=object)
+    return pd.DataFrame({
+        "highway":   rng.choice(highways, n),
+        "access":    rng.choice(access, n),
+        "hgv":       rng.choice(hgv, n),
+        "maxweight": rng.choice(maxweight, n),
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark truck classifiers")
+    parser.add_argument("--edges", type=int, default=300_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    roads = synthetic_edges(args.edges, args.seed)
+
+    t0 = time.perf_counter()
+    row_wise = roads.apply(_classify_road_row, axis=1)
+    t_row = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    col_wise = classify_roads(roads)
+    t_col = time.perf_counter() - t0
+
+    mismatches = int((row_wise != col_wise).sum())
+    print(f"edges={len(roads):,}")
+    print(f"row-wise    {t_row:8.3f} s")
+    print(f"column-wise {t_col:8.3f} s   ({t_row / max(t_col, 1e-9):.0f}x faster)")
+    print(f"label mismatches: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# ---------------------------------------------------------------------
+# Enrichment throughput vs. in-flight requests, against scripts/mock_ors.py
+# • Routes the same random pairs at several ORS_CONCURRENCY levels with
+#   an unconstrained budget; with a fixed per-request latency throughput
+#   should grow ~linearly with concurrency.
+# • --rpm / --server-rpm show the limiter instead: the client holds its
+#   budget, the server's 429s are absorbed by the backoff.
+#
+#   PYTHONPATH=.:apps/api/app python scripts/bench_enrich.py
+#   PYTHONPATH=.:apps/api/app python scripts/bench_enrich.py --pairs 60 --levels 8 --rpm 600 --server-rpm 40
+# ---------------------------------------------------------------------
+
+import argparse, os, random
+
+from scripts.mock_ors import serve
+from routes.openrouteservice_wrapper import OpenRouteServiceWrapper
+from services.rate_limit import RateLimiter
+from services.route_engine import route_many
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark async ORS enrichment")
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--rpm", type=float, default=1e6, help="client budget (req/min)")
+    parser.add_argument("--server-rpm", type=int, default=0, help="mock 429 threshold")
+    args = parser.parse_args()
+
+    server = serve(latency=args.latency, rpm=args.server_rpm)
+    os.environ["ORS_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    client = OpenRouteServiceWrapper(api_key="bench")
+
+    rng = random.Random(0)
+    pairs = [((rng.uniform(-74.2, -73.9), rng.uniform(4.5, 4.8)),
+              (rng.uniform(-74.2, -73.9), rng.uniform(4.5, 4.8))) for _ in range(args.pairs)]
+
+    base = None
+    print(f"{'in-flight':>9} {'wall s':>8} {'routes/min':>11} {'speed-up':>9} "
+          f"{'429s':>5} {'errors':>6}")
+    for n in args.levels:
+        results, stats = route_many(pairs, client, RateLimiter(args.rpm), concurrency=n)
+        base = base or stats["routes_per_min"]
+        print(f"{n:>9} {stats['wall_s']:>8.2f} {stats['routes_per_min']:>11.0f} "
+              f"{stats['routes_per_min'] / base:>8.1f}x {stats['throttled']:>5} "
+              f"{stats['errors']:>6}", flush=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# ---------------------------------------------------------------------
+# Per-request latency: fresh connection per call vs. the pooled session
+# • Runs the same directions calls against scripts/mock_ors.py with
+#   --handshake standing in for the TCP + TLS setup to the hosted API.
+# • "per-call" is the old behaviour (module-level requests.post → new
+#   connection every time), "pooled" is routes/http_session.py.
+# • Sequential (one booking at a time, the API path) and with
+#   --concurrency requests in flight (the enrichment path).
+#
+#   PYTHONPATH=.:apps/api/app python scripts/bench_http.py
+#   PYTHONPATH=.:apps/api/app python scripts/bench_http.py --handshake 0.15 --calls 100
+# ---------------------------------------------------------------------
+
+import argparse, os, random, statistics, time
+
+import requests
+
+from scripts.mock_ors import serve
+from routes.http_session import make_session
+from routes.openrouteservice_wrapper import OpenRouteServiceWrapper
+from services.rate_limit import RateLimiter
+from services.route_engine import route_many
+
+
+def _pairs(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [((rng.uniform(-74.2, -73.9), rng.uniform(4.5, 4.8)),
+             (rng.uniform(-74.2, -73.9), rng.uniform(4.5, 4.8))) for _ in range(n)]
+
+
+def _sequential(client, pairs) -> list[float]:
+    lat = []
+    for start, end in pairs:
+        t0 = time.perf_counter()
+        status, _, _ = client.route_once(start, end)
+        lat.append(time.perf_counter() - t0)
+        assert status == 200, status
+    return lat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-call ORS connections")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02, help="server time per request")
+    parser.add_argument("--handshake", type=float, default=0.1, help="server time per new connection")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server = serve(latency=args.latency, handshake=args.handshake)
+    os.environ["ORS_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    pairs = _pairs(args.calls)
+    clients = {
+        # the requests module has .post too: a throwaway connection per call
+        "per-call": OpenRouteServiceWrapper(api_key="bench", cache=False, session=requests),
+        "pooled": OpenRouteServiceWrapper(api_key="bench", cache=False, session=make_session()),
+    }
+
+    print(f"{'client':>9} {'mode':>10} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'routes/min':>11} {'conns':>6}")
+    for name, client in clients.items():
+        conns = server.connections
+        lat = _sequential(client, pairs)
+        q = statistics.quantiles(lat, n=20)
+        print(f"{name:>9} {'sequential':>10} {1e3 * statistics.mean(lat):>8.1f} "
+              f"{1e3 * q[9]:>7.1f} {1e3 * q[18]:>7.1f} {60 * len(lat) / sum(lat):>11.0f} "
+              f"{server.connections - conns:>6}", flush=True)
+
+        conns = server.connections
+        _, stats = route_many(pairs, client, RateLimiter(1e6), concurrency=args.concurrency)
+        print(f"{name:>9} {f'{args.concurrency} flight':>10} "
+              f"{1e3 * stats['wall_s'] * args.concurrency / len(pairs):>8.1f} {'':>7} {'':>7} "
+              f"{stats['routes_per_min']:>11.0f} {server.connections - conns:>6}", flush=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# ---------------------------------------------------------------------
+# End-to-end ORS benchmark against scripts/mock_ors.py – no quota used
+# • enrich: a synthetic city (--bookings over --stops, repeated pairs)
+#   run through compute_distance.enrich_country per ORS_ENRICH_MODE,
+#   once with an empty route cache and once warm.
+# • geocode: --lookups addresses drawn (Zipf-like) from --addresses
+#   distinct ones, --threads at a time, through api_loaders.geocode with
+#   and without the geocode cache.
+# • Every HTTP attempt on the shared pooled session is timed, so the
+#   report has throughput, p50 / p95 / p99 request latency and how many
+#   attempts were retried (429 / 5xx / dropped connection).
+# • The mock's fault knobs (--latency, --jitter, --error-rate,
+#   --throttle-rate, --drop-rate, --server-rpm) shape the server side;
+#   ORS_CONCURRENCY / ORS_MAX_RPM etc. shape the client as in production.
+#
+#   PYTHONPATH=.:apps/api/app python scripts/bench_ors.py
+#   PYTHONPATH=.:apps/api/app python scripts/bench_ors.py --jitter 0.05 --error-rate 0.02 --throttle-rate 0.02
+# ---------------------------------------------------------------------
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse, os, random, tempfile, time
+
+import numpy as np
+import pandas as pd
+
+from scripts.mock_ors import serve
+
+CC, CITY = "zz", "bench"
+RETRIED = {429, 500, 502, 503, 504, "conn"}
+
+
+class Recorder:
+    """Times every request made through a requests.Session."""
+
+    def __init__(self, session):
+        self.attempts: list[tuple[str, object, float]] = []   # (endpoint, status, seconds)
+        send = session.request
+
+        def timed(method, url, *args, **kwargs):
+            t0 = time.perf_counter()
+            status = "conn"
+            try:
+                resp = send(method, url, *args, **kwargs)
+                status = resp.status_code
+                return resp
+            finally:
+                path = url.split("://", 1)[-1].split("/")
+                self.attempts.append((path[2] if path[1] == "v2" else path[1], status,
+                                      time.perf_counter() - t0))
+
+        session.request = timed
+
+    def take(self) -> list[tuple[str, object, float]]:
+        out, self.attempts = self.attempts, []
+        return out
+
+
+def _summary(attempts, wall_s: float, units: int, unit: str) -> str:
+    lat = np.array([s for _, _, s in attempts]) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (np.nan,) * 3
+    retried = sum(status in RETRIED for _, status, _ in attempts)
+    return (f"{wall_s:>7.2f} {60 * units / wall_s:>10.0f} {unit:<9} {len(attempts):>6} "
+            f"{retried:>7} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f}")
+
+
+HEADER = (f"{'':<22} {'wall s':>7} {'per min':>10} {'':<9} {'reqs':>6} "
+          f"{'retried':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+
+
+def _fresh_caches(path: Path) -> None:
+    # point both caches at a new directory and drop the process singletons
+    import routes.geocode_cache, routes.route_cache
+    os.environ["ORS_CACHE_PATH"] = str(path / "ors_routes.sqlite")
+    os.environ["GEOCODE_CACHE_PATH"] = str(path / "geocode.sqlite")
+    routes.route_cache._default = None
+    routes.geocode_cache._default = None
+
+
+def _city(root: Path, bookings: int, stops: int, rng: np.random.Generator) -> None:
+    xy = np.column_stack([rng.uniform(-74.2, -73.95, stops), rng.uniform(4.5, 4.8, stops)])
+    ids = np.array([f"{i:04d}" for i in range(stops)])
+    # popular stops show up far more often, so pairs repeat like real demand
+    p = 1 / np.arange(1, stops + 1) ** 0.8
+    pu, do = rng.choice(stops, (2, bookings), p=p / p.sum())
+    out = root / "tmp" / CC / CITY
+    out.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        "booking_id": [f"BKG_{i:06d}" for i in range(bookings)],
+        "pickup_stop_id": ids[pu], "dropoff_stop_id": ids[do],
+        "pickup_lat": xy[pu, 1], "pickup_lon": xy[pu, 0],
+        "dropoff_lat": xy[do, 1], "dropoff_lon": xy[do, 0],
+        "city": CITY,
+    }).to_csv(out / "booking_requests.csv", index=False)
+
+
+def bench_enrich(args, rec: Recorder, root: Path) -> None:
+    from services.compute_distance import enrich_country
+
+    _city(root, args.bookings, args.stops, np.random.default_rng(args.seed))
+    print(HEADER)
+    for mode in args.modes:
+        os.environ["ORS_ENRICH_MODE"] = mode
+        _fresh_caches(root / "cache" / mode)
+        for run in ("cold", "warm"):
+            t0 = time.perf_counter()
+            enrich_country(CC)
+            wall = time.perf_counter() - t0
+            missing = pd.read_parquet(root / "data" / "processed" / f"{CC}.parquet",
+                                      columns=["distance_m"])["distance_m"].isna().sum()
+            print(f"enrich {mode:<10} {run:<4}  "
+                  f"{_summary(rec.take(), wall, args.bookings, 'bookings')}  {missing} unrouted",
+                  flush=True)
+
+
+def bench_geocode(args, rec: Recorder, root: Path) -> None:
+    from routes.api_loaders import geocode
+
+    rng = random.Random(args.seed)
+    pool = [f"Calle {rng.randint(1, 200)} # {rng.randint(1, 99)}-{rng.randint(1, 99)}, Bogotá"
+            for _ in range(args.addresses)]
+    weights = [1 / (i + 1) for i in range(len(pool))]
+    queries = rng.choices(pool, weights, k=args.lookups)
+
+    def one(address: str) -> tuple[float, bool]:
+        t0 = time.perf_counter()
+        try:
+            geocode("co", address, focus=(4.65, -74.08))
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    print(HEADER)
+    for label, cached in (("no cache", "0"), ("cache", "1")):
+        os.environ["GEOCODE_CACHE"] = cached
+        _fresh_caches(root / "cache" / f"geocode-{cached}")
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as ex:
+            done = list(ex.map(one, queries))
+        wall = time.perf_counter() - t0
+        lookup = np.percentile([s for s, _ in done], [50, 99]) * 1000
+        print(f"geocode {label:<14} {_summary(rec.take(), wall, args.lookups, 'lookups')}  "
+              f"{sum(not ok for _, ok in done)} failed, lookup p50/p99 "
+              f"{lookup[0]:.2f}/{lookup[1]:.2f} ms", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark enrichment + geocoding against mock ORS")
+    parser.add_argument("--only", choices=["enrich", "geocode"])
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--stops", type=int, default=300)
+    parser.add_argument("--modes", nargs="+", default=["matrix", "directions"])
+    parser.add_argument("--addresses", type=int, default=300)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--server-rpm", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(latency=args.latency, rpm=args.server_rpm, jitter=args.jitter,
+                   error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                   drop_rate=args.drop_rate, seed=args.seed)
+    os.environ["ORS_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("ORS_API_KEY", "bench")
+    os.environ.setdefault("ORS_MAX_RPM", "1000000")
+    os.environ.setdefault("ORS_BURST", "100")
+    os.environ.setdefault("STOP_TABLES", "0")
+
+    from routes.http_session import http_session
+    rec = Recorder(http_session())
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_ors_") as tmp:
+        os.chdir(tmp)            # tmp/, data/ of the pipeline are relative
+        try:
+            if args.only in (None, "enrich"):
+                bench_enrich(args, rec, Path(tmp))
+            if args.only in (None, "geocode"):
+                bench_geocode(args, rec, Path(tmp))
+        finally:
+            os.chdir(cwd)
+    server.shutdown()
+    print("server:", dict(sorted(server.counts.items(), key=str)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# ---------------------------------------------------------------------
+# Cold-build helper: clip every country's cities out of its national PBF
+# • One osmium pass per country (all city bboxes at once)
+# • Countries run side by side – osmium does the work in subprocesses,
+#   so threads are enough to keep them all busy
+# • Prints the wall time per country
+#
+#   python scripts/clip_osm.py            # all countries
+#   python scripts/clip_osm.py co mx      # a subset
+# ---------------------------------------------------------------------
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipelines.registry import COUNTRY_CODES, get_pipeline
+
+
+def _clip(cc: str) -> float:
+    t0 = time.perf_counter()
+    get_pipeline(cc).clip_cities()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Clip city extracts for one or more countries")
+    parser.add_argument("countries", nargs="*",
+                        help="Country codes to clip (co | mx | cr, default: all)")
+    args = parser.parse_args()
+    countries = args.countries or list(COUNTRY_CODES)
+    unknown = set(countries) - set(COUNTRY_CODES)
+    if unknown:
+        parser.error(f"unknown country code(s): {', '.join(sorted(unknown))}")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(countries)) as pool:
+        timings = dict(zip(countries, pool.map(_clip, countries)))
+
+    for cc, secs in timings.items():
+        print(f"{cc}: {secs:7.1f}s", flush=True)
+    print(f"total: {time.perf_counter() - t0:7.1f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
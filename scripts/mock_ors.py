@@ -0,0 +1,235 @@
+# ---------------------------------------------------------------------
+# Local stand-in for the ORS API (benchmarks / offline)
+# • POST /v2/directions/<profile>  {"coordinates": [[lon,lat],[lon,lat]]}
+#   → {"routes": [{"summary": {"distance", "duration"}}]} with a
+#   haversine × 1.3 distance at 30 km/h, after --latency seconds.
+# • POST /v2/matrix/<profile>  {"locations", "sources", "destinations"}
+#   → {"distances": [[…]], "durations": [[…]]}, same model, 400 above
+#   --max-elements cells like the hosted API.
+# • GET /geocode/search?text=…  → a GeoJSON FeatureCollection of `size`
+#   candidates (mixed layers / confidence) scattered around the focus
+#   point or boundary.rect centre, deterministic per text.
+# • --rpm N answers 429 once N requests arrived in the last 60 s, like
+#   the hosted free tier, with Retry-After = seconds until a slot frees.
+# • Fault injection, drawn per request from --seed:
+#     --jitter S         extra latency, exponential with mean S (a tail)
+#     --error-rate P     503 "busy"
+#     --throttle-rate P  429 with Retry-After: 1 regardless of --rpm
+#     --drop-rate P      connection closed without a reply
+# • Threaded, so concurrent clients really overlap; HTTP/1.1 keep-alive,
+#   and --handshake S delays every NEW connection by S seconds – the
+#   TCP + TLS setup a pooled client only pays once per connection.
+# • server.counts: Counter of (endpoint, status) – "drop" for drops.
+#
+#   python scripts/mock_ors.py --port 8088 --latency 0.2 --error-rate 0.02
+#   ORS_BASE_URL=http://127.0.0.1:8088 ORS_API_KEY=x python apps/api/app/main.py
+# ---------------------------------------------------------------------
+
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse, json, math, random, threading, time, zlib
+
+
+def _haversine_m(a, b) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (*a, *b))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6_371_008.8 * math.asin(math.sqrt(h))
+
+
+GEOCODE_LAYERS = [("address", "point", 0.95), ("street", "centroid", 0.8),
+                  ("venue", "point", 0.7), ("locality", "centroid_locality", 0.5)]
+DEFAULT_CENTRE = (-74.08, 4.65)   # lon, lat when a query has neither focus nor rect
+
+
+class MockORS(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256   # default 5 refuses bursts of new connections
+
+    def __init__(self, addr, latency: float = 0.1, rpm: int = 0, max_elements: int = 3500,
+                 handshake: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, drop_rate: float = 0.0, seed: int = 0):
+        super().__init__(addr, _Handler)
+        self.latency = latency
+        self.handshake = handshake
+        self.connections = 0
+        self.rpm = rpm
+        self.max_elements = max_elements
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.served = 0
+        self.throttled = 0
+        self.counts: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._recent: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def admit(self) -> float:
+        """0 if the request may run, else seconds until the window has room."""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                self.throttled += 1
+                return 60 - (now - self._recent[0])
+            self._recent.append(now)
+            self.served += 1
+            return 0.0
+
+    def draw(self) -> tuple[str | None, float]:
+        """(injected fault or None, seconds this request takes)."""
+        with self._lock:
+            u = self._rng.random()
+            delay = self.latency + (self._rng.expovariate(1 / self.jitter) if self.jitter else 0.0)
+        for fault, p in (("drop", self.drop_rate), ("error", self.error_rate),
+                         ("throttle", self.throttle_rate)):
+            if u < p:
+                return fault, delay
+            u -= p
+        return None, delay
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockORS
+    protocol_version = "HTTP/1.1"   # keep-alive; every reply sets Content-Length
+    disable_nagle_algorithm = True  # headers + body go out as separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def log_message(self, *_):   # keep benchmark output clean
+        pass
+
+    def _send(self, code: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server._lock:
+            self.server.counts[self._endpoint, code] += 1
+
+    def _gate(self) -> bool:
+        """Rate limit + injected faults; True when the request was answered here."""
+        wait = self.server.admit()
+        if wait:
+            self._send(429, {"error": "Rate Limit Exceeded"}, {"Retry-After": str(math.ceil(wait))})
+            return True
+
+        fault, delay = self.server.draw()
+        time.sleep(delay)
+        if fault == "drop":
+            with self.server._lock:
+                self.server.counts[self._endpoint, "drop"] += 1
+            self.close_connection = True
+            return True
+        if fault == "error":
+            self._send(503, {"error": "Service Unavailable"})
+        elif fault == "throttle":
+            self._send(429, {"error": "Rate Limit Exceeded"}, {"Retry-After": "1"})
+        return fault is not None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._endpoint = self.path.split("/")[2] if self.path.count("/") >= 2 else self.path
+        if not self.path.startswith(("/v2/directions/", "/v2/matrix/")):
+            return self._send(404, {"error": f"no route {self.path}"})
+        if self._gate():
+            return
+
+        if self.path.startswith("/v2/directions/"):
+            (a, b) = body["coordinates"][:2]
+            dist = 1.3 * _haversine_m(a, b)
+            return self._send(200, {"routes": [{"summary": {"distance": dist,
+                                                            "duration": dist / (30 / 3.6)}}]})
+
+        locs = body["locations"]
+        src = body.get("sources", range(len(locs)))
+        dst = body.get("destinations", range(len(locs)))
+        if len(src) * len(dst) > self.server.max_elements:
+            return self._send(400, {"error": "Request parameters exceed the server configuration limits"})
+        dist = [[1.3 * _haversine_m(locs[i], locs[j]) for j in dst] for i in src]
+        self._send(200, {"distances": dist,
+                         "durations": [[d / (30 / 3.6) for d in row] for row in dist]})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._endpoint = "geocode"
+        if url.path != "/geocode/search":
+            return self._send(404, {"error": f"no route {url.path}"})
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if not q.get("text"):
+            return self._send(400, {"error": "missing param 'text'"})
+        if self._gate():
+            return
+        self._send(200, _geocode(q))
+
+
+def _geocode(q: dict) -> dict:
+    if "focus.point.lon" in q:
+        lon0, lat0 = float(q["focus.point.lon"]), float(q["focus.point.lat"])
+    elif "boundary.rect.min_lon" in q:
+        lon0 = (float(q["boundary.rect.min_lon"]) + float(q["boundary.rect.max_lon"])) / 2
+        lat0 = (float(q["boundary.rect.min_lat"]) + float(q["boundary.rect.max_lat"])) / 2
+    else:
+        lon0, lat0 = DEFAULT_CENTRE
+
+    rng = random.Random(zlib.crc32(q["text"].encode()))
+    feats = []
+    for i in range(max(1, int(q.get("size", 5)))):
+        layer, accuracy, conf = GEOCODE_LAYERS[i % len(GEOCODE_LAYERS)]
+        feats.append({
+            "type": "Feature",
+            "geometry": {"type": "Point",
+                         "coordinates": [lon0 + rng.uniform(-0.05, 0.05), lat0 + rng.uniform(-0.05, 0.05)]},
+            "properties": {"label": q["text"], "layer": layer, "accuracy": accuracy,
+                           "confidence": round(conf * rng.uniform(0.8, 1.0), 3),
+                           "country_a": q.get("boundary.country", "")},
+        })
+    return {"type": "FeatureCollection", "features": feats}
+
+
+def serve(port: int = 0, latency: float = 0.1, rpm: int = 0, max_elements: int = 3500,
+          handshake: float = 0.0, **faults) -> MockORS:
+    """
+    Start a mock server on a background thread; port 0 = any free port.
+    `faults`: jitter / error_rate / throttle_rate / drop_rate / seed.
+    """
+    server = MockORS(("127.0.0.1", port), latency, rpm, max_elements, handshake, **faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock ORS server")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mean extra seconds (exponential)")
+    parser.add_argument("--rpm", type=int, default=0, help="429 above this many req/min (0 = off)")
+    parser.add_argument("--max-elements", type=int, default=3500, help="matrix cell limit")
+    parser.add_argument("--handshake", type=float, default=0.0, help="seconds per new connection")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share answered 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share answered 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share dropped unanswered")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockORS(("127.0.0.1", args.port), args.latency, args.rpm, args.max_elements,
+                     args.handshake, jitter=args.jitter, error_rate=args.error_rate,
+                     throttle_rate=args.throttle_rate, drop_rate=args.drop_rate, seed=args.seed)
+    print(f"mock ORS on http://127.0.0.1:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
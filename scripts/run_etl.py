@@ -2,32 +2,41 @@
 # This launcher is just a convenient “traffic controller” that picks 
 # the right class and calls .run().
 # • Called by "docker compose up genesis" via entrypoint.sh
-# • Add a new country: 1) import its class 2) extend pipelines dict
+# • Add a new country: register its class in pipelines/registry.py
 # ---------------------------------------------------------------------
 
 import argparse
-from pipelines.mx_preprocess import MexicoPipeline
-from pipelines.cr_preprocess import CostaRicaPipeline
-from pipelines.co_preprocess import ColombiaPipeline
-
-# Registry: country‑code → instantiated pipeline 
-PIPELINES = {
-    "co": ColombiaPipeline("co"),   # 🇨🇴 Colombia
-    "mx": MexicoPipeline("mx"),     # 🇲🇽 Mexico
-    "cr": CostaRicaPipeline("cr"),  # 🇨🇷 Costa Rica
-}
+from pipelines.registry import COUNTRY_CODES, get_pipeline
 
 # Parse CLI arg → run chosen pipeline → print summary
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run one country ETL")
     parser.add_argument(
         "country",
-        choices=PIPELINES.keys(),   # limits input to co/mx/cr
+        choices=COUNTRY_CODES,      # limits input to co/mx/cr
         help="Country code to process (co | mx | cr)",
     )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Cities processed in parallel (default: $ETL_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--bookings", type=int, default=None,
+        help="Synthetic bookings per city (default: $NUM_BOOKINGS or 50)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed for reproducible bookings (default: $BOOKING_SEED or random)",
+    )
     args = parser.parse_args()
 
-    pipeline = PIPELINES[args.country]  
+    pipeline = get_pipeline(args.country)
+    if args.workers:
+        pipeline.workers = args.workers
+    if args.bookings is not None:
+        pipeline.num_bookings = args.bookings
+    if args.seed is not None:
+        pipeline.booking_seed = args.seed
     pipeline.run()                      # E‑T‑L in one call
     print(f"Finished {args.country} pipeline", flush=True) 
 
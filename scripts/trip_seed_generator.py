@@ -4,6 +4,8 @@ from datetime import timedelta
 import pandas as pd
 from haversine import haversine
 
+from pipelines.artifacts import read_bookings
+
 CAP_RANK = {"small": 1, "medium": 2, "large": 3}
 
 def generate_trip_logs(country: str) -> Path:
@@ -24,7 +26,11 @@ def generate_trip_logs(country: str) -> Path:
     data_dir = Path("data/processed")
     drivers  = pd.read_csv(data_dir / "sample_drivers.csv")\
                  .query("country == @country.upper()")
-    bookings = pd.read_csv(data_dir / f"{country}.csv")
+    bookings = read_bookings(country, columns=[
+        "booking_id", "requested_time", "move_size", "city",
+        "pickup_lat", "pickup_lon", "dropoff_lat", "dropoff_lon",
+        "distance_m", "duration_s",
+    ])
 
     start_date = pd.Timestamp.utcnow().normalize() - pd.Timedelta(days=days-1)
 
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the API code imports its own packages top-level (routes.*, services.*),
+# as it runs with PYTHONPATH=.:apps/api/app
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps" / "api" / "app"))
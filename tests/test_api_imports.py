@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+GEO = ("geopandas", "shapely", "pyproj", "fiona", "pyrosm")
+
+
+def test_api_router_imports_without_the_geospatial_stack():
+    # fresh interpreter: this one has geopandas loaded by other tests
+    probe = ("import sys, apps.api.app.routes.router; "
+             f"print(sorted(m for m in sys.modules if m.split('.')[0] in {GEO!r}))")
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True,
+                         env={"PYTHONPATH": f"{ROOT}:{ROOT / 'apps' / 'api' / 'app'}"}, check=True)
+    assert out.stdout.strip() == "[]"
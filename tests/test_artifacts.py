@@ -0,0 +1,46 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from pipelines.artifacts import BookingSink, bookings_path, read_bookings
+from pipelines.process_helper import iter_bookings
+
+
+STOPS = pd.DataFrame({
+    "stop_id": ["001", "002", "003"],
+    "stop_lat": [9.93, 9.94, 9.95],
+    "stop_lon": [-84.08, -84.09, -84.10],
+    "classify_truck": ["large", "medium", "small"],
+})
+
+
+def test_sink_streams_batches_into_one_artifact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    batches = [*iter_bookings(STOPS, "sjo", 300, seed=1, chunk_rows=100),
+               *iter_bookings(STOPS, "lib", 50, seed=1, chunk_rows=100)]
+
+    with BookingSink("cr", export_csv=True) as sink:
+        for batch in batches:
+            sink.write(batch)
+            assert not bookings_path("cr").exists()   # only swapped in at the end
+
+    assert pq.ParquetFile(sink.path).num_row_groups == len(batches)
+    df = read_bookings("cr")
+    assert len(df) == sink.rows == 350
+    assert df["city"].tolist() == ["sjo"] * 300 + ["lib"] * 50
+    assert df["pickup_stop_id"].str.startswith("00").all()
+    assert len(pd.read_csv(bookings_path("cr", ".csv"))) == 350
+
+
+def test_failed_sink_keeps_previous_artifact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with BookingSink("cr") as sink:
+        sink.write(next(iter_bookings(STOPS, "sjo", 10, seed=1)))
+
+    with pytest.raises(RuntimeError):
+        with BookingSink("cr") as sink:
+            sink.write(next(iter_bookings(STOPS, "sjo", 20, seed=2)))
+            raise RuntimeError("boom")
+
+    assert len(read_bookings("cr")) == 10
+    assert sorted(p.name for p in bookings_path("cr").parent.iterdir()) == ["cr.parquet"]
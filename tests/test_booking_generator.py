@@ -0,0 +1,49 @@
+import pandas as pd
+
+from pipelines.process_helper import generate_bookings, iter_bookings
+
+
+STOPS = pd.DataFrame({
+    "stop_id": ["001", "002", "003", "004"],
+    "stop_lat": [4.60, 4.61, 4.62, 4.63],
+    "stop_lon": [-74.10, -74.11, -74.12, -74.13],
+    "classify_truck": ["large", "medium", "small", None],
+})
+
+
+def _draw(seed, n=500, chunk_rows=128):
+    return pd.concat(iter_bookings(STOPS, "bog", n, seed=seed, chunk_rows=chunk_rows),
+                     ignore_index=True)
+
+
+def test_bookings_are_deterministic_per_seed():
+    a = _draw(7)
+    assert a.equals(_draw(7))
+    assert not a.equals(_draw(8))
+    assert a["booking_id"].iloc[[0, -1]].tolist() == ["BOG_BKG_0001", "BOG_BKG_0500"]
+
+
+def test_bookings_respect_stop_and_truck_rules():
+    df = _draw(1)
+    assert (df["pickup_stop_id"] != df["dropoff_stop_id"]).all()
+    assert df["requested_time"].str.match(r"^2025-07-\d\d \d\d:\d\d$").all()
+
+    rank = {"small": 0, "medium": 1, "large": 2}
+    for _, r in df.iterrows():
+        pu, do = r["pickup_truck_type"], r["dropoff_truck_type"]
+        if pu in rank and do in rank:
+            expected = min(pu, do, key=rank.get)
+        else:
+            expected = "small"
+        assert r["required_truck_type"] == expected
+
+
+def test_generate_bookings_writes_the_file_or_clears_it_for_zero(tmp_path):
+    STOPS.to_csv(tmp_path / "stops_truck_only.csv", index=False)
+    out = tmp_path / "booking_requests.csv"
+    assert generate_bookings(tmp_path, "bog", 300, seed=1) == 300
+    assert len(pd.read_csv(out)) == 300
+
+    # no bookings asked for: no error, and the old file doesn't linger
+    assert generate_bookings(tmp_path, "bog", 0, seed=1) == 0
+    assert not out.exists()
@@ -0,0 +1,55 @@
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import LineString
+
+from pipelines.contraction import build_ch, load_city_ch
+from pipelines.road_graph import graph_path
+from pipelines.road_graph_build import build_city_graph, build_road_graph
+
+
+def _grid_city(n=15, step=0.002, seed=0):
+    # n × n street grid with a few arterials and shape points on the avenues
+    rng = np.random.default_rng(seed)
+    lines, highway = [], []
+    for i in range(n):
+        for j in range(n - 1):
+            x, y0, y1 = -99.2 + i * step, 19.4 + j * step, 19.4 + (j + 1) * step
+            mid = (x + rng.normal(0, step * 0.1), (y0 + y1) / 2)
+            lines += [LineString([(x, y0), mid, (x, y1)]),
+                      LineString([(-99.2 + j * step, 19.4 + i * step),
+                                  (-99.2 + (j + 1) * step, 19.4 + i * step)])]
+            highway += ["primary" if i % 5 == 0 else "residential",
+                        "secondary" if i % 4 == 0 else "residential"]
+    return gpd.GeoDataFrame({"id": range(len(lines)), "highway": highway,
+                             "classify_truck": "large"},
+                            geometry=lines, crs="EPSG:4326").to_crs("EPSG:3857")
+
+
+def test_ch_tables_match_dijkstra():
+    graph = build_road_graph(_grid_city())
+    ch = build_ch(graph)
+    rng = np.random.default_rng(1)
+    nodes = rng.choice(graph.n_nodes, 60, replace=False)
+    nodes[5] = -1                                   # a stop off the network
+
+    length, time_s = ch.many_to_many(nodes, nodes, dtype=float)
+    ref_len, ref_time = graph.one_to_many(nodes, nodes)
+    np.testing.assert_allclose(time_s, ref_time, rtol=1e-5)
+    np.testing.assert_allclose(length, ref_len, rtol=1e-5)
+    assert np.isnan(time_s[5]).all() and np.isnan(time_s[:, 5]).all()
+    assert (np.diag(time_s)[nodes >= 0] == 0).all()
+
+
+def test_city_ch_follows_the_graph_it_was_built_from(tmp_path):
+    roads = tmp_path / "zz" / "mex_roads.parquet"
+    roads.parent.mkdir()
+    _grid_city(n=4).to_parquet(roads)
+    build_city_graph("zz", "mex", root=tmp_path)
+    graph, ch = load_city_ch("zz", "mex", root=tmp_path)
+    assert len(ch.rank) == graph.n_nodes
+
+    # a new graph on disk – even one whose "graph" stage went unrecorded –
+    # means a new hierarchy
+    build_road_graph(_grid_city(n=6)).save(graph_path("zz", "mex", root=tmp_path))
+    graph, ch = load_city_ch("zz", "mex", root=tmp_path)
+    assert len(ch.rank) == graph.n_nodes > 4 * 4
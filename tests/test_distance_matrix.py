@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.artifacts import BookingSink
+from pipelines.process_helper import iter_bookings
+from pipelines.stop_matrix import read_stop_matrix
+from services.distance_matrix import build_matrices
+
+STOPS = pd.DataFrame({
+    "stop_id": [f"{i:03d}" for i in range(30)],
+    "stop_lat": np.linspace(9.90, 9.99, 30),
+    "stop_lon": np.linspace(-84.15, -84.05, 30),
+    "classify_truck": "large",
+})
+
+
+def test_stop_tables_fill_booked_pairs_without_adding_cells(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with BookingSink("zz") as sink:            # no enrichment: every distance unknown
+        sink.write(next(iter_bookings(STOPS, "sjo", 40, seed=1)))
+
+    # a road-graph table over 200 stops, the 30 booked ones among them
+    ids = np.array([f"{i:03d}" for i in range(200)])
+    dist = np.add.outer(np.arange(200) * 1000.0, np.arange(200)).astype(np.float32)
+    city = tmp_path / "tmp" / "zz" / "sjo"
+    city.mkdir(parents=True)
+    STOPS.to_csv(city / "stops_truck_only.csv", index=False)
+    np.savez(city / "stop_tables.npz", stop_id=ids, distance_m=dist, duration_s=dist / 10)
+
+    build_matrices("zz")
+    m = read_stop_matrix("zz")
+    booked = pd.read_parquet(tmp_path / "data" / "processed" / "zz.parquet")
+    booked = booked[["pickup_stop_id", "dropoff_stop_id"]].drop_duplicates()
+    n = len(set(booked["pickup_stop_id"]) | set(booked["dropoff_stop_id"]))
+    assert m.nnz == len(booked) + n < n * n               # booked pairs + diagonal
+
+    d, t = m.lookup(booked["pickup_stop_id"], booked["dropoff_stop_id"])
+    want = booked["pickup_stop_id"].astype(int) * 1000 + booked["dropoff_stop_id"].astype(int)
+    np.testing.assert_allclose(d, want)
+    np.testing.assert_allclose(t, want / 10)
@@ -0,0 +1,25 @@
+import math
+
+from apps.api.app.services.enrich_checkpoint import PairCheckpoint
+
+
+def test_checkpoint_survives_a_torn_write_and_resumes(tmp_path):
+    path = tmp_path / "booking_requests_dist.ckpt.csv"
+    with PairCheckpoint(path, every=2) as ckpt:
+        ckpt.add([("s1", "s2", 1200.5, 150.25), ("s1", "s3", float("nan"), None)])
+        ckpt.add([("s2", "s3", 900.0, 80.0)])          # flushed on exit
+    assert ckpt.written == 3
+
+    with open(path, "a") as f:                          # killed mid-line
+        f.write("s3,s1,12")
+
+    ckpt = PairCheckpoint(path, every=1)
+    done = ckpt.load()
+    assert set(done) == {("s1", "s2"), ("s1", "s3"), ("s2", "s3")}
+    assert done["s1", "s2"] == (1200.5, 150.25)
+    assert math.isnan(done["s1", "s3"][0])
+
+    ckpt.add([("s3", "s1", 1250.0, 160.0)])
+    assert ckpt.load()["s3", "s1"] == (1250.0, 160.0)
+    ckpt.remove()
+    assert not path.exists()
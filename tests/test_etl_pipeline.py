@@ -0,0 +1,97 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+from shapely.geometry import LineString
+
+from pipelines import road_graph_build
+from pipelines.etl_base import ETLPipeline
+from pipelines.stage_cache import StageCache
+
+
+STOPS = pd.DataFrame({
+    "stop_id": ["001", "002", "003"],
+    "stop_lat": [4.60, 4.61, 4.62],
+    "stop_lon": [-74.10, -74.11, -74.12],
+    "classify_truck": ["large", "medium", "small"],
+})
+
+
+class FakePipeline(ETLPipeline):
+    # two cities, no raw data: stop filtering is stubbed out
+    CITY_META = {"aaa": ([], (-74.2, 4.5, -74.0, 4.7), "aaa"),
+                 "bbb": ([], (-74.2, 4.5, -74.0, 4.7), "bbb")}
+    TRUCK_CLASSES = {"small", "medium", "large"}
+
+    def __init__(self, cc="zz", workers=None):
+        super().__init__(cc, workers)
+        self.filtered = []
+
+    def extract(self):
+        pass
+
+    def _filter_stops(self, code, cache, roads_key):
+        self.filtered.append(code)
+        STOPS.iloc[:0].to_csv(self.tmp / code / "stop_aliases.csv", index=False)
+        return STOPS
+
+
+def test_transform_runs_every_city_then_reuses_cached_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("NUM_BOOKINGS", "20")
+    for code in FakePipeline.CITY_META:
+        (tmp_path / "tmp" / "zz" / code).mkdir(parents=True)
+
+    p = FakePipeline()
+    p.load(p.transform(None))
+    assert p.filtered == ["aaa", "bbb"]
+    out = pd.read_parquet(tmp_path / "data" / "processed" / "zz.parquet")
+    assert len(out) == 40
+    assert out["booking_id"].str[:3].tolist() == ["AAA"] * 20 + ["BBB"] * 20
+
+    # unchanged inputs: bookings come straight from the stage cache
+    p = FakePipeline()
+    p.load(p.transform(None))
+    assert p.filtered == []
+
+    # a different booking count rebuilds bookings but not the stops
+    monkeypatch.setenv("NUM_BOOKINGS", "5")
+    p = FakePipeline()
+    p.load(p.transform(None))
+    assert p.filtered == []
+    assert len(pd.read_parquet(tmp_path / "data" / "processed" / "zz.parquet")) == 10
+
+
+def test_run_report_puts_booking_generation_under_transform(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("NUM_BOOKINGS", "20")
+    for code in FakePipeline.CITY_META:
+        (tmp_path / "tmp" / "zz" / code).mkdir(parents=True)
+
+    p = FakePipeline()
+    p.run()
+    spans = {(s["name"], s["city"]): s for s in p.report.spans}
+    assert [s["name"] for s in p.report.spans][-3:] == ["transform", "load", "run"]
+    for code in FakePipeline.CITY_META:
+        assert spans["city", code]["parent"] == "transform"
+        assert spans["bookings", code]["parent"] == "city"
+    assert (tmp_path / "data" / "processed" / "zz.parquet").exists()
+
+
+def test_city_graph_stage_survives_the_bookings_record(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("NUM_BOOKINGS", "20")
+    for code in FakePipeline.CITY_META:
+        (tmp_path / "tmp" / "zz" / code).mkdir(parents=True)
+    gpd.GeoDataFrame({"highway": ["trunk"], "classify_truck": ["large"]},
+                     geometry=[LineString([(-74.1, 4.6), (-74.0, 4.6)])],
+                     crs="EPSG:4326").to_parquet(tmp_path / "tmp" / "zz" / "aaa_roads.parquet")
+
+    FakePipeline().transform(None)
+    manifest = StageCache(tmp_path / "tmp" / "zz" / "aaa_manifest.json")
+    assert {"graph", "stops", "bookings"} <= set(manifest.data["stages"])
+    assert (tmp_path / "tmp" / "zz" / "aaa_graph.npz").exists()
+
+    # cached rerun: the graph is not rebuilt
+    monkeypatch.setattr(road_graph_build, "build_road_graph",
+                        lambda roads: pytest.fail("graph rebuilt"))
+    FakePipeline().transform(None)
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+from apps.api.app.routes.geocode_cache import GeocodeCache, geocode_key
+
+
+def test_key_folds_spelling_and_rounds_focus():
+    a = geocode_key("mx", "Plaza  Satélite, Naucalpan", focus=(19.5091, -99.2331),
+                    prefer_layers=["street", "address"])
+    b = geocode_key("MX", "plaza satelite naucalpan", focus=(19.5088, -99.2329),
+                    prefer_layers=["address", "street"])
+    assert a == b
+    assert a != geocode_key("co", "plaza satelite naucalpan", focus=(19.5088, -99.2329),
+                            prefer_layers=["address", "street"])
+
+
+def test_concurrent_misses_share_one_fetch_and_persist(tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return 19.5, -99.2
+
+    cache = GeocodeCache(tmp_path / "geo.sqlite")
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(cache.resolve("k", fetch)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == [(19.5, -99.2)] * 8 and len(calls) == 1
+
+    # a fresh process-level cache finds it in the store
+    again = GeocodeCache(tmp_path / "geo.sqlite")
+    assert again.resolve("k", lambda: pytest.fail("refetched")) == (19.5, -99.2)
+
+
+def test_errors_reach_every_waiter_and_are_not_cached(tmp_path):
+    cache = GeocodeCache(None)
+
+    def boom():
+        raise RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        cache.resolve("k", boom)
+    assert cache.resolve("k", lambda: (1.0, 2.0)) == (1.0, 2.0)
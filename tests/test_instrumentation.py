@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+import pytest
+
+from pipelines import instrumentation
+from pipelines.instrumentation import RunReport
+
+FIELDS = {"name", "city", "parent", "pid", "wall_s", "cpu_s",
+          "peak_rss_mb", "rss_growth_mb", "child_peak_rss_mb"}
+
+
+def _touch(mb: int) -> int:
+    # allocate and write mb MiB so it counts towards RSS
+    block = np.ones(mb * 2**20, dtype=np.uint8)
+    return int(block[::4096].sum())
+
+
+def test_spans_nest_and_inherit_the_city(tmp_path):
+    report = RunReport("zz")
+    with report.span("run"):
+        with report.span("city", city="bog"):
+            with report.span("snap"):
+                pass
+        with report.span("load"):
+            pass
+
+    by_name = {s["name"]: s for s in report.spans}
+    assert [s["name"] for s in report.spans] == ["snap", "city", "load", "run"]
+    assert (by_name["snap"]["parent"], by_name["snap"]["city"]) == ("city", "bog")
+    assert (by_name["city"]["parent"], by_name["load"]["parent"]) == ("run", "run")
+    assert by_name["load"]["city"] is None and by_name["run"]["parent"] is None
+    assert all(set(s) == FIELDS for s in report.spans)    # no bookkeeping leaks out
+
+    doc = json.loads(report.write(tmp_path).read_text())
+    assert set(doc) == {"country", "started_at", "spans"}
+    assert doc["country"] == "zz" and doc["spans"] == report.spans
+
+
+@pytest.mark.skipif(instrumentation._proc_rss() is None or not instrumentation._reset_peak(),
+                    reason="needs a resettable /proc RSS high-water mark")
+def test_peak_rss_is_per_span_not_the_run_high_water_mark():
+    report = RunReport("zz")
+    with report.span("run"):
+        with report.span("big"):
+            _touch(200)
+        with report.span("small"):
+            _touch(20)
+
+    by_name = {s["name"]: s for s in report.spans}
+    assert by_name["big"]["rss_growth_mb"] >= 150
+    assert by_name["small"]["rss_growth_mb"] < 100          # not the 200 MiB of "big"
+    assert by_name["small"]["peak_rss_mb"] < by_name["big"]["peak_rss_mb"]
+    # the enclosing span still sees its children's peaks
+    assert by_name["run"]["peak_rss_mb"] >= by_name["big"]["peak_rss_mb"]
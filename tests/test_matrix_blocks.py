@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from routes.openrouteservice_wrapper import (MATRIX_MAX_ELEMENTS, OpenRouteServiceWrapper,
+                                             matrix_block_shape)
+from services import compute_distance, rate_limit
+from services.enrich_checkpoint import PairCheckpoint
+from services.rate_limit import RateLimiter
+
+
+def _distance(src, dst) -> float:
+    # every (lon, lat) pair gets its own, exactly representable answer
+    return src[0] * 1000 + dst[0]
+
+
+class FakeMatrix:
+    """matrix_once() that answers locally and remembers each block."""
+
+    profile = "driving-hgv"
+
+    def __init__(self):
+        self.blocks: list[tuple[list, list]] = []
+
+    def matrix_once(self, sources, destinations):
+        assert len(sources) * len(destinations) <= MATRIX_MAX_ELEMENTS
+        self.blocks.append((list(sources), list(destinations)))
+        dist = [[_distance(s, d) for d in destinations] for s in sources]
+        return 200, {"distance_m": dist, "duration_s": [[v / 10 for v in row] for row in dist]}, None
+
+
+@pytest.mark.parametrize("n_src, n_dst", [(1, 1), (1, 9000), (9000, 1), (40, 500),
+                                          (500, 40), (59, 59), (60, 60), (300, 1000)])
+def test_block_shape_fits_the_element_cap(n_src, n_dst):
+    rows, cols = matrix_block_shape(n_src, n_dst)
+    assert rows * cols <= MATRIX_MAX_ELEMENTS
+    assert 1 <= rows <= max(1, n_src) and 1 <= cols <= max(1, n_dst)
+    # small sides aren't split further than the cap forces
+    if n_src * n_dst <= MATRIX_MAX_ELEMENTS:
+        assert (rows, cols) == (n_src, n_dst)
+
+
+def test_get_matrix_scatters_every_block_back(monkeypatch):
+    fake = FakeMatrix()
+    client = OpenRouteServiceWrapper(api_key="test", cache=False)
+    monkeypatch.setattr(client, "matrix_once", fake.matrix_once)
+    src = [(float(i), 4.6) for i in range(70)]
+    dst = [(float(500 + j), 4.7) for j in range(130)]
+
+    out = client.get_matrix(src, dst)
+    assert len(fake.blocks) > 1
+    assert sum(len(s) * len(d) for s, d in fake.blocks) == len(src) * len(dst)
+    expected = np.array([[_distance(s, d) for d in dst] for s in src])
+    np.testing.assert_array_equal(out["distance_m"], expected)
+    np.testing.assert_array_equal(out["duration_s"], expected / 10)
+
+
+def test_enrichment_matrix_mode_fetches_only_booked_blocks(tmp_path, monkeypatch):
+    fake = FakeMatrix()
+    monkeypatch.setattr(compute_distance, "_ors", lambda: fake)
+    monkeypatch.setattr(compute_distance, "route_cache", lambda: None)
+    monkeypatch.setattr(rate_limit, "_installed", RateLimiter(rpm=1e9, burst=100))
+
+    # ~150 pickup × ~120 dropoff stops → a grid of 59 × 59 blocks, but
+    # pickups of the first block only ever go to dropoffs of the first
+    rng = np.random.default_rng(0)
+    pu = np.concatenate([np.arange(150), rng.integers(59, 150, 300)])
+    do = np.concatenate([np.arange(150) % 59, rng.integers(0, 120, 300)])
+    do[150:] = np.where(pu[150:] < 59, do[150:] % 59, do[150:])
+    df = pd.DataFrame({
+        "pickup_stop_id": [f"p{i:03d}" for i in pu], "dropoff_stop_id": [f"d{j:03d}" for j in do],
+        "pickup_lon": pu.astype(float), "pickup_lat": 4.6,
+        "dropoff_lon": 500.0 + do, "dropoff_lat": 4.7,
+    })
+
+    with PairCheckpoint(tmp_path / "bookings_dist.ckpt.csv") as ckpt:
+        dist, dur, pairs = compute_distance._matrix(df, "test", ckpt)
+
+    want = df["pickup_lon"] * 1000 + df["dropoff_lon"]
+    np.testing.assert_array_equal(dist, want)
+    np.testing.assert_array_equal(dur, want / 10)
+    rows, cols = matrix_block_shape(df["pickup_stop_id"].nunique(), df["dropoff_stop_id"].nunique())
+    booked = {(i // rows, j // cols) for i, j in zip(pd.factorize(df["pickup_stop_id"])[0],
+                                                     pd.factorize(df["dropoff_stop_id"])[0])}
+    assert (0, 1) not in booked and len(fake.blocks) == len(booked)
+    assert all(len(s) * len(d) <= MATRIX_MAX_ELEMENTS for s, d in fake.blocks)
+
+    # every returned cell is kept, against the right stop pair
+    assert len(pairs) == sum(len(s) * len(d) for s, d in fake.blocks)
+    assert not pairs.duplicated(["pickup_stop_id", "dropoff_stop_id"]).any()
+    lon = lambda ids, base: base + ids.str[1:].astype(int)
+    np.testing.assert_array_equal(pairs["distance_m"], lon(pairs["pickup_stop_id"], 0) * 1000
+                                  + lon(pairs["dropoff_stop_id"], 500))
+
+
+class FakeRouter:
+    """LocalRouter.matrix() answering from coordinates, remembering each call."""
+
+    def __init__(self):
+        self.calls: list[tuple[int, int]] = []
+
+    def matrix(self, sources, destinations):
+        self.calls.append((len(sources), len(destinations)))
+        dist = np.array([[_distance(s, d) for d in destinations] for s in sources])
+        return {"distance_m": dist, "duration_s": dist / 10}
+
+
+def test_local_routing_covers_only_the_booked_pairs(monkeypatch):
+    monkeypatch.setattr(compute_distance, "LOCAL_BATCH", 8)
+    rng = np.random.default_rng(3)
+    pu, do = rng.integers(0, 40, 300), rng.integers(0, 200, 300)
+    df = pd.DataFrame({
+        "pickup_stop_id": [f"p{i:03d}" for i in pu], "dropoff_stop_id": [f"d{j:03d}" for j in do],
+        "pickup_lon": pu.astype(float), "pickup_lat": 4.6,
+        "dropoff_lon": 500.0 + do, "dropoff_lat": 4.7,
+    })
+
+    router = FakeRouter()
+    dist, dur, pairs = compute_distance._local(df, "test", router)
+    want = df["pickup_lon"] * 1000 + df["dropoff_lon"]
+    np.testing.assert_array_equal(dist, want)
+    np.testing.assert_array_equal(dur, want / 10)
+
+    booked = df[["pickup_stop_id", "dropoff_stop_id"]].drop_duplicates()
+    assert len(pairs) == len(booked)
+    assert set(map(tuple, pairs[["pickup_stop_id", "dropoff_stop_id"]].to_numpy())) \
+        == set(map(tuple, booked.to_numpy()))
+    # never the whole 40 × 200 table: ≤ 8 pickups against their own dropoffs
+    assert all(s <= 8 for s, _ in router.calls)
+    assert sum(s * d for s, d in router.calls) < 40 * df["dropoff_stop_id"].nunique()
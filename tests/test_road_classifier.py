@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.road_network import _classify_road_row, classify_roads
+
+
+def test_classify_roads_matches_row_wise_rules():
+    roads = pd.DataFrame({
+        "highway":   ["primary", "secondary", "residential", "unclassified",
+                      "primary", "service", "track", "trunk", "footway", "tertiary"],
+        "access":    [None, "no", "Private", None, None, None, "yes", None, None, np.nan],
+        "hgv":       [None, None, None, None, "NO", None, None, None, None, None],
+        "maxweight": [None, None, None, "3.5", None, "7.5 t", "12t", np.nan, "none", "2.5 st"],
+    })
+    expected = roads.apply(_classify_road_row, axis=1)
+    got = classify_roads(roads)
+    assert got.tolist() == expected.tolist()
+    assert got.tolist() == ["large", "forbidden", "forbidden", "small", "forbidden",
+                            "medium", "large", "large", "forbidden", "medium"]
+
+
+def test_classify_roads_without_optional_tags():
+    roads = pd.DataFrame({"highway": ["primary", "residential", "cycleway"]})
+    assert classify_roads(roads).tolist() == ["large", "small", "forbidden"]
+
+
+def test_tiled_snapping_matches_whole_city():
+    import geopandas as gpd
+    from shapely.geometry import LineString, box
+    from pipelines.road_network import assign_tiles, make_tiles, snap_stops
+
+    rng = np.random.default_rng(0)
+    bbox = (-84.2, 9.8, -83.9, 10.1)
+    starts = rng.uniform([bbox[0], bbox[1]], [bbox[2], bbox[3]], (400, 2))
+    roads = gpd.GeoDataFrame(
+        {"classify_truck": rng.choice(["small", "medium", "large", "forbidden"], 400)},
+        geometry=[LineString([p, p + rng.normal(0, 0.004, 2)]) for p in starts],
+        crs="EPSG:4326",
+    )
+    lonlat = rng.uniform([bbox[0], bbox[1]], [bbox[2], bbox[3]], (3000, 2))
+    stops = pd.DataFrame({"stop_id": [f"s{i}" for i in range(3000)],
+                          "stop_lon": lonlat[:, 0], "stop_lat": lonlat[:, 1]})
+
+    tiles = make_tiles(bbox, 0.07)
+    owner = assign_tiles(stops, bbox, 0.07)
+    assert len(tiles) == 25 and set(owner) <= set(range(25))
+    parts = [snap_stops(stops[owner == i], roads[roads.intersects(box(*tiles[i][1]))])
+             for i in np.unique(owner)]
+    tiled = pd.concat(parts).sort_index()
+
+    whole = snap_stops(stops, roads)
+    assert len(whole) > 50
+    assert tiled.equals(whole)
@@ -0,0 +1,50 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from pipelines.road_graph import read_city_graph
+from pipelines.road_graph_build import build_city_graph, build_road_graph
+
+
+# A ──residential── B        direct A→B: 2 km of residential (20 km/h)
+#  \               /         detour A→C→B: 2 × ~1.5 km of trunk (70 km/h)
+#   ────trunk── C ─
+A, B, C = (-84.10, 9.93), (-84.0818, 9.93), (-84.0909, 9.92)
+ROADS = gpd.GeoDataFrame(
+    {
+        "id": [1, 2, 3, 4],
+        "highway": ["residential", "trunk", "trunk", "primary"],
+        "classify_truck": ["small", "large", "large", "forbidden"],
+    },
+    geometry=[LineString([A, B]), LineString([A, C]), LineString([C, B]),
+              LineString([A, (-84.09, 9.94), B])],
+    crs="EPSG:4326",
+).to_crs("EPSG:3857")
+
+
+def test_fastest_path_and_its_length():
+    g = build_road_graph(ROADS)
+    nodes, snap_m = g.snap([A[0], B[0], -84.2], [A[1], B[1], 9.93])
+    assert (nodes[:2] >= 0).all() and snap_m[0] < 1
+    assert nodes[2] == -1                      # 10 km off the network
+
+    length, time_s = g.one_to_many(nodes[:1], nodes[1:])
+    assert np.isnan(length[0, 1])
+    # the trunk detour wins on time; its length is the two trunk legs
+    assert 2950 < length[0, 0] < 3030
+    assert time_s[0, 0] == pytest.approx(length[0, 0] / (70 / 3.6))
+
+
+def test_tile_caches_merge_into_one_graph(tmp_path):
+    tiles = tmp_path / "zz" / "big_tiles"
+    tiles.mkdir(parents=True)
+    # overlapping tiles repeat the trunk leg A–C
+    ROADS.iloc[[0, 1]].to_parquet(tiles / "0_roads.parquet")
+    ROADS.iloc[[1, 2]].to_parquet(tiles / "1_roads.parquet")
+
+    assert read_city_graph("zz", "big", root=tmp_path) is None
+    g = build_city_graph("zz", "big", root=tmp_path)
+    assert g.n_nodes == 3 and g.n_edges == 6
+    assert (tmp_path / "zz" / "big_graph.npz").exists()
+    assert read_city_graph("zz", "big", root=tmp_path).n_edges == 6
@@ -0,0 +1,37 @@
+import math
+
+from apps.api.app.routes.route_cache import RouteCache
+
+
+A, B = (-74.05123456, 4.61), (-74.1, 4.7)
+
+
+def test_cache_round_trip_quantizes_and_skips_errors(tmp_path):
+    cache = RouteCache(tmp_path / "routes.sqlite")
+    assert cache.get("driving-car", A, B) is None
+
+    written = cache.put_many("driving-car", [(A, B), (B, A), (A, A)], [
+        {"distance_m": 1200.0, "duration_s": 150.0},
+        {"distance_m": math.nan, "duration_s": math.nan},   # ORS: no route
+        {"error": "503: busy"},                              # never stored
+    ])
+    assert written == 2 and len(cache) == 2
+
+    # same stop after a float round-trip still hits
+    hit = cache.get("driving-car", (A[0] + 1e-9, A[1]), B)
+    assert hit == {"distance_m": 1200.0, "duration_s": 150.0}
+    assert math.isnan(cache.get("driving-car", B, A)["distance_m"])
+    assert cache.get("driving-car", A, A) is None
+    assert cache.get("driving-hgv", A, B) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = RouteCache(tmp_path / "routes.sqlite", max_rows=10, evict_every=1)
+    pairs = [((i / 100, 0.0), (0.0, i / 100)) for i in range(10)]
+    cache.put_many("p", pairs, [{"distance_m": i, "duration_s": i} for i in range(10)])
+    cache.get("p", *pairs[0])                      # oldest, but just used
+
+    cache.put("p", (1.0, 1.0), (2.0, 2.0), {"distance_m": 1, "duration_s": 1})
+    assert len(cache) == 9
+    assert cache.get("p", *pairs[0]) is not None
+    assert cache.get("p", (1.0, 1.0), (2.0, 2.0)) is not None
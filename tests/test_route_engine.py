@@ -0,0 +1,121 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import rate_limit, route_engine
+from services.rate_limit import RateLimiter
+
+
+class Clock:
+    # stands in for time.monotonic / time.sleep inside rate_limit
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, s):
+        self.now += s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", c.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", c.sleep)
+    return c
+
+
+def test_reserve_spaces_requests_after_the_burst(clock):
+    lim = RateLimiter(rpm=60, burst=3)
+    assert [lim.reserve() for _ in range(5)] == [0, 0, 0, 1.0, 2.0]
+
+    clock.now += 10                    # idle: the bucket refills up to burst
+    assert [lim.reserve() for _ in range(4)] == [0, 0, 0, 1.0]
+
+
+def test_acquire_sleeps_for_its_slot_and_pause_holds_everyone(clock):
+    lim = RateLimiter(rpm=120)         # one every 0.5 s
+    assert [lim.acquire() for _ in range(3)] == [0, 0.5, 0.5]
+    assert clock.now == 1001.0
+
+    lim.pause(5)
+    assert lim.reserve() == pytest.approx(5.0)
+    assert lim.reserve() == pytest.approx(5.5)
+
+
+class FakeORS:
+    """once() that answers from a script of (status, result, retry_after)."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def once(self, *args):
+        self.calls += 1
+        return self.script.pop(0)
+
+
+class Limiter:
+    def __init__(self):
+        self.paused = []
+
+    def reserve(self):
+        return 0.0
+
+    def pause(self, s):
+        self.paused.append(s)
+
+
+def _call(ors, limiter=None):
+    stats = {"requests": 0, "retries": 0, "throttled": 0}
+
+    async def go():
+        with ThreadPoolExecutor(1) as pool:
+            return await route_engine._call(ors.once, ("a", "b"), limiter or Limiter(), pool, stats)
+    return asyncio.run(go()), stats
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    waits = []
+
+    async def sleep(s):
+        waits.append(s)
+    monkeypatch.setattr(route_engine.asyncio, "sleep", sleep)
+    return waits
+
+
+OK = (200, {"distance_m": 1.0, "duration_s": 2.0}, None)
+
+
+def test_call_retries_server_errors_with_backoff(no_backoff):
+    ors = FakeORS((503, {"error": "busy"}, None), (0, {"error": "reset"}, None), OK)
+    result, stats = _call(ors)
+    assert result == OK[1]
+    assert stats == {"requests": 3, "retries": 2, "throttled": 0}
+    assert [w for w in no_backoff if w] == [1.0, 2.0]       # 2**attempt
+
+
+def test_call_pauses_the_shared_budget_on_429(no_backoff):
+    limiter = Limiter()
+    result, stats = _call(FakeORS((429, {"error": "quota"}, 7.0), OK), limiter)
+    assert result == OK[1]
+    assert limiter.paused == [7.0]                            # Retry-After honoured
+    assert stats == {"requests": 2, "retries": 1, "throttled": 1}
+    assert not any(no_backoff)                                # no local sleep on top
+
+
+def test_call_gives_up_on_4xx_and_after_max_retries(no_backoff, monkeypatch):
+    ors = FakeORS((404, {"error": "no route"}, None), OK)
+    result, stats = _call(ors)
+    assert result == {"error": "no route"} and ors.calls == 1 and stats["retries"] == 0
+
+    monkeypatch.setattr(route_engine, "MAX_RETRIES", 2)
+    result, stats = _call(FakeORS(*[(502, {"error": "bad gateway"}, None)] * 3))
+    assert result == {"error": "bad gateway"} and stats["requests"] == 2
+
+    monkeypatch.setattr(route_engine, "MAX_RETRIES", 0)      # still tried once
+    result, stats = _call(FakeORS((500, {"error": "boom"}, None)))
+    assert result == {"error": "boom"} and stats["requests"] == 1
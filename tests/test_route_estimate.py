@@ -0,0 +1,37 @@
+from routes import api_loaders
+
+START, END = (-84.10, 9.93), (-84.08, 9.93)
+
+
+class Router:
+    def __init__(self, res):
+        self.res = res
+
+    def get_route(self, start, end):
+        return self.res
+
+
+class Cache:
+    def __init__(self, hit):
+        self.hit = hit
+
+    def get(self, profile, start, end):
+        return self.hit
+
+
+def test_route_estimate_names_where_the_answer_came_from(monkeypatch):
+    monkeypatch.delenv("ORS_API_KEY", raising=False)
+    monkeypatch.setattr(api_loaders, "route_cache", lambda: Cache(None))
+    monkeypatch.setattr(api_loaders, "local_router",
+                        lambda cc: Router({"distance_m": 2500.0, "duration_s": 330.0}))
+    assert api_loaders.route_estimate(START, END, "cr") == (2.5, 6, "local_route")
+
+    # an ORS answer cached by an earlier run beats the road graph
+    monkeypatch.setattr(api_loaders, "route_cache",
+                        lambda: Cache({"distance_m": 2600.0, "duration_s": 300.0}))
+    assert api_loaders.route_estimate(START, END, "cr") == (2.6, 5, "ors_route")
+
+    monkeypatch.setattr(api_loaders, "route_cache", lambda: None)
+    monkeypatch.setattr(api_loaders, "local_router",
+                        lambda cc: Router({"error": "no road graph covers these points"}))
+    assert api_loaders.route_estimate(START, END, "cr") == (None, None, None)
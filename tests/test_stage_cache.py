@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from pipelines import stage_cache
+from pipelines.stage_cache import StageCache, stage_key
+
+VERSION = 3
+
+
+def _build(cache: StageCache, src, out, version=VERSION) -> bool:
+    # a stage keyed on one input file and a code version; True = rebuilt
+    key = stage_key(cache.digest(src), version)
+    if cache.fresh("roads", key, out):
+        return False
+    out.write_text(src.read_text().upper())
+    cache.record("roads", key, out)
+    return True
+
+
+def test_stage_rebuilds_only_when_inputs_version_or_outputs_change(tmp_path):
+    manifest = tmp_path / "zz_manifest.json"
+    src, out = tmp_path / "city.pbf", tmp_path / "roads.parquet"
+    src.write_text("v1")
+
+    assert _build(StageCache(manifest), src, out)
+    # a new process reads the manifest back: nothing to do
+    assert not _build(StageCache(manifest), src, out)
+
+    src.write_text("v2 – new extract")
+    assert _build(StageCache(manifest), src, out)
+    assert not _build(StageCache(manifest), src, out)
+
+    assert _build(StageCache(manifest), src, out, version=VERSION + 1)
+
+    out.unlink()
+    assert _build(StageCache(manifest), src, out, version=VERSION + 1)
+
+
+def test_stage_keys_chain_and_hash_structure():
+    assert stage_key("a", [1, 2]) == stage_key("a", (1, 2))
+    assert stage_key("a", [1, 2]) != stage_key("a", [2, 1])
+    assert stage_key(None, 1) != stage_key("", 1)
+
+
+def test_digest_reuses_the_manifest_for_unchanged_files(tmp_path, monkeypatch):
+    manifest, src = tmp_path / "m.json", tmp_path / "gtfs.zip"
+    src.write_bytes(b"x" * 10)
+    cache = StageCache(manifest)
+    digest = cache.digest(src)
+    cache.save()
+    assert cache.digest(tmp_path / "missing.zip") is None
+
+    # size + mtime unchanged → no re-hash, even in a fresh process
+    monkeypatch.setattr(stage_cache, "_DIGESTS", {})
+    monkeypatch.setattr(stage_cache, "file_digest", lambda p: pytest.fail("re-hashed"))
+    assert StageCache(manifest).digest(src) == digest
+
+
+def test_manifest_save_is_atomic(tmp_path, monkeypatch):
+    manifest = tmp_path / "m.json"
+    cache = StageCache(manifest)
+    cache.record("clip", "k1")
+    before = manifest.read_text()
+
+    def crash(*_):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(stage_cache.os, "replace", crash)
+    with pytest.raises(OSError):
+        cache.record("clip", "k2")
+    assert manifest.read_text() == before           # old manifest intact
+    assert StageCache(manifest).key_of("clip") == "k1"
+
+    # a corrupt manifest means "nothing cached", not a crash
+    manifest.write_text("{not json")
+    assert StageCache(manifest).key_of("clip") is None
+    assert json.loads(before)["stages"]["clip"]["key"] == "k1"
+
+
+def test_record_keeps_stages_another_instance_recorded(tmp_path):
+    manifest = tmp_path / "m.json"
+    city, graph = StageCache(manifest), StageCache(manifest)   # both open before either writes
+    graph.record("graph", "g1")
+    city.record("bookings", "b1")
+    fresh = StageCache(manifest)
+    assert (fresh.key_of("graph"), fresh.key_of("bookings")) == ("g1", "b1")
+    assert city.key_of("graph") == "g1"
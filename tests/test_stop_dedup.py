@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.stop_dedup import canonicalize, dedup_stops
+
+
+def _pairwise_groups(df, radius_m):
+    # brute-force reference: transitive closure over all pairs ≤ radius
+    lat, lon = np.radians(df["stop_lat"].to_numpy()), np.radians(df["stop_lon"].to_numpy())
+    x = 6_371_008.8 * lon * np.cos(lat.mean())
+    y = 6_371_008.8 * lat
+    close = np.hypot(x[:, None] - x, y[:, None] - y) <= radius_m
+    group = np.arange(len(df))
+    for _ in range(len(df)):
+        group = np.array([group[close[k]].min() for k in range(len(df))])
+    return group
+
+
+def test_dedup_matches_brute_force_and_keeps_first_feed():
+    rng = np.random.default_rng(3)
+    n = 400
+    df = pd.DataFrame({
+        "stop_id": [f"a{i}" for i in range(n)],
+        "stop_lat": 4.60 + rng.uniform(0, 0.004, n),   # dense: many chains
+        "stop_lon": -74.10 + rng.uniform(0, 0.004, n),
+    })
+    stops, aliases = dedup_stops(df, radius_m=12.0)
+
+    group = _pairwise_groups(df, 12.0)
+    assert stops["stop_id"].tolist() == df["stop_id"][group == np.arange(n)].tolist()
+    expected = {df["stop_id"][k]: df["stop_id"][group[k]]
+                for k in range(n) if group[k] != k}
+    assert dict(zip(aliases["stop_id"], aliases["canonical_stop_id"])) == expected
+
+
+def test_cross_feed_duplicates_collapse_to_one_id():
+    df = pd.DataFrame({
+        "stop_id":  ["1001", "1002", "X-77", "X-78", "nan-stop"],
+        "stop_lat": [4.6000, 4.6100, 4.60003, 4.6500, np.nan],
+        "stop_lon": [-74.1000, -74.1000, -74.10002, -74.1000, np.nan],
+    })
+    stops, aliases = dedup_stops(df, radius_m=10.0)
+    assert stops["stop_id"].tolist() == ["1001", "1002", "X-78", "nan-stop"]
+    assert aliases.values.tolist() == [["X-77", "1001"]]
+
+    ids = pd.Series(["X-77", "1002", "X-78"], dtype="string")
+    assert canonicalize(ids, aliases).tolist() == ["1001", "1002", "X-78"]
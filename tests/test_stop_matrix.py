@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from pipelines.stop_matrix import StopMatrix, haversine_m
+
+
+# three stops 1 km apart on a meridian; only a→b and b→a were observed
+LAT = np.array([4.600, 4.609, 4.618])
+LON = np.array([-74.08, -74.08, -74.08])
+
+
+def _matrix(**imputation) -> StopMatrix:
+    return StopMatrix(["a", "b", "c"], row=[1, 0, 0, 1, 2], col=[0, 1, 0, 1, 2],
+                      distance_m=[1300.0, 1250.0, 0, 0, 0], duration_s=[150.0, np.nan, 0, 0, 0],
+                      lat=LAT, lon=LON, **imputation)
+
+
+def test_lookup_round_trip_keeps_only_known_cells(tmp_path):
+    m = StopMatrix.load(_matrix().save(tmp_path / "zz_matrix.npz"))
+    assert m.nnz == 5 and m.n == 3
+
+    d, t = m.lookup(["a", "b", "a", "a", "zz"], ["b", "a", "c", "a", "a"])
+    np.testing.assert_allclose(d[:2], [1250.0, 1300.0])
+    assert np.isnan(t[0]) and t[1] == 150.0
+    assert np.isnan(d[2]) and np.isnan(d[4])      # unobserved pair, unknown stop
+    assert d[3] == 0 and t[3] == 0
+
+
+def test_lookup_time_imputation():
+    m = _matrix(detour=1.3, speed_mps=10.0)
+    d, t = m.lookup(["a", "a", "c"], ["b", "c", "c"], impute=True)
+    # observed pair: averaged with its reverse, missing duration from speed
+    assert d[0] == pytest.approx(1275.0)
+    assert t[0] == pytest.approx(127.5)
+    # unobserved pair: detour × haversine
+    assert d[1] == pytest.approx(1.3 * haversine_m(LAT[0], LON[0], LAT[2], LON[2]))
+    assert d[2] == 0 and t[2] == 0
+    # without parameters nothing is imputed
+    assert np.isnan(_matrix().lookup(["a"], ["c"], impute=True)[0][0])